@@ -1,6 +1,54 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.db import transaction
+
 from .models import Users, Contacts, Shops, Categories, Products, ProductsInfo, Parameters, \
-    ProductParameter, Orders, OrderItems, ConfirmEmailToken
+    ProductParameter, Orders, OrderItems, ShopOrders, ConfirmEmailToken, ImportJobs
+from .tasks import do_import
+from .exporter import export_response
+from .changes import log_changes, log_offers_changes
+from .cache import bump_catalog_version
+from .basket import update_order_totals, update_shop_orders
+from .reservations import cancel_order
+
+
+def group_by_shop(rows):
+    shops = {}
+    for shop_id, info_id in rows:
+        shops.setdefault(shop_id, []).append(info_id)
+    return shops
+
+
+class CatalogAdmin(admin.ModelAdmin):
+    """
+    Правки магазинов, категорий, товаров и параметров записывают затронутые предложения в журнал изменений
+    и меняют общую версию каталога и версии их магазинов, кэш ответов сбрасывается
+    """
+    # путь от предложения к объекту модели
+    offers_lookup = None
+    # поля, которые видны в выдаче предложений; None - все поля
+    offer_fields = None
+    # как записывается в журнал удаление объекта: вместе с ним удаляются его предложения
+    delete_action = 'delete'
+
+    def offers(self, queryset):
+        return ProductsInfo.objects.filter(**{f'{self.offers_lookup}__in': queryset}).distinct()
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and self.offer_fields is not None and not set(self.offer_fields) & set(form.changed_data):
+            bump_catalog_version()
+        else:
+            log_offers_changes(self.offers(type(obj).objects.filter(pk=obj.pk)))
+
+    def delete_model(self, request, obj):
+        # после удаления предложений объекта уже нет, поэтому они записываются заранее
+        log_offers_changes(self.offers(type(obj).objects.filter(pk=obj.pk)), self.delete_action)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        log_offers_changes(self.offers(queryset), self.delete_action)
+        super().delete_queryset(request, queryset)
 
 
 class UsersAdmin(admin.ModelAdmin):
@@ -11,36 +59,147 @@ class ContactsAdmin(admin.ModelAdmin):
     list_display = ('id', 'user_id_id', 'city', 'street', 'build', 'corpus', 'apartment', 'phone')
 
 
-class ShopsAdmin(admin.ModelAdmin):
+class ShopsAdmin(CatalogAdmin):
     list_display = ('id', 'user_id_id', 'name', 'status_work', 'url_shop')
-
-
-class CategoriesAdmin(admin.ModelAdmin):
+    actions = ('run_import', 'export_yaml')
+    offers_lookup = 'shop_id'
+    # название и ссылка магазина в выдачу предложений не входят
+    offer_fields = ('status_work',)
+
+    @admin.action(description='Загрузить прайс по ссылке магазина')
+    def run_import(self, request, queryset):
+        jobs = []
+        for shop in queryset.exclude(url_shop='').exclude(user_id=None):
+            jobs.append(ImportJobs.objects.create(user_id_id=shop.user_id_id, url=shop.url_shop))
+        transaction.on_commit(lambda: [do_import.delay(job.id) for job in jobs])
+        self.message_user(request, f'Запущено задач импорта: {len(jobs)}', messages.SUCCESS)
+
+    @admin.action(description='Выгрузить прайс магазина в YAML')
+    def export_yaml(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, 'Для выгрузки выберите один магазин', messages.ERROR)
+            return None
+        return export_response(queryset.get(), 'yaml')
+
+
+class CategoriesAdmin(CatalogAdmin):
     list_display = ('id', 'name')
+    offers_lookup = 'product_id__category_id'
 
 
-class ProductsAdmin(admin.ModelAdmin):
+class ProductsAdmin(CatalogAdmin):
     list_display = ('id', 'category_id_id', 'name')
+    offers_lookup = 'product_id'
 
 
 class ProductsInfoAdmin(admin.ModelAdmin):
     list_display = ('id', 'shop_id_id', 'product_id_id', 'external_id', 'quantity', 'price', 'price_rrc')
 
+    # правки из админки тоже попадают в журнал изменений каталога
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        log_changes(obj.shop_id_id, [obj.id])
+
+    def delete_model(self, request, obj):
+        info_id = obj.id
+        super().delete_model(request, obj)
+        log_changes(obj.shop_id_id, [info_id], 'delete')
+
+    def delete_queryset(self, request, queryset):
+        offers = group_by_shop(queryset.values_list('shop_id', 'id'))
+        super().delete_queryset(request, queryset)
+        for shop_id, info_ids in offers.items():
+            log_changes(shop_id, info_ids, 'delete')
+
 
-class ParametersAdmin(admin.ModelAdmin):
+class ParametersAdmin(CatalogAdmin):
     list_display = ('id', 'name')
+    offers_lookup = 'product_parameters__parameter_id'
+    # удаление параметра меняет его предложения, но не удаляет их
+    delete_action = 'upsert'
 
 
 class ProductParameterAdmin(admin.ModelAdmin):
     list_display = ('id', 'parameter_id_id', 'value', 'product_info_id_id')
 
+    # изменение параметра - это изменение его предложения
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        log_changes(obj.product_info_id.shop_id_id, [obj.product_info_id_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        log_changes(obj.product_info_id.shop_id_id, [obj.product_info_id_id])
+
+    def delete_queryset(self, request, queryset):
+        offers = group_by_shop(queryset.values_list('product_info_id__shop_id', 'product_info_id').distinct())
+        super().delete_queryset(request, queryset)
+        for shop_id, info_ids in offers.items():
+            log_changes(shop_id, info_ids)
+
 
 class OrderItemsAdmin(admin.ModelAdmin):
-    list_display = ('id', 'order_id_id', 'product_info_id_id', 'quantity')
+    list_display = ('id', 'order_id_id', 'product_info_id_id', 'quantity', 'price')
+
+    # итоги заказа хранятся в Orders и в его частях по магазинам и пересчитываются после правки позиций
+    def update_totals(self, order_ids):
+        update_order_totals(order_ids)
+        update_shop_orders(order_ids)
+
+    def save_model(self, request, obj, form, change):
+        order_ids = [obj.order_id_id]
+        # позицию перенесли в другой заказ - пересчитывается и прежний
+        if change and 'order_id' in form.changed_data:
+            order_ids.append(form.initial['order_id'])
+        super().save_model(request, obj, form, change)
+        self.update_totals(order_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.update_totals([obj.order_id_id])
+
+    def delete_queryset(self, request, queryset):
+        order_ids = list(queryset.values_list('order_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        self.update_totals(order_ids)
+
+
+class OrdersForm(forms.ModelForm):
+
+    class Meta:
+        model = Orders
+        fields = '__all__'
+
+    def clean_status(self):
+        # товар отменённого заказа уже вернулся на склад, повторно он не резервируется
+        status = self.cleaned_data['status']
+        if self.instance.pk and self.instance.status == 'canceled' and status != 'canceled':
+            raise forms.ValidationError('Отменённый заказ нельзя вернуть в работу')
+        return status
 
 
 class OrdersAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user_id_id', 'status', 'date', 'contact_id')
+    form = OrdersForm
+    list_display = ('id', 'user_id_id', 'status', 'date', 'contact_id', 'total_sum', 'items_count', 'reserved_until')
+
+    # отмена заказа возвращает товар на склад, статус заказа переходит к его частям по магазинам
+    def save_model(self, request, obj, form, change):
+        if change and 'status' in form.changed_data and obj.status == 'canceled':
+            if cancel_order(obj.id):
+                obj.reserved_until, obj.stock_reserved = None, False
+        super().save_model(request, obj, form, change)
+        if change and 'status' in form.changed_data:
+            ShopOrders.objects.filter(order_id=obj.id).update(status=obj.status)
+
+
+class ShopOrdersAdmin(admin.ModelAdmin):
+    list_display = ('id', 'order_id_id', 'shop_id_id', 'status', 'date', 'total_sum', 'items_count')
+    list_filter = ('status',)
+
+
+class ImportJobsAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user_id_id', 'url', 'diff', 'phase', 'rows_processed', 'created_at', 'finished_at')
+    list_filter = ('phase',)
 
 
 admin.site.register(Users, UsersAdmin)
@@ -54,4 +213,6 @@ admin.site.register(Parameters, ParametersAdmin)
 admin.site.register(ProductParameter, ProductParameterAdmin)
 admin.site.register(Orders, OrdersAdmin)
 admin.site.register(OrderItems, OrderItemsAdmin)
+admin.site.register(ShopOrders, ShopOrdersAdmin)
+admin.site.register(ImportJobs, ImportJobsAdmin)
 admin.site.register(ConfirmEmailToken)
@@ -0,0 +1,165 @@
+"""
+Корзина покупателя: массовое добавление позиций и итоги заказов.
+
+Все товары из запроса проверяются одним запросом: предложение существует, его магазин принимает заказы и остатка
+хватает с учётом того, что уже лежит в корзине. Затем позиции записываются одним INSERT ... ON CONFLICT на пачку
+(SQLite и PostgreSQL): новые создаются, у имеющихся количество увеличивается. Ответ - результат по каждой строке.
+
+Позиция хранит цену предложения, а заказ - сумму и число позиций (Orders.total_sum, items_count). Их пересчитывает
+update_order_totals в той же транзакции, что и изменение корзины, а при оформлении заказа цены позиций
+обновляются последний раз (snapshot_prices) и дальше не меняются, даже если поставщик загрузит новый прайс.
+Тогда же заказ делится на части по поставщикам (create_shop_orders) - по одной поставке на магазин, а после
+правки позиций оформленного заказа в админке части пересчитываются (update_shop_orders).
+"""
+from django.db import connection
+from django.db.models import OuterRef, Subquery, Sum, Count, F, Value, PositiveBigIntegerField
+from django.db.models.functions import Coalesce
+
+from .models import Orders, OrderItems, ProductsInfo, ShopOrders
+
+UPSERT_BATCH_SIZE = 1000
+
+
+def parse_item(item):
+    """
+    (id предложения, количество) из строки запроса или ValueError
+    """
+    try:
+        info_id, quantity = int(item['product_info_id']), int(item['quantity'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Нужны product_info_id и quantity')
+    if info_id <= 0 or quantity <= 0:
+        raise ValueError('product_info_id и quantity должны быть положительными')
+    return info_id, quantity
+
+
+def upsert_items(order_id, lines):
+    """
+    Добавляет к заказу order_id позиции {id предложения: (количество, цена)}: к количеству уже имеющихся
+    позиций прибавляется новое, цена заменяется текущей
+    """
+    quote = connection.ops.quote_name
+    table = quote(OrderItems._meta.db_table)
+    order, info, quantity, price = (quote(OrderItems._meta.get_field(name).column)
+                                    for name in ('order_id', 'product_info_id', 'quantity', 'price'))
+    rows = list(lines.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({order}, {info}, {quantity}, {price}) VALUES '
+                + ', '.join(['(%s, %s, %s, %s)'] * len(batch))
+                + f' ON CONFLICT ({order}, {info}) DO UPDATE SET'
+                  f' {quantity} = {table}.{quantity} + excluded.{quantity}, {price} = excluded.{price}',
+                [value for info_id, line in batch for value in (order_id, info_id, *line)])
+
+
+def update_order_totals(order_ids):
+    """
+    Пересчитывает total_sum и items_count заказов order_ids по их позициям одним UPDATE
+    """
+    items = OrderItems.objects.filter(order_id=OuterRef('id')).order_by().values('order_id')
+    return Orders.objects.filter(id__in=order_ids).update(
+        total_sum=Coalesce(Subquery(items.annotate(total=Sum(F('quantity') * F('price'))).values('total')),
+                           Value(0), output_field=PositiveBigIntegerField()),
+        items_count=Coalesce(Subquery(items.annotate(count=Count('id')).values('count')), Value(0)))
+
+
+def snapshot_prices(order_id):
+    """
+    Записывает в позиции заказа текущие цены предложений и пересчитывает итоги - при оформлении заказа
+    """
+    OrderItems.objects.filter(order_id=order_id).update(
+        price=Subquery(ProductsInfo.objects.filter(id=OuterRef('product_info_id')).values('price')[:1]))
+    update_order_totals([order_id])
+
+
+def shop_totals(order_ids):
+    """
+    Сумма и число позиций заказов order_ids по магазинам
+    """
+    return OrderItems.objects.filter(order_id__in=order_ids).order_by().values(
+        'order_id', 'product_info_id__shop_id', 'order_id__status', 'order_id__date').annotate(
+        total=Sum(F('quantity') * F('price')), count=Count('id'))
+
+
+def new_shop_order(row):
+    return ShopOrders(order_id_id=row['order_id'], shop_id_id=row['product_info_id__shop_id'],
+                      status=row['order_id__status'], date=row['order_id__date'], total_sum=row['total'],
+                      items_count=row['count'])
+
+
+def create_shop_orders(order_ids):
+    """
+    Части заказов order_ids по магазинам их позиций с суммой и числом позиций каждого магазина
+    """
+    return ShopOrders.objects.bulk_create([new_shop_order(row) for row in shop_totals(order_ids)])
+
+
+def update_shop_orders(order_ids):
+    """
+    Пересчитывает части оформленных заказов из order_ids по их позициям: у имеющихся частей обновляются
+    сумма и число позиций (статус, который мог поменять магазин, сохраняется), для новых магазинов части
+    создаются, части без позиций удаляются. Корзины частей не имеют и пропускаются
+    """
+    placed = list(Orders.objects.filter(id__in=order_ids).exclude(status='basket').values_list('id', flat=True))
+    rows = {(row['order_id'], row['product_info_id__shop_id']): row for row in shop_totals(placed)}
+    changed, empty = [], []
+    for shop_order in ShopOrders.objects.filter(order_id__in=placed):
+        row = rows.pop((shop_order.order_id_id, shop_order.shop_id_id), None)
+        if row is None:
+            empty.append(shop_order.id)
+        elif (shop_order.total_sum, shop_order.items_count) != (row['total'], row['count']):
+            shop_order.total_sum, shop_order.items_count = row['total'], row['count']
+            changed.append(shop_order)
+    ShopOrders.objects.filter(id__in=empty).delete()
+    ShopOrders.objects.bulk_update(changed, ['total_sum', 'items_count'])
+    ShopOrders.objects.bulk_create([new_shop_order(row) for row in rows.values()])
+
+
+def add_items(basket, items):
+    """
+    Добавляет в корзину basket строки items ([{'product_info_id': ..., 'quantity': ...}]), повторы одного товара
+    складываются. Неправильные строки пропускаются, остальные записываются.
+    Возвращает (создано позиций, обновлено позиций, результаты по строкам в порядке items)
+    """
+    results, wanted = [], {}
+    for item in items:
+        try:
+            info_id, quantity = parse_item(item)
+        except ValueError as error:
+            results.append({'Status': False, 'Errors': str(error)})
+            continue
+        results.append({'product_info_id': info_id, 'quantity': quantity})
+        wanted[info_id] = wanted.get(info_id, 0) + quantity
+
+    in_basket = OrderItems.objects.filter(order_id=basket.id, product_info_id=OuterRef('id')).values('quantity')
+    offers = {info_id: (stock, status_work, ordered or 0, price) for info_id, stock, status_work, ordered, price in
+              ProductsInfo.objects.filter(id__in=wanted).annotate(ordered=Subquery(in_basket)).values_list(
+                  'id', 'quantity', 'shop_id__status_work', 'ordered', 'price')}
+
+    errors = {}
+    for info_id, quantity in wanted.items():
+        if info_id not in offers:
+            errors[info_id] = 'Товар не найден'
+            continue
+        stock, status_work, ordered, _ = offers[info_id]
+        if not status_work:
+            errors[info_id] = 'Магазин не принимает заказы'
+        elif ordered + quantity > stock:
+            errors[info_id] = f'Недостаточно товара, можно добавить {max(stock - ordered, 0)}'
+
+    accepted = {info_id: (quantity, offers[info_id][3]) for info_id, quantity in wanted.items()
+                if info_id not in errors}
+    if accepted:
+        upsert_items(basket.id, accepted)
+        update_order_totals([basket.id])
+
+    for result in results:
+        if 'product_info_id' in result:
+            error = errors.get(result['product_info_id'])
+            result['Status'] = error is None
+            if error:
+                result['Errors'] = error
+    created = sum(1 for info_id in accepted if not offers[info_id][2])
+    return created, len(accepted) - created, results
@@ -0,0 +1,180 @@
+"""
+Бенчмарки импорта прайсов и сериализации ответов.
+
+Генератор синтетических прайсов по схеме data/shop1.yaml и замер импорта: время, число SQL-запросов,
+пиковый RSS процесса и скорость в товарах в секунду. Для ответов - сравнение сериализаторов DRF
+с fast_serializers на одних и тех же данных.
+"""
+import json
+import resource
+import sys
+from contextlib import contextmanager
+from random import Random
+from time import perf_counter
+
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+from .basket import update_order_totals, create_shop_orders
+from .fast_serializers import serialize_offers, serialize_orders, ORDER
+from .importer import import_price
+from .models import Contacts, Orders, OrderItems, ProductsInfo
+from .serializers import ProductInfoSerializer, OrdersSerializer
+
+COLORS = ('черный', 'белый', 'красный', 'синий', 'золотистый', 'серебристый')
+
+
+def generate_price_list(file, goods, categories=10, parameters=4, shop='Тестовый магазин', seed=0, price_shift=0):
+    """
+    Пишет в file (бинарный) прайс из goods товаров с categories категориями и parameters параметрами у товара.
+    price_shift меняет цену каждого десятого товара - так получается "следующая версия" прайса для режима diff
+    """
+    random = Random(seed)
+    write = file.write
+    write(f'shop: {shop}\ncategories:\n'.encode())
+    for category_id in range(1, categories + 1):
+        write(f'  - id: {category_id}\n    name: Категория {category_id}\n'.encode())
+    write(b'goods:\n')
+    for external_id in range(1, goods + 1):
+        price = random.randint(100, 200000)
+        if price_shift and external_id % 10 == 0:
+            price += price_shift
+        lines = [f'  - id: {external_id}',
+                 f'    category: {external_id % categories + 1}',
+                 f'    model: model/{external_id % 1000}',
+                 f'    name: Товар {external_id}',
+                 f'    price: {price}',
+                 f'    price_rrc: {price + random.randint(0, 10000)}',
+                 f'    quantity: {random.randint(0, 50)}',
+                 '    parameters:']
+        for index in range(parameters):
+            value = COLORS[random.randrange(len(COLORS))] if index % 2 else round(random.uniform(1, 100), 1)
+            lines.append(f'      "Параметр {index + 1}": {value}')
+        write(('\n'.join(lines) + '\n').encode())
+
+
+def peak_rss_mb():
+    """
+    Пиковый RSS процесса в мегабайтах (ru_maxrss в Linux - килобайты, в macOS - байты)
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+@contextmanager
+def count_queries():
+    """
+    Счётчик запросов без сохранения их текста (CaptureQueriesContext на миллионе строк сам съел бы память)
+    """
+    counter = {'queries': 0}
+
+    def wrapper(execute, sql, params, many, context):
+        counter['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield counter
+
+
+def run_import_benchmark(user, path, goods, diff=False):
+    """
+    Импортирует прайс из файла path и возвращает замеры
+    """
+    with open(path, 'rb') as file, count_queries() as counter:
+        started = perf_counter()
+        importer = import_price(user, file, diff=diff)
+        seconds = perf_counter() - started
+    return {
+        'goods': goods,
+        'mode': 'diff' if diff else 'full',
+        'seconds': round(seconds, 3),
+        'queries': counter['queries'],
+        'peak_rss_mb': peak_rss_mb(),
+        'rows_per_second': round(importer.rows_processed / seconds, 1) if seconds else None,
+    }
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Сравнение с сохранёнными результатами: список регрессий, где время или число запросов выросли больше
+    чем на threshold (доля)
+    """
+    previous = {(item['goods'], item['mode']): item for item in baseline['results']}
+    regressions = []
+    for item in results['results']:
+        old = previous.get((item['goods'], item['mode']))
+        if not old:
+            continue
+        for metric in ('seconds', 'queries'):
+            if old[metric] and item[metric] > old[metric] * (1 + threshold):
+                regressions.append(f"{item['goods']} {item['mode']}: {metric} {old[metric]} -> {item[metric]}")
+    return regressions
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+def create_orders(user, count, items=3):
+    """
+    count заказов пользователя user по items первых предложений каталога в каждом
+    """
+    contact = Contacts.objects.create(user_id=user, city='Москва', street='Тверская', build='1', phone='+70000000000')
+    offers = list(ProductsInfo.objects.order_by('id').values_list('id', 'price')[:items])
+    Orders.objects.bulk_create(Orders(user_id=user, status='new', contact=contact) for _ in range(count))
+    # bulk_create в SQLite не возвращает id созданных строк
+    order_ids = list(Orders.objects.filter(user_id=user).values_list('id', flat=True))
+    OrderItems.objects.bulk_create(OrderItems(order_id_id=order_id, product_info_id_id=info_id, quantity=index + 1,
+                                              price=price)
+                                   for order_id in order_ids for index, (info_id, price) in enumerate(offers))
+    update_order_totals(order_ids)
+    create_shop_orders(order_ids)
+
+
+def best_time(function, repeat):
+    """
+    Лучшее время из repeat вызовов function и результат последнего вызова
+    """
+    seconds = []
+    for _ in range(repeat):
+        started = perf_counter()
+        result = function()
+        seconds.append(perf_counter() - started)
+    return min(seconds), result
+
+
+def run_serialization_benchmark(repeat=3):
+    """
+    Сериализация и рендеринг в JSON всех предложений и заказов базы: сериализаторы DRF с запросами,
+    как были в представлениях, против fast_serializers. identical - совпадают ли ответы байт в байт
+    """
+    render = JSONRenderer().render
+    cases = {
+        'offers': (
+            lambda: ProductInfoSerializer(ProductsInfo.objects.select_related(
+                'shop_id', 'product_id__category_id').prefetch_related(
+                'product_parameters__parameter_id').order_by('id'), many=True).data,
+            lambda: serialize_offers(ProductsInfo.objects.order_by('id')),
+        ),
+        'orders': (
+            lambda: OrdersSerializer(Orders.objects.select_related('contact').prefetch_related(
+                'ordered_items__product_info_id__product_id__category_id',
+                'ordered_items__product_info_id__product_parameters__parameter_id'), many=True).data,
+            # части по магазинам в OrdersSerializer не входят
+            lambda: serialize_orders(Orders.objects.all(), frozenset(ORDER) - {'shops'}),
+        ),
+    }
+    results = []
+    for case, (drf, fast) in cases.items():
+        drf_seconds, drf_content = best_time(lambda: render(drf()), repeat)
+        fast_seconds, fast_content = best_time(lambda: render(fast()), repeat)
+        results.append({
+            'case': case,
+            'rows': len(json.loads(fast_content)),
+            'drf_seconds': round(drf_seconds, 3),
+            'fast_seconds': round(fast_seconds, 3),
+            'speedup': round(drf_seconds / fast_seconds, 1) if fast_seconds else None,
+            'identical': drf_content == fast_content,
+        })
+    return results
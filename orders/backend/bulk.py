@@ -0,0 +1,42 @@
+"""
+Массовые изменения строк запросами, число которых не зависит от числа строк.
+
+Представления передают сюда queryset, уже ограниченный владельцем (корзиной, пользователем), поэтому чужие id
+из запроса просто не находятся.
+"""
+from django.db.models import Case, When, Value
+
+BULK_UPDATE_BATCH_SIZE = 500
+
+
+def parse_ids(values):
+    """
+    Список id из списка или строки через запятую; ValueError, если id не целые
+    """
+    if isinstance(values, str):
+        values = values.split(',')
+    if not isinstance(values, (list, tuple)):
+        raise ValueError(values)
+    return [int(value) for value in values]
+
+
+def update_values(queryset, field, values):
+    """
+    Присваивает полю field строк queryset значения {id: значение} одним UPDATE ... CASE на пачку
+    из BULK_UPDATE_BATCH_SIZE строк. Возвращает число обновлённых строк
+    """
+    output_field = queryset.model._meta.get_field(field)
+    items = list(values.items())
+    updated = 0
+    for start in range(0, len(items), BULK_UPDATE_BATCH_SIZE):
+        batch = dict(items[start:start + BULK_UPDATE_BATCH_SIZE])
+        updated += queryset.filter(id__in=batch).update(**{field: Case(
+            *(When(id=pk, then=Value(value)) for pk, value in batch.items()), output_field=output_field)})
+    return updated
+
+
+def delete_ids(queryset, ids):
+    """
+    Удаляет строки queryset с id из ids, возвращает число удалённых строк queryset
+    """
+    return queryset.filter(id__in=ids).delete()[1].get(queryset.model._meta.label, 0)
@@ -0,0 +1,115 @@
+"""
+Кэш ответов каталога с версиями.
+
+Каталог меняется только при импорте прайса, переключении status_work и правках из админки. Каждое такое
+изменение увеличивает версию каталога (общую и магазина) после фиксации транзакции, а версия входит
+в ключ кэша ответа. Поэтому ответы не нужно удалять из кэша: после изменения каталога они просто перестают
+запрашиваться и вытесняются по таймауту.
+
+Та же версия даёт ETag ответа, а время её изменения - Last-Modified, поэтому повторный запрос клиента
+с If-None-Match или If-Modified-Since получает 304 Not Modified без обращения к кэшу ответов и к базе.
+"""
+from functools import partial, wraps
+from hashlib import sha1
+from time import time_ns
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import urlencode, http_date
+
+# версия хранится без срока, а начальное значение - время в наносекундах: если версию вытеснили из кэша,
+# новая всё равно не совпадёт ни с одной из прежних
+CATALOG_VERSION_KEY = 'catalog:version'
+RESPONSE_TIMEOUT = 60 * 60
+
+
+def shop_version_key(shop_id):
+    return f'{CATALOG_VERSION_KEY}:shop:{shop_id}'
+
+
+def get_catalog_version(shop_id=None):
+    """
+    Общая версия каталога или, если указан shop_id, версия предложений магазина
+    """
+    key = CATALOG_VERSION_KEY if shop_id is None else shop_version_key(shop_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_catalog_version(shop_ids):
+    keys = [CATALOG_VERSION_KEY] + [shop_version_key(shop_id) for shop_id in shop_ids]
+    # Last-Modified - версия с точностью до секунды, поэтому новая версия попадает хотя бы в следующую секунду
+    # после прежней: иначе клиент с If-Modified-Since получил бы 304 на изменённый каталог
+    version = max([time_ns()] + [(previous // 10 ** 9 + 1) * 10 ** 9 for previous in cache.get_many(keys).values()])
+    cache.set_many(dict.fromkeys(keys, version), None)
+
+
+def bump_catalog_version(*shop_ids):
+    """
+    Увеличивает общую версию каталога и версии магазинов shop_ids.
+    Версия меняется после фиксации транзакции: иначе параллельный запрос мог бы закэшировать старые данные
+    под новой версией
+    """
+    transaction.on_commit(partial(_bump_catalog_version, shop_ids))
+
+
+def request_digest(request):
+    params = urlencode(sorted(request.query_params.lists()), doseq=True)
+    return sha1(f'{request.get_host()}{request.path}?{params}'.encode()).hexdigest()
+
+
+def response_cache_key(version, digest):
+    return f'catalog:response:{version}:{digest}'
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def cache_catalog_response(shop_param=None):
+    """
+    Декоратор get() представлений каталога: готовый JSON отдаётся из кэша без обращения к базе.
+    Если в запросе есть фильтр shop_param, ключ строится по версии магазина, иначе по общей версии
+    (в том числе для фильтра по категории - отдельной версии у категорий нет).
+    ETag - версия и хэш запроса, Last-Modified - время версии; если клиент прислал их же, ответ 304.
+    Кэшируются только успешные ответы в JSON, остальные форматы (Browsable API) строятся как обычно
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.accepted_renderer.format != 'json':
+                return method(view, request, *args, **kwargs)
+
+            shop_id = request.query_params.get(shop_param) if shop_param else None
+            if shop_id is not None and not shop_id.isdigit():
+                shop_id = None
+            version = get_catalog_version(shop_id and int(shop_id))
+            digest = request_digest(request)
+            # версия - время изменения каталога в наносекундах
+            etag, last_modified = f'"{version}-{digest[:16]}"', version // 10 ** 9
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return set_validators(not_modified, etag, last_modified)
+
+            key = response_cache_key(version, digest)
+            content = cache.get(key)
+            if content is not None:
+                return set_validators(HttpResponse(content, content_type=request.accepted_media_type),
+                                      etag, last_modified)
+
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                set_validators(response, etag, last_modified)
+                if hasattr(response, 'add_post_render_callback'):
+                    response.add_post_render_callback(
+                        lambda rendered: cache.set(key, rendered.content, RESPONSE_TIMEOUT))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,257 @@
+"""
+Каталог в памяти процесса для выдачи products без SQL.
+
+Предложения работающих магазинов хранятся столбцами в array (id, магазин, категория, цена, остаток),
+к ним - списки позиций (posting lists) по магазину, категории и значению параметра, а JSON каждого предложения
+закодирован заранее в один буфер. Фильтр перебирает самый короткий из подходящих списков в нужном порядке
+и останавливается, набрав страницу, поэтому запрос не зависит от размера каталога.
+
+Индекс привязан к версии каталога (cache.get_catalog_version). Когда версия меняется, новый индекс строится
+в фоновом потоке и подменяет старый одним присваиванием, а до этого запросы идут в базу.
+Включается настройкой CATALOG_INDEX.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import Lock, Thread
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import get_catalog_version
+from .importer import chunks
+from .fast_serializers import OFFER_FIELDS, PARAMETER_FIELDS, map_offer, map_parameter
+from .models import ProductsInfo, ProductParameter
+from .renderers import dumps
+
+BUILD_BATCH_SIZE = 2000
+# строить индекс в фоновом потоке; в тестах индекс строится сразу
+BACKGROUND_BUILD = True
+
+_index = None
+_build_lock = Lock()
+
+
+def contains(posting, position):
+    index = bisect_left(posting, position)
+    return index < len(posting) and posting[index] == position
+
+
+class CatalogIndex:
+    """
+    Неизменяемый снимок каталога версии version
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.ids = array('q')
+        self.shops = array('q')
+        self.categories = array('q')
+        self.prices = array('q')
+        self.quantities = array('q')
+        # списки позиций, возрастают вместе с id
+        self.by_shop = {}
+        self.by_category = {}
+        self.by_parameter = {}
+        # по названию параметра: (числовые значения по возрастанию, позиции в том же порядке)
+        self.by_number = {}
+        # позиции в порядке (столбец, id) для упорядочиваний по цене и остатку: всех предложений
+        # и, по мере запросов, списков позиций
+        self.sorted_by = {}
+        self.sorted_orders = {}
+        # JSON предложения position - self.json[offsets[position]:offsets[position + 1]]
+        self.json = b''
+        self.offsets = array('q', [0])
+
+    @classmethod
+    def build(cls, version):
+        index = cls(version)
+        buffer = bytearray()
+        number_values = {}
+
+        rows = ProductsInfo.objects.filter(shop_id__status_work=True).order_by('id').values(*OFFER_FIELDS).iterator(
+            chunk_size=BUILD_BATCH_SIZE)
+        for batch in chunks(rows, BUILD_BATCH_SIZE):
+            parameters, numbers = {}, {}
+            for row in ProductParameter.objects.filter(
+                    product_info_id__in=[row['id'] for row in batch]).order_by('product_info_id', 'id').values(
+                    *PARAMETER_FIELDS, 'numeric_value'):
+                parameters.setdefault(row['product_info_id'], []).append(row)
+                if row['numeric_value'] is not None:
+                    numbers.setdefault(row['product_info_id'], []).append((row['parameter_id__name'],
+                                                                           row['numeric_value']))
+
+            for row in batch:
+                position = len(index.ids)
+                info_id, shop_id, category_id = row['id'], row['shop_id'], row['product_id__category_id']
+                index.ids.append(info_id)
+                index.shops.append(shop_id)
+                index.categories.append(category_id)
+                index.prices.append(row['price'])
+                index.quantities.append(row['quantity'])
+                index.by_shop.setdefault(shop_id, array('l')).append(position)
+                index.by_category.setdefault(category_id, array('l')).append(position)
+                offer_parameters = parameters.get(info_id, [])
+                for parameter in offer_parameters:
+                    index.by_parameter.setdefault((parameter['parameter_id__name'], parameter['value']),
+                                                  array('l')).append(position)
+                for name, numeric_value in numbers.get(info_id, []):
+                    number_values.setdefault(name, []).append((numeric_value, position))
+
+                row['product_parameters'] = [map_parameter(parameter) for parameter in offer_parameters]
+                buffer += dumps(map_offer(row))
+                index.offsets.append(len(buffer))
+
+        # сортировка устойчива, а позиции идут по возрастанию id - одинаковые значения остаются упорядочены по id
+        for column, values in (('price', index.prices), ('quantity', index.quantities)):
+            index.sorted_by[column] = array('l', sorted(range(len(index.ids)), key=values.__getitem__))
+        for name, values in number_values.items():
+            values.sort()
+            index.by_number[name] = (array('d', [value for value, _ in values]),
+                                     array('l', [position for _, position in values]))
+        index.json = bytes(buffer)
+        return index
+
+    def select(self, filters, fields, position, page_size):
+        """
+        Страница позиций по фильтрам (filters.parse_filters) после курсора position в порядке fields
+        (KeysetPagination.orderings). Возвращает (позиции, позиция для следующего курсора или None)
+        """
+        range_postings = [self.number_range(*condition) for condition in filters['ranges']]
+        parameter_postings = [self.by_parameter.get(condition, ()) for condition in filters['parameters']]
+        parameter_postings += range_postings
+        postings = list(parameter_postings)
+        if filters['shop_id'] is not None:
+            postings.append(self.by_shop.get(filters['shop_id'], ()))
+        if filters['category_id'] is not None:
+            postings.append(self.by_category.get(filters['category_id'], ()))
+        source = min(postings, key=len) if postings else None
+
+        column = fields[0].lstrip('-')
+        if column != 'id':
+            values = self.columns()[column]
+            if source is None:
+                order = self.sorted_by[column]
+            elif any(source is posting for posting in range_postings):
+                # списки диапазонов строятся на запрос, их порядок не кэшируется
+                order = array('l', sorted(source, key=values.__getitem__))
+            else:
+                order = self.sorted_order(column, source)
+            ids = self.ids
+
+            def key(item):
+                return values[item], ids[item]
+        else:
+            order = source if source is not None else range(len(self.ids))
+            ids = self.ids
+
+            def key(item):
+                return (ids[item],)
+
+        descending = fields[0].startswith('-')
+        if descending:
+            start = len(order) - 1 if position is None else bisect_left(order, tuple(position), key=key) - 1
+            indices = range(start, -1, -1)
+        else:
+            start = 0 if position is None else bisect_right(order, tuple(position), key=key)
+            indices = range(start, len(order))
+
+        # магазин и категория проверяются по столбцам, значения параметров - поиском в их списках
+        matches = self.matcher(filters, [posting for posting in parameter_postings if posting is not source])
+        page = []
+        for index in indices:
+            item = order[index]
+            if matches(item):
+                page.append(item)
+                if len(page) > page_size:
+                    page.pop()
+                    return page, list(key(page[-1]))
+        return page, None
+
+    def number_range(self, name, low, high):
+        """
+        Позиции предложений, у которых числовое значение параметра name в диапазоне, по возрастанию
+        """
+        values, positions = self.by_number.get(name, ((), ()))
+        start = 0 if low is None else bisect_left(values, low)
+        end = len(values) if high is None else bisect_right(values, high)
+        return array('l', sorted(positions[start:end]))
+
+    def columns(self):
+        return {'price': self.prices, 'quantity': self.quantities}
+
+    def sorted_order(self, column, posting):
+        """
+        Список позиций в порядке (column, id), сортируется при первом запросе и дальше берётся готовым.
+        Ключ кэша - id() списка, поэтому сюда попадают только списки, живущие вместе с индексом
+        """
+        key = column, id(posting)
+        order = self.sorted_orders.get(key)
+        if order is None:
+            order = self.sorted_orders[key] = array('l', sorted(posting, key=self.columns()[column].__getitem__))
+        return order
+
+    def matcher(self, filters, postings):
+        shops, categories, prices, quantities = self.shops, self.categories, self.prices, self.quantities
+        shop_id, category_id = filters['shop_id'], filters['category_id']
+        price_min, price_max, in_stock = filters['price_min'], filters['price_max'], filters['in_stock']
+
+        def matches(item):
+            if shop_id is not None and shops[item] != shop_id:
+                return False
+            if category_id is not None and categories[item] != category_id:
+                return False
+            if price_min is not None and prices[item] < price_min:
+                return False
+            if price_max is not None and prices[item] > price_max:
+                return False
+            if in_stock and not quantities[item]:
+                return False
+            return all(contains(posting, item) for posting in postings)
+        return matches
+
+    def render_page(self, page, next_link):
+        """
+        Тело ответа страницы, совпадает с ответом KeysetPagination.get_paginated_response
+        """
+        data, offsets = memoryview(self.json), self.offsets
+        results = b','.join(data[offsets[item]:offsets[item + 1]] for item in page)
+        return b'{"next":' + dumps(next_link) + b',"results":[' + results + b']}'
+
+
+def build_catalog_index(version):
+    """
+    Строит индекс версии version и подменяет им текущий; параллельно строится не больше одного индекса
+    """
+    global _index
+    if not _build_lock.acquire(blocking=False):
+        return
+    try:
+        if _index is None or _index.version != version:
+            _index = CatalogIndex.build(version)
+    finally:
+        _build_lock.release()
+
+
+def _build_in_background(version):
+    try:
+        build_catalog_index(version)
+    finally:
+        connection.close()
+
+
+def get_catalog_index():
+    """
+    Индекс текущей версии каталога или None, если индекс выключен или ещё строится
+    """
+    if not getattr(settings, 'CATALOG_INDEX', False):
+        return None
+    version = get_catalog_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    if BACKGROUND_BUILD:
+        if not _build_lock.locked():
+            Thread(target=_build_in_background, args=(version,), daemon=True).start()
+        return None
+    build_catalog_index(version)
+    return _index
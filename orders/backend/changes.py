@@ -0,0 +1,100 @@
+"""
+Журнал изменений каталога для дельта-синхронизации.
+
+Каждое добавление, изменение и удаление предложения (ProductsInfo) или его параметров записывается в CatalogChanges
+с возрастающей версией. Клиент хранит последнюю полученную версию и запрашивает products/changes?since=<версия>,
+получая только изменившиеся с тех пор предложения.
+"""
+from django.db import connection
+from django.db.models import CharField, DateTimeField, Value
+from django.utils import timezone
+
+from .models import CatalogChanges, ProductsInfo
+from .cache import bump_catalog_version
+from .fast_serializers import serialize_offers
+
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_PAGE_SIZE = 1000
+
+
+def lock_changes():
+    """
+    В PostgreSQL номер версии выдаётся до фиксации транзакции, и без блокировки клиент мог бы прочитать версию 11
+    раньше, чем зафиксируется 10, и потерять её. Блокировка журнала до конца транзакции выстраивает записи
+    в порядке фиксации (чтение не блокируется), поэтому журнал пишется в конце транзакции импорта.
+    В SQLite пишущие транзакции и так идут по одной
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {CatalogChanges._meta.db_table} IN EXCLUSIVE MODE')
+
+
+def log_changes(shop_id, info_ids, action='upsert', bump=True):
+    """
+    Записывает в журнал изменение предложений info_ids магазина shop_id.
+    bump=False - версию каталога увеличит вызывающий, один раз для нескольких магазинов
+    """
+    if info_ids:
+        lock_changes()
+        CatalogChanges.objects.bulk_create([CatalogChanges(shop_id=shop_id, product_info_id=info_id, action=action)
+                                            for info_id in info_ids])
+        if bump:
+            bump_catalog_version(shop_id)
+
+
+def insert_changes(offers, action):
+    """
+    Записывает в журнал предложения из queryset offers одним запросом INSERT ... SELECT
+    """
+    lock_changes()
+    rows = offers.order_by('id').annotate(
+        change_action=Value(action, output_field=CharField()),
+        change_time=Value(timezone.now(), output_field=DateTimeField())).values_list(
+        'shop_id', 'id', 'change_action', 'change_time')
+    select, params = rows.query.sql_with_params()
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(CatalogChanges._meta.get_field(name).column)
+                        for name in ('shop_id', 'product_info_id', 'action', 'created_at'))
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {quote_name(CatalogChanges._meta.db_table)} ({columns}) {select}', params)
+
+
+def log_shop_changes(shop_id, action='upsert'):
+    """
+    Записывает в журнал изменение всех предложений магазина
+    """
+    insert_changes(ProductsInfo.objects.filter(shop_id=shop_id), action)
+    bump_catalog_version(shop_id)
+
+
+def log_offers_changes(offers, action='upsert'):
+    """
+    Записывает в журнал изменение предложений из queryset offers (например, всех предложений товара или категории)
+    и увеличивает общую версию каталога и версии их магазинов. Удаляемые предложения записываются до удаления
+    """
+    shop_ids = list(offers.order_by().values_list('shop_id', flat=True).distinct())
+    if shop_ids:
+        insert_changes(offers, action)
+    bump_catalog_version(*shop_ids)
+
+
+def get_changes(since, limit=CHANGES_PAGE_SIZE):
+    """
+    Страница журнала после версии since: (версия последней записи страницы, есть ли ещё записи,
+    изменённые предложения в формате ProductInfoSerializer, id удалённых предложений).
+    Несколько записей об одном предложении сворачиваются в последнюю. Предложения, которых уже нет
+    или магазин которых выключен, отдаются как удалённые
+    """
+    rows = list(CatalogChanges.objects.filter(version__gt=since).order_by('version').values_list(
+        'version', 'product_info_id', 'action')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    actions = {info_id: action for _, info_id, action in rows}
+
+    upsert_ids = [info_id for info_id, action in actions.items() if action == 'upsert']
+    offers = serialize_offers(ProductsInfo.objects.filter(id__in=upsert_ids, shop_id__status_work=True).order_by('id'))
+    found_ids = {offer['id'] for offer in offers}
+    deleted_ids = sorted(info_id for info_id in actions if info_id not in found_ids)
+
+    version = rows[-1][0] if rows else since
+    return version, has_more, offers, deleted_ids
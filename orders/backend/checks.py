@@ -0,0 +1,28 @@
+"""
+Проверки настроек при запуске (manage.py check).
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# кэши, которые не видны другим процессам
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Прогресс импорта (tasks.apply_job_progress) и версии каталога пишут воркеры Celery, а читают веб-процессы,
+    поэтому кэш по умолчанию должен быть общим для процессов. Исключение - задачи, выполняемые в том же процессе
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES and not getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+        return [Warning(
+            f'Кэш по умолчанию {backend} виден только своему процессу: прогресс импорта из воркера Celery '
+            f'и новые версии каталога до веб-процессов не дойдут',
+            hint='Укажите в CACHES общий кэш (файловый, Redis, Memcached)',
+            id='backend.W001',
+        )]
+    return []
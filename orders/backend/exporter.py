@@ -0,0 +1,136 @@
+"""
+Потоковая выгрузка прайса магазина в формате data/shop1.yaml, а также в JSON и NDJSON.
+
+Предложения читаются из базы пакетами через .iterator(), параметры догружаются одним запросом на пакет,
+каждый пакет сразу кодируется и отдаётся клиенту - память не зависит от размера каталога.
+"""
+import json
+import re
+
+from django.http import StreamingHttpResponse
+from yaml import dump as dump_yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
+from .importer import chunks
+from .models import Categories, ProductsInfo, ProductParameter
+
+EXPORT_BATCH_SIZE = 2000
+# десятичная запись числа, как её даёт str(float): без "_", пробелов, nan и inf
+FLOAT = re.compile(r'-?\d+(\.\d+)?(e[-+]\d+)?')
+
+EXPORT_FORMATS = {
+    'yaml': 'application/x-yaml; charset=utf-8',
+    'json': 'application/json; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def typed_value(value):
+    """
+    Значения параметров хранятся строками, в выгрузку числа возвращаются числами, как в исходном прайсе.
+    Числом становится только строка, которая из него же и получается ("007", "1_000", "1.50" остаются строками)
+    """
+    if FLOAT.fullmatch(value):
+        for convert in (int, float):
+            try:
+                number = convert(value)
+            except ValueError:
+                continue
+            if str(number) == value:
+                return number
+    return value
+
+
+def iter_goods(shop, batch_size=None):
+    """
+    Пакеты товаров магазина в структуре прайса
+    """
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    rows = ProductsInfo.objects.filter(shop_id=shop.id).order_by('id').values_list(
+        'id', 'external_id', 'product_id__category_id', 'product_id__name', 'price', 'price_rrc', 'quantity').iterator(
+        chunk_size=batch_size)
+    for batch in chunks(rows, batch_size):
+        parameters = {}
+        for info_id, name, value in ProductParameter.objects.filter(
+                product_info_id__in=[row[0] for row in batch]).order_by('id').values_list(
+                'product_info_id', 'parameter_id__name', 'value'):
+            parameters.setdefault(info_id, {})[name] = typed_value(value)
+        yield [{'id': external_id, 'category': category_id, 'name': name, 'price': price, 'price_rrc': price_rrc,
+                'quantity': quantity, 'parameters': parameters.get(info_id, {})}
+               for info_id, external_id, category_id, name, price, price_rrc, quantity in batch]
+
+
+def get_categories(shop):
+    return [{'id': category_id, 'name': name}
+            for category_id, name in Categories.objects.filter(shops=shop.id).order_by('id').values_list('id', 'name')]
+
+
+def export_yaml(shop):
+    def dump(data):
+        return dump_yaml(data, Dumper=SafeDumper, allow_unicode=True, sort_keys=False, default_flow_style=False,
+                         width=4096)
+
+    yield dump({'shop': shop.name})
+    categories = get_categories(shop)
+    if categories:
+        yield 'categories:\n' + indent(dump(categories))
+    else:
+        yield 'categories: []\n'
+    yield 'goods:\n'
+    for batch in iter_goods(shop):
+        yield indent(dump(batch))
+
+
+def indent(text):
+    # элементы списков в data/shop1.yaml сдвинуты на два пробела
+    return ''.join('  ' + line for line in text.splitlines(keepends=True))
+
+
+def export_json(shop):
+    yield '{"shop": %s, "categories": %s, "goods": [' % (dumps(shop.name), dumps(get_categories(shop)))
+    separator = '\n'
+    for batch in iter_goods(shop):
+        yield separator + ',\n'.join(dumps(item) for item in batch)
+        separator = ',\n'
+    yield '\n]}\n'
+
+
+def export_ndjson(shop):
+    """
+    Первая строка - магазин и категории, далее по товару на строку
+    """
+    yield dumps({'shop': shop.name, 'categories': get_categories(shop)}) + '\n'
+    for batch in iter_goods(shop):
+        yield ''.join(dumps(item) + '\n' for item in batch)
+
+
+def dumps(data):
+    return json.dumps(data, ensure_ascii=False)
+
+
+EXPORTERS = {
+    'yaml': export_yaml,
+    'json': export_json,
+    'ndjson': export_ndjson,
+}
+
+
+def export_price(shop, export_format):
+    """
+    Генератор кусков выгрузки в байтах
+    """
+    for chunk in EXPORTERS[export_format](shop):
+        yield chunk.encode()
+
+
+def export_response(shop, export_format):
+    """
+    Потоковый ответ с выгрузкой - общий для partner/export и админки
+    """
+    response = StreamingHttpResponse(export_price(shop, export_format), content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="shop{shop.id}.{export_format}"'
+    return response
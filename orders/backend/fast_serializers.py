@@ -0,0 +1,307 @@
+"""
+Быстрая сериализация ответов каталога и заказов только для чтения.
+
+Строки берутся через values() - по одному запросу на таблицу, без создания объектов моделей, - а словарь ответа
+собирает функция, построенная заранее из описания полей (make_mapper). У ModelSerializer на каждое поле
+каждой строки приходятся вызовы get_attribute и to_representation, здесь на строку - один itemgetter и zip.
+
+Результат совпадает с ProductInfoSerializer и OrdersSerializer, а части заказов по магазинам - с эталонными
+сериализаторами в тестах (проверяется там же). ModelSerializer остаются для записи и проверки данных.
+Замер - backend.benchmarks.run_serialization_benchmark.
+
+Параметры запроса ?fields= и ?include= (requested_fields) сокращают ответ до части ключей, и тогда из базы
+выбираются только нужные им столбцы, а соединения и запросы для отброшенных ключей не выполняются.
+"""
+from collections import namedtuple
+from functools import lru_cache
+from operator import itemgetter
+
+from django.conf import settings
+from rest_framework import ISO_8601
+from rest_framework.fields import DateTimeField
+from rest_framework.settings import api_settings
+
+from .models import OrderItems, ProductParameter, ShopOrders
+
+# сколько значений идёт в один фильтр __in: у SQLite ограничено число параметров запроса
+IN_BATCH_SIZE = 2000
+
+# вложенный объект, вместо которого None, если пуст столбец column (внешний ключ NULL)
+Nullable = namedtuple('Nullable', 'column fields')
+
+
+def make_mapper(fields):
+    """
+    Функция row -> dict по описанию полей {ключ ответа: столбец строки | вложенное описание | Nullable}.
+    Столбец - ключ строки values() или номер в строке values_list()
+    """
+    if isinstance(fields, Nullable):
+        column, mapper = fields.column, make_mapper(fields.fields)
+        return lambda row: None if row[column] is None else mapper(row)
+    if not isinstance(fields, dict):
+        return itemgetter(fields)
+
+    keys = tuple(fields)
+    if not keys or any(isinstance(spec, (dict, Nullable)) for spec in fields.values()):
+        mappers = tuple(make_mapper(spec) for spec in fields.values())
+        return lambda row: dict(zip(keys, [mapper(row) for mapper in mappers]))
+    if len(keys) == 1:
+        key, column = keys[0], fields[keys[0]]
+        return lambda row: {key: row[column]}
+    # столбцы без вложенных объектов выбираются одним itemgetter
+    getter = itemgetter(*fields.values())
+    return lambda row: dict(zip(keys, getter(row)))
+
+
+class FieldsError(ValueError):
+    """
+    Неизвестное поле в ?fields= или ?include=
+    """
+
+
+def sparse(fields, names):
+    """
+    Описание полей, сокращённое до ключей верхнего уровня names (None - все ключи)
+    """
+    return fields if names is None else {key: value for key, value in fields.items() if key in names}
+
+
+def columns(fields, related=()):
+    """
+    Столбцы values() для описания полей: id и все столбцы описания, кроме ключей related,
+    которые добавляются в строку отдельным запросом
+    """
+    found = {'id': None}
+
+    def collect(spec):
+        if isinstance(spec, Nullable):
+            found[spec.column] = None
+            collect(spec.fields)
+        elif isinstance(spec, dict):
+            for value in spec.values():
+                collect(value)
+        elif spec not in related:
+            found[spec] = None
+
+    collect(fields)
+    return list(found)
+
+
+def requested_fields(params, fields, includes):
+    """
+    Ключи ответа по параметрам запроса: fields=ключ,... оставляет перечисленные ключи верхнего уровня,
+    include=имя,... - связанные данные из includes ({имя: ключ ответа}), остальные связанные данные отбрасываются.
+    Без этих параметров - None, то есть весь ответ
+    """
+    if 'fields' not in params and 'include' not in params:
+        return None
+    names = set(fields)
+    if 'fields' in params:
+        names = {name for name in params['fields'].split(',') if name}
+        unknown = names - set(fields)
+        if unknown:
+            raise FieldsError(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+    if 'include' in params:
+        included = {name for name in params['include'].split(',') if name}
+        unknown = included - set(includes)
+        if unknown:
+            raise FieldsError(f'Неизвестные связанные данные: {", ".join(sorted(unknown))}')
+        names -= {key for name, key in includes.items() if name not in included}
+    return frozenset(names)
+
+
+# ProductInfoSerializer; product_parameters в строку добавляет serialize_offers
+OFFER = {
+    'id': 'id', 'shop_id': 'shop_id',
+    'product_id': {'name': 'product_id__name',
+                   'category_id': {'id': 'product_id__category_id', 'name': 'product_id__category_id__name'}},
+    'quantity': 'quantity', 'price': 'price', 'price_rrc': 'price_rrc', 'product_parameters': 'product_parameters',
+}
+OFFER_RELATED = ('product_parameters',)
+# имена для ?include=
+OFFER_INCLUDES = {'product': 'product_id', 'parameters': 'product_parameters'}
+OFFER_FIELDS = columns(OFFER, OFFER_RELATED)
+map_offer = make_mapper(OFFER)
+
+# ProductParameterSerializer
+PARAMETER_FIELDS = ('product_info_id', 'parameter_id', 'parameter_id__name', 'value')
+map_parameter = make_mapper({
+    'parameter_id': Nullable('parameter_id', {'id': 'parameter_id', 'name': 'parameter_id__name'}),
+    'value': 'value',
+})
+
+# OrdersSerializer: вложенное поле order_id у модели Orders не находится и в ответ не попадает,
+# ordered_items - список id позиций заказа, shops - его части по магазинам (поставки),
+# date приводит к строке datetime_representation
+ORDER = {
+    'ordered_items': 'ordered_items', 'status': 'status', 'date': 'date', 'total_sum': 'total_sum',
+    'items_count': 'items_count',
+    'contact': Nullable('contact_id', {
+        'id': 'contact_id', 'city': 'contact__city', 'street': 'contact__street', 'build': 'contact__build',
+        'corpus': 'contact__corpus', 'apartment': 'contact__apartment', 'phone': 'contact__phone'}),
+    'shops': 'shops',
+}
+ORDER_RELATED = ('ordered_items', 'shops')
+ORDER_INCLUDES = {'items': 'ordered_items', 'contact': 'contact', 'shops': 'shops'}
+
+# shops - части заказа по магазинам в заказе покупателя
+SHOP_PART_FIELDS = ('order_id', 'shop_id', 'status', 'total_sum', 'items_count')
+map_shop_part = make_mapper({'shop_id': 'shop_id', 'status': 'status', 'total_sum': 'total_sum',
+                                'items_count': 'items_count'})
+
+# заказ для поставщика: id заказа, только его позиции и суммы, контакт покупателя
+SHOP_ORDER = {
+    'id': 'order_id', 'ordered_items': 'ordered_items', 'status': 'status', 'date': 'date',
+    'total_sum': 'total_sum', 'items_count': 'items_count',
+    'contact': Nullable('order_id__contact', {
+        'id': 'order_id__contact', 'city': 'order_id__contact__city', 'street': 'order_id__contact__street',
+        'build': 'order_id__contact__build', 'corpus': 'order_id__contact__corpus',
+        'apartment': 'order_id__contact__apartment', 'phone': 'order_id__contact__phone'}),
+}
+SHOP_ORDER_RELATED = ('ordered_items',)
+SHOP_ORDER_INCLUDES = {'items': 'ordered_items', 'contact': 'contact'}
+
+
+@lru_cache(maxsize=None)
+def offer_mapper(names):
+    return make_mapper(sparse(OFFER, names))
+
+
+@lru_cache(maxsize=None)
+def order_mapper(names):
+    return make_mapper(sparse(ORDER, names))
+
+
+@lru_cache(maxsize=None)
+def shop_order_mapper(names):
+    return make_mapper(sparse(SHOP_ORDER, names))
+
+
+def offer_columns(names=None, *extra):
+    """
+    Столбцы values() для предложений с ключами names и дополнительными столбцами extra
+    """
+    return list(dict.fromkeys(columns(sparse(OFFER, names), OFFER_RELATED) + list(extra)))
+
+
+def datetime_representation():
+    """
+    DateTimeField().to_representation для ISO 8601 с часовым поясом, выбранным один раз на ответ, а не на строку
+    """
+    field = DateTimeField()
+    if not settings.USE_TZ or api_settings.DATETIME_FORMAT != ISO_8601:
+        return field.to_representation
+    current_timezone = field.default_timezone()
+
+    def to_representation(value):
+        if not value:
+            return None
+        value = value.astimezone(current_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return to_representation
+
+
+def format_dates(rows, fields):
+    if 'date' in fields:
+        date = datetime_representation()
+        for row in rows:
+            row['date'] = date(row['date'])
+
+
+def in_batches(values):
+    """
+    Списки значений для фильтра __in длиной не больше IN_BATCH_SIZE
+    """
+    values = list(values)
+    return (values[start:start + IN_BATCH_SIZE] for start in range(0, len(values), IN_BATCH_SIZE))
+
+
+def offer_parameters(info_ids):
+    """
+    Параметры предложений: {id предложения: [параметры в формате ProductParameterSerializer]}
+    """
+    parameters = {}
+    for batch in in_batches(info_ids):
+        for row in ProductParameter.objects.filter(product_info_id__in=batch).order_by(
+                'product_info_id', 'id').values(*PARAMETER_FIELDS):
+            parameters.setdefault(row['product_info_id'], []).append(map_parameter(row))
+    return parameters
+
+
+def serialize_offers(rows, names=None):
+    """
+    Предложения в формате ProductInfoSerializer с ключами names (None - все) из queryset ProductsInfo
+    или из уже выбранных строк values(*offer_columns(names))
+    """
+    if hasattr(rows, 'values'):
+        rows = rows.values(*offer_columns(names))
+    rows = list(rows)
+    mapper = offer_mapper(names)
+    if names is not None and 'product_parameters' not in names:
+        return [mapper(row) for row in rows]
+    parameters = offer_parameters(row['id'] for row in rows)
+    data = []
+    for row in rows:
+        row['product_parameters'] = parameters.get(row['id'], [])
+        data.append(mapper(row))
+    return data
+
+
+def serialize_orders(queryset, names=None):
+    """
+    Заказы в формате OrdersSerializer с ключами names (None - все) из queryset Orders.
+    Позиции выбираются, только если их ключ есть в ответе; сумма и число позиций хранятся в самом заказе
+    """
+    fields = sparse(ORDER, names)
+    rows = list(queryset.values(*columns(fields, ORDER_RELATED)))
+    order_ids = [row['id'] for row in rows]
+    if 'ordered_items' in fields:
+        items = {}
+        for batch in in_batches(order_ids):
+            for order_id, item_id in OrderItems.objects.filter(order_id__in=batch).order_by('id').values_list(
+                    'order_id', 'id'):
+                items.setdefault(order_id, []).append(item_id)
+        for row in rows:
+            row['ordered_items'] = items.get(row['id'], [])
+    if 'shops' in fields:
+        shops = {}
+        for batch in in_batches(order_ids):
+            for part in ShopOrders.objects.filter(order_id__in=batch).order_by('id').values(*SHOP_PART_FIELDS):
+                shops.setdefault(part['order_id'], []).append(map_shop_part(part))
+        for row in rows:
+            row['shops'] = shops.get(row['id'], [])
+    format_dates(rows, fields)
+    mapper = order_mapper(names)
+    return [mapper(row) for row in rows]
+
+
+def shop_order_columns(names=None, *extra):
+    """
+    Столбцы values() для заказов поставщику с ключами names и дополнительными столбцами extra
+    """
+    return list(dict.fromkeys(columns(sparse(SHOP_ORDER, names), SHOP_ORDER_RELATED) + ['order_id', 'shop_id']
+                              + list(extra)))
+
+
+def serialize_shop_orders(rows, names=None):
+    """
+    Заказы поставщику (SHOP_ORDER) с ключами names (None - все) из queryset ShopOrders
+    или из уже выбранных строк values(*shop_order_columns(names)). В ordered_items - только позиции его магазина
+    """
+    fields = sparse(SHOP_ORDER, names)
+    if hasattr(rows, 'values'):
+        rows = rows.values(*shop_order_columns(names))
+    rows = list(rows)
+    if 'ordered_items' in fields:
+        items = {}
+        for batch in in_batches(rows):
+            for order_id, shop_id, item_id in OrderItems.objects.filter(
+                    order_id__in={row['order_id'] for row in batch},
+                    product_info_id__shop_id__in={row['shop_id'] for row in batch}).order_by('id').values_list(
+                    'order_id', 'product_info_id__shop_id', 'id'):
+                items.setdefault((order_id, shop_id), []).append(item_id)
+        for row in rows:
+            row['ordered_items'] = items.get((row['order_id'], row['shop_id']), [])
+    format_dates(rows, fields)
+    mapper = shop_order_mapper(names)
+    return [mapper(row) for row in rows]
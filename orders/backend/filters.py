@@ -0,0 +1,134 @@
+"""
+Фильтры выдачи каталога (products).
+
+Один разбор параметров запроса используется и для запроса к базе, и для каталога в памяти (catalog_index),
+поэтому оба пути отбирают одни и те же предложения.
+
+Параметры товаров фильтруются по точному значению (parameter=Цвет:красный) или по диапазону числового значения
+(parameter=Диагональ (дюйм):6..6.5, любую границу можно опустить). Числовое значение разбирается при импорте
+(ProductParameter.numeric_value), оба условия идут по индексам (parameter_id, value) и (parameter_id, numeric_value).
+"""
+from math import isfinite
+
+from django.db.models import Q, Count
+
+from .models import Parameters, ProductParameter
+
+
+class CatalogFilterError(ValueError):
+    """
+    Неправильный фильтр в запросе
+    """
+
+
+def parse_int(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise CatalogFilterError(f'Параметр {name} должен быть целым числом')
+
+
+def parse_bound(value):
+    """
+    Граница диапазона: число, None для пустой границы; если это не число, условие не диапазон
+    """
+    if value == '':
+        return None
+    number = float(value.replace(',', '.'))
+    if not isfinite(number):
+        raise ValueError(value)
+    return number
+
+
+def parse_parameter(condition):
+    """
+    Условие по параметру: (название, значение) или (название, (от, до)) для диапазона
+    """
+    name, separator, value = condition.partition(':')
+    if not separator or not name:
+        raise CatalogFilterError('Фильтр parameter задаётся как <название>:<значение> или <название>:<от>..<до>')
+    low, separator, high = value.partition('..')
+    if separator and (low or high):
+        try:
+            return name, (parse_bound(low), parse_bound(high))
+        except ValueError:
+            pass
+    return name, value
+
+
+def parse_filters(params):
+    """
+    Фильтры из параметров запроса:
+    shop_id, category_id, price_min, price_max, in_stock=1 и parameter (можно несколько)
+    """
+    parameters, ranges = [], []
+    for condition in params.getlist('parameter'):
+        name, value = parse_parameter(condition)
+        if isinstance(value, tuple):
+            ranges.append((name, *value))
+        else:
+            parameters.append((name, value))
+    return {
+        'shop_id': parse_int(params, 'shop_id'),
+        'category_id': parse_int(params, 'category_id'),
+        'price_min': parse_int(params, 'price_min'),
+        'price_max': parse_int(params, 'price_max'),
+        'in_stock': params.get('in_stock') in ('1', 'true', 'True'),
+        'parameters': parameters,
+        'ranges': ranges,
+    }
+
+
+def filter_offers(queryset, filters):
+    """
+    Применяет фильтры к queryset предложений (ProductsInfo)
+    """
+    query = Q(shop_id__status_work=True)
+    if filters['shop_id'] is not None:
+        query &= Q(shop_id=filters['shop_id'])
+    if filters['category_id'] is not None:
+        query &= Q(product_id__category_id=filters['category_id'])
+    if filters['price_min'] is not None:
+        query &= Q(price__gte=filters['price_min'])
+    if filters['price_max'] is not None:
+        query &= Q(price__lte=filters['price_max'])
+    if filters['in_stock']:
+        query &= Q(quantity__gt=0)
+    queryset = queryset.filter(query)
+
+    names = {name for name, _ in filters['parameters']} | {name for name, _, _ in filters['ranges']}
+    if not names:
+        return queryset
+    # id параметров заранее, чтобы условия шли по индексам с parameter_id
+    parameter_ids = dict(Parameters.objects.filter(name__in=names).values_list('name', 'id'))
+    if len(parameter_ids) < len(names):
+        return queryset.none()
+    # у предложения не больше одного значения каждого параметра, отдельные соединения не дают дубликатов
+    for name, value in filters['parameters']:
+        queryset = queryset.filter(product_parameters__parameter_id=parameter_ids[name],
+                                   product_parameters__value=value)
+    for name, low, high in filters['ranges']:
+        condition = Q(product_parameters__parameter_id=parameter_ids[name],
+                      product_parameters__numeric_value__isnull=False)
+        if low is not None:
+            condition &= Q(product_parameters__numeric_value__gte=low)
+        if high is not None:
+            condition &= Q(product_parameters__numeric_value__lte=high)
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def count_facets(queryset):
+    """
+    Число предложений из queryset по каждому значению каждого параметра - одним запросом с группировкой:
+    {название параметра: {значение: число}}
+    """
+    facets = {}
+    for name, value, count in ProductParameter.objects.filter(
+            product_info_id__in=queryset.order_by().values('id')).values_list(
+            'parameter_id__name', 'value').annotate(count=Count('id')).order_by('parameter_id__name', 'value'):
+        facets.setdefault(name, {})[value] = count
+    return facets
@@ -0,0 +1,384 @@
+"""
+Импорт прайса поставщика в каталог.
+
+Категории, товары и параметры разрешаются пакетными запросами, а ProductsInfo и ProductParameter
+записываются массовыми вставками (insert_rows), поэтому число запросов растёт с количеством пакетов, а не строк прайса.
+
+В режиме diff прайс сравнивается с сохранёнными предложениями магазина по (shop_id, external_id):
+создаются только новые предложения, обновляются изменившиеся, а пропавшие из прайса снимаются с продажи
+(quantity=0) без удаления, чтобы не задеть корзины и заказы покупателей.
+
+Изменённые и удалённые предложения записываются в журнал изменений каталога (changes.py) в конце транзакции.
+"""
+import json
+from array import array
+from contextlib import closing, nullcontext
+from hashlib import sha256
+from itertools import islice
+from math import isfinite
+
+from django.db import transaction
+
+from django.utils import timezone
+
+from .models import Categories, Shops, ProductsInfo, Products, Parameters, ProductParameter, CatalogChanges
+from .changes import lock_changes, log_shop_changes
+from .cache import bump_catalog_version
+from .price_list import PriceList, PriceImportError
+from .sources import fetch_price, decompress
+
+# размер пакета товаров (с запасом под лимит переменных SQLite в запросах "__in")
+BATCH_SIZE = 500
+
+
+def chunks(iterable, size):
+    """
+    Разбивает последовательность на списки длиной не больше size
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_number(value):
+    """
+    Числовое значение параметра прайса или None. YAML уже даёт числа числами, строки вида "6,5" тоже разбираются
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        try:
+            number = float(str(value).replace(',', '.'))
+        except ValueError:
+            return None
+    return number if isfinite(number) else None
+
+
+class PriceImporter:
+    """
+    Загрузка прайса поставщика пакетами в одной транзакции
+    """
+    batch_size = BATCH_SIZE
+
+    def __init__(self, user, progress=None):
+        self.user = user
+        # progress(importer) вызывается после каждого пакета товаров
+        self.progress = progress
+        self.shop = None
+        self.category_ids = set()
+        # кэш параметров {название: id}, параметров немного и они общие для всех магазинов
+        self.parameters = {}
+        self.rows_processed = 0
+        # причина пропуска импорта неизменившегося прайса
+        self.skipped = ''
+        # статистика режима diff
+        self.seen_external_ids = set()
+        self.created = 0
+        self.updated = 0
+        self.retired = 0
+        # id предложений для журнала изменений, array вместо списка - по 8 байт на предложение
+        self.changed_ids = array('q')
+        self.deleted_ids = array('q')
+
+    def run(self, shop_name, categories, goods, diff=False):
+        """
+        Загрузка прайса магазина: полная перезагрузка или, при diff=True, применение только изменений.
+        goods может быть любым итерируемым объектом, он читается пакетами по batch_size
+        """
+        with transaction.atomic():
+            self.load_shop(shop_name)
+            self.load_categories(categories)
+            if not diff:
+                offers = ProductsInfo.objects.filter(shop_id=self.shop.id)
+                self.deleted_ids.extend(offers.values_list('id', flat=True).iterator())
+                offers.only('id').delete()
+            for batch in chunks(goods, self.batch_size):
+                if diff:
+                    self.merge_goods(batch)
+                else:
+                    self.load_goods(batch)
+                if self.progress:
+                    self.progress(self)
+            if diff:
+                self.retire_offers()
+            self.log_changes(diff)
+        return self.shop
+
+    def load_shop(self, shop_name):
+        # блокировка строки магазина до конца транзакции: импорты одного магазина не перемешиваются
+        self.shop, _ = Shops.objects.select_for_update().get_or_create(name=shop_name, user_id=self.user)
+
+    def load_categories(self, categories):
+        categories = {category['id']: category['name'] for category in categories}
+        Categories.objects.bulk_create([Categories(id=category_id, name=name)
+                                        for category_id, name in categories.items()], ignore_conflicts=True)
+        through = Categories.shops.through
+        through.objects.bulk_create([through(categories_id=category_id, shops_id=self.shop.id)
+                                     for category_id in categories], ignore_conflicts=True)
+        self.category_ids.update(categories)
+
+    def check_categories(self, batch):
+        unknown = {item['category'] for item in batch} - self.category_ids
+        if unknown:
+            self.category_ids.update(Categories.objects.filter(id__in=unknown).values_list('id', flat=True))
+            unknown -= self.category_ids
+            if unknown:
+                raise PriceImportError(f'Неизвестные категории: {sorted(unknown)}')
+
+    def resolve_products(self, batch):
+        """
+        Возвращает {(название, категория): id товара}, недостающие товары создаются одним запросом
+        """
+        keys = {(item['name'], item['category']) for item in batch}
+        products = self.fetch_products(keys)
+        missing = keys - products.keys()
+        if missing:
+            Products.objects.bulk_create([Products(name=name, category_id_id=category_id)
+                                          for name, category_id in missing], batch_size=self.batch_size)
+            products.update(self.fetch_products(missing))
+        return products
+
+    @staticmethod
+    def fetch_products(keys):
+        products = {}
+        names = {name for name, _ in keys}
+        # при дублях товара берём самый ранний, как это делал get_or_create
+        for product_id, name, category_id in Products.objects.filter(name__in=names).order_by('-id').values_list(
+                'id', 'name', 'category_id'):
+            if (name, category_id) in keys:
+                products[(name, category_id)] = product_id
+        return products
+
+    def resolve_parameters(self, batch):
+        names = {name for item in batch for name in item.get('parameters', {})}
+        missing = names - self.parameters.keys()
+        if missing:
+            Parameters.objects.bulk_create([Parameters(name=name) for name in missing], ignore_conflicts=True)
+            self.parameters.update(Parameters.objects.filter(name__in=missing).values_list('name', 'id'))
+        return self.parameters
+
+    def load_goods(self, batch):
+        self.check_categories(batch)
+        products = self.resolve_products(batch)
+        parameters = self.resolve_parameters(batch)
+        self.create_offers(batch, products, parameters)
+        self.rows_processed += len(batch)
+
+    def create_offers(self, batch, products, parameters):
+        insert_rows(ProductsInfo, ('shop_id', 'product_id', 'external_id', 'price', 'price_rrc', 'quantity'), [
+            (self.shop.id, products[(item['name'], item['category'])], item['id'], int(item['price']),
+             int(item['price_rrc']), int(item['quantity']))
+            for item in batch], self.batch_size)
+        info_ids = self.fetch_info_ids({item['id'] for item in batch})
+
+        insert_rows(ProductParameter, ('product_info_id', 'parameter_id', 'value', 'numeric_value'), [
+            (info_ids[(item['id'], products[(item['name'], item['category'])])], parameters[name], str(value),
+             parse_number(value))
+            for item in batch
+            for name, value in item.get('parameters', {}).items()], self.batch_size)
+        self.created += len(batch)
+        return info_ids.values()
+
+    def merge_goods(self, batch):
+        """
+        Применение пакета товаров в режиме diff
+        """
+        self.check_categories(batch)
+        products = self.resolve_products(batch)
+        parameters = self.resolve_parameters(batch)
+
+        external_ids = {item['id'] for item in batch}
+        self.seen_external_ids.update(external_ids)
+        offers = {info.external_id: info for info in ProductsInfo.objects.filter(
+            shop_id=self.shop.id, external_id__in=external_ids).only(
+            'id', 'external_id', 'product_id', 'price', 'price_rrc', 'quantity')}
+        offer_parameters = {}
+        for parameter in ProductParameter.objects.filter(
+                product_info_id__in=[info.id for info in offers.values()]).only(
+                'id', 'product_info_id', 'parameter_id', 'value'):
+            offer_parameters.setdefault(parameter.product_info_id_id, {})[parameter.parameter_id_id] = parameter
+
+        new_items, changed_offers, changed_ids = [], [], set()
+        new_parameters, changed_parameters, removed_parameters = [], [], []
+        for item in batch:
+            info = offers.get(item['id'])
+            if info is None:
+                new_items.append(item)
+                continue
+
+            # значения из YAML приводятся к int, как в create_offers, иначе "100" != 100 дало бы ложное изменение
+            fields = {'product_id_id': products[(item['name'], item['category'])], 'price': int(item['price']),
+                      'price_rrc': int(item['price_rrc']), 'quantity': int(item['quantity'])}
+            if any(getattr(info, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(info, name, value)
+                changed_offers.append(info)
+                changed_ids.add(info.id)
+
+            stored = offer_parameters.get(info.id, {})
+            values = {parameters[name]: value for name, value in item.get('parameters', {}).items()}
+            for parameter_id, value in values.items():
+                parameter = stored.get(parameter_id)
+                if parameter is None:
+                    new_parameters.append(ProductParameter(product_info_id_id=info.id, parameter_id_id=parameter_id,
+                                                           value=str(value), numeric_value=parse_number(value)))
+                    changed_ids.add(info.id)
+                elif parameter.value != str(value):
+                    parameter.value = str(value)
+                    parameter.numeric_value = parse_number(value)
+                    changed_parameters.append(parameter)
+                    changed_ids.add(info.id)
+            for parameter_id, parameter in stored.items():
+                if parameter_id not in values:
+                    removed_parameters.append(parameter.id)
+                    changed_ids.add(info.id)
+
+        if new_items:
+            changed_ids.update(self.create_offers(new_items, products, parameters))
+        if changed_offers:
+            ProductsInfo.objects.bulk_update(changed_offers, ['product_id', 'price', 'price_rrc', 'quantity'],
+                                             batch_size=self.batch_size)
+        if new_parameters:
+            ProductParameter.objects.bulk_create(new_parameters, batch_size=self.batch_size)
+        if changed_parameters:
+            ProductParameter.objects.bulk_update(changed_parameters, ['value', 'numeric_value'],
+                                                 batch_size=self.batch_size)
+        if removed_parameters:
+            ProductParameter.objects.filter(id__in=removed_parameters).delete()
+        self.updated += len(changed_ids) - len(new_items)
+        self.changed_ids.extend(changed_ids)
+        self.rows_processed += len(batch)
+
+    def retire_offers(self):
+        """
+        Снимает с продажи предложения магазина, которых нет в новом прайсе
+        """
+        retired_ids = [info_id for info_id, external_id in ProductsInfo.objects.filter(
+            shop_id=self.shop.id).exclude(quantity=0).values_list('id', 'external_id')
+            if external_id not in self.seen_external_ids]
+        for batch in chunks(retired_ids, self.batch_size):
+            self.retired += ProductsInfo.objects.filter(id__in=batch).update(quantity=0)
+        self.changed_ids.extend(retired_ids)
+
+    def log_changes(self, diff):
+        """
+        Запись изменений в журнал каталога. После полной перезагрузки все старые предложения удалены,
+        а все текущие - новые, их запись делается одним INSERT ... SELECT
+        """
+        lock_changes()
+        created_at = timezone.now()
+        fields = ('shop_id', 'product_info_id', 'action', 'created_at')
+        insert_rows(CatalogChanges, fields, [(self.shop.id, info_id, 'delete', created_at)
+                                             for info_id in self.deleted_ids], self.batch_size)
+        if diff:
+            insert_rows(CatalogChanges, fields, [(self.shop.id, info_id, 'upsert', created_at)
+                                                 for info_id in self.changed_ids], self.batch_size)
+        else:
+            log_shop_changes(self.shop.id)
+        bump_catalog_version(self.shop.id)
+
+    def fetch_info_ids(self, external_ids):
+        """
+        Возвращает {(external_id, id товара): id} для предложений магазина с указанными external_id
+        """
+        return {(external_id, product_id): info_id for info_id, external_id, product_id in
+                ProductsInfo.objects.filter(shop_id=self.shop.id, external_id__in=external_ids).values_list(
+                    'id', 'external_id', 'product_id')}
+
+
+def insert_rows(model, fields, rows, batch_size):
+    """
+    Массовая вставка кортежей значений полей fields через bulk_create
+    """
+    model.objects.bulk_create([model(**{model._meta.get_field(name).attname: value
+                                        for name, value in zip(fields, row)}) for row in rows],
+                              batch_size=batch_size)
+
+
+def import_price(user, stream, diff=False, progress=None):
+    """
+    Потоковый импорт прайса: товары читаются из stream по одному и пишутся в базу пакетами
+    """
+    price_list = PriceList(stream)
+    importer = PriceImporter(user, progress=progress)
+    importer.run(price_list.shop, price_list.categories, price_list.goods(), diff=diff)
+    return importer
+
+
+class GoodsHash:
+    """
+    Хэш разобранного содержимого прайса, не зависящий от форматирования файла.
+    Считается по ходу импорта: товары проходят через goods() по пути в PriceImporter, и прайс разбирается один раз
+    """
+
+    def __init__(self, shop, categories):
+        self.hash = sha256(json.dumps([shop, categories], sort_keys=True, default=str).encode())
+
+    def goods(self, goods):
+        for item in goods:
+            self.hash.update(json.dumps(item, sort_keys=True, default=str).encode())
+            yield item
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+def import_from_url(user, url, diff=False, progress=None, write_lock=None):
+    """
+    Импорт прайса по ссылке.
+    Если прайс по этой ссылке уже загружался, запрос делается условным, а разбор и запись в базу
+    пропускаются, когда не изменился файл, а если изменилось только форматирование, записанное откатывается
+    (importer.skipped содержит причину).
+    Файл скачивается без блокировок, а сведения о прошлой загрузке для сравнения, импорт и запись новых сведений
+    идут в одной транзакции под блокировкой строки магазина и write_lock (если передана): два импорта
+    одного магазина не сравнивают файл с устаревшими сведениями и не перезаписывают сведения друг друга
+    """
+    shop = Shops.objects.filter(user_id=user).first()
+    known = shop is not None and shop.url_shop == url
+    source = fetch_price(url, etag=shop.price_etag if known else '',
+                         last_modified=shop.price_last_modified if known else '')
+    with closing(source), write_lock or nullcontext(), transaction.atomic():
+        shop = Shops.objects.select_for_update().filter(user_id=user).first()
+        known = shop is not None and shop.url_shop == url
+        importer = PriceImporter(user, progress=progress)
+        goods_hash = ''
+        if source.not_modified:
+            importer.skipped = 'not_modified'
+        elif known and source.content_hash == shop.price_hash:
+            importer.skipped = 'same_content'
+        else:
+            price_list = PriceList(source.file)
+            hasher = GoodsHash(price_list.shop, price_list.categories)
+            # хэш известен только после разбора всего прайса: если содержимое то же, записанное откатывается
+            # к точке сохранения вместе с отложенным увеличением версии каталога
+            with transaction.atomic():
+                importer.run(price_list.shop, price_list.categories, hasher.goods(price_list.goods()), diff=diff)
+                goods_hash = hasher.hexdigest()
+                if known and goods_hash == shop.goods_hash:
+                    transaction.set_rollback(True)
+                    importer = PriceImporter(user, progress=progress)
+                    importer.skipped = 'same_goods'
+
+        if not source.not_modified:
+            Shops.objects.filter(user_id=user).update(url_shop=url, price_etag=source.etag,
+                                                      price_last_modified=source.last_modified,
+                                                      price_hash=source.content_hash,
+                                                      goods_hash=goods_hash or shop.goods_hash)
+    return importer
+
+
+def import_from_file(user, file, content_encoding='', diff=False, progress=None, write_lock=None):
+    """
+    Импорт загруженного прайса, сжатый файл распаковывается потоком прямо в парсер
+    """
+    with closing(decompress(file, content_encoding)) as stream, write_lock or nullcontext(), transaction.atomic():
+        importer = import_price(user, stream, diff=diff, progress=progress)
+        # каталог больше не соответствует прайсу по ссылке, следующая загрузка по ней должна пройти полностью
+        Shops.objects.filter(user_id=user).update(price_etag='', price_last_modified='', price_hash='',
+                                                  goods_hash='')
+    return importer
@@ -0,0 +1,76 @@
+import json
+import os
+import platform
+from tempfile import TemporaryDirectory
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from backend.benchmarks import generate_price_list, run_import_benchmark, compare_results, save_results
+from backend.models import Users
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк импорта прайсов на синтетических данных. Запускается на отдельной тестовой базе, ' \
+           'рабочая база не затрагивается'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='размеры прайсов в товарах (например 1000 10000 100000 1000000)')
+        parser.add_argument('--categories', type=int, default=10, help='число категорий')
+        parser.add_argument('--parameters', type=int, default=4, help='число параметров у товара')
+        parser.add_argument('--diff', action='store_true',
+                            help='дополнительно замерить повторный импорт изменённого прайса в режиме diff')
+        parser.add_argument('--label', default='', help='метка прогона, например имя ветки')
+        parser.add_argument('--output', default='bench_import.json', help='файл для результатов в JSON')
+        parser.add_argument('--compare', help='файл с результатами для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='допустимое ухудшение относительно --compare (доля)')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = self.run_benchmarks(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        save_results(results, options['output'])
+        self.stdout.write(f'Результаты сохранены в {options["output"]}')
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                regressions = compare_results(results, json.load(file), options['threshold'])
+            if regressions:
+                raise CommandError('Регрессии производительности:\n' + '\n'.join(regressions))
+            self.stdout.write('Регрессий нет')
+
+    def run_benchmarks(self, options):
+        results = {
+            'label': options['label'],
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'categories': options['categories'],
+            'parameters': options['parameters'],
+            'results': [],
+        }
+        with TemporaryDirectory() as directory:
+            for index, goods in enumerate(sorted(options['sizes'])):
+                user = Users.objects.create_user(email=f'bench{index}@example.com', password='password', type='shop')
+                path = os.path.join(directory, f'{goods}.yaml')
+                with open(path, 'wb') as file:
+                    generate_price_list(file, goods, options['categories'], options['parameters'],
+                                        shop=f'Магазин {index}')
+                cases = [run_import_benchmark(user, path, goods)]
+
+                if options['diff']:
+                    with open(path, 'wb') as file:
+                        generate_price_list(file, goods, options['categories'], options['parameters'],
+                                            shop=f'Магазин {index}', price_shift=1)
+                    cases.append(run_import_benchmark(user, path, goods, diff=True))
+
+                for case in cases:
+                    self.stdout.write(f"{case['goods']:>9} {case['mode']:<4} {case['seconds']:>9.3f} с "
+                                      f"{case['queries']:>7} запросов {case['peak_rss_mb']:>8} МБ "
+                                      f"{case['rows_per_second']:>10} товаров/с")
+                    results['results'].append(case)
+        return results
@@ -0,0 +1,46 @@
+import os
+from tempfile import TemporaryDirectory
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from backend.benchmarks import generate_price_list, create_orders, run_serialization_benchmark
+from backend.importer import import_price
+from backend.models import Users
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк сериализации ответов каталога и заказов: DRF против fast_serializers. Запускается ' \
+           'на отдельной тестовой базе, рабочая база не затрагивается'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='число предложений и заказов')
+        parser.add_argument('--parameters', type=int, default=4, help='число параметров у товара')
+        parser.add_argument('--repeat', type=int, default=3, help='число повторов, берётся лучшее время')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = self.run_benchmarks(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for case in results:
+            self.stdout.write(f"{case['case']:<7} {case['rows']:>8} строк  DRF {case['drf_seconds']:>8.3f} с  "
+                              f"fast {case['fast_seconds']:>8.3f} с  x{case['speedup']}")
+        different = [case['case'] for case in results if not case['identical']]
+        if different:
+            raise CommandError('Ответы отличаются от сериализаторов DRF: ' + ', '.join(different))
+
+    def run_benchmarks(self, options):
+        shop = Users.objects.create_user(email='bench@example.com', password='password', type='shop')
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'price.yaml')
+            with open(path, 'wb') as file:
+                generate_price_list(file, options['rows'], parameters=options['parameters'])
+            with open(path, 'rb') as file:
+                import_price(shop, file)
+
+        buyer = Users.objects.create_user(email='buyer@example.com', password='password', type='buyer')
+        create_orders(buyer, options['rows'])
+        return run_serialization_benchmark(options['repeat'])
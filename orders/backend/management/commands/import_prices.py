@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.models import Shops, Users, ImportJobs
+from backend.scheduler import ImportScheduler
+
+
+class Command(BaseCommand):
+    help = 'Импорт прайсов нескольких магазинов параллельно. Без аргументов загружаются прайсы всех магазинов ' \
+           'по ссылке url_shop; в файле --file каждая строка имеет вид "<email поставщика> <ссылка на прайс>"'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, action='append', dest='shops', help='id магазина')
+        parser.add_argument('--file', help='файл со списком "<email> <url>"')
+        parser.add_argument('--concurrency', type=int, default=settings.IMPORT_CONCURRENCY,
+                            help='число одновременных импортов')
+        parser.add_argument('--diff', action='store_true', help='применить только изменения прайсов')
+
+    def handle(self, *args, **options):
+        jobs = [ImportJobs.objects.create(user_id_id=user_id, url=url, diff=options['diff'])
+                for user_id, url in self.get_sources(options)]
+        if not jobs:
+            raise CommandError('Нет прайсов для загрузки')
+
+        scheduler = ImportScheduler(options['concurrency'])
+        for job in jobs:
+            scheduler.submit(job)
+        scheduler.run()
+
+        for job in ImportJobs.objects.filter(id__in=[job.id for job in jobs]).order_by('id'):
+            line = f'{job.url}: {job.get_phase_display()}, товаров {job.rows_processed}'
+            if job.skipped:
+                line += f' ({job.get_skipped_display()})'
+            if job.errors:
+                self.stderr.write(f'{line}: {job.errors}')
+            else:
+                self.stdout.write(line)
+
+    def get_sources(self, options):
+        if options['file']:
+            sources = []
+            with open(options['file'], encoding='utf-8') as file:
+                for number, line in enumerate(file, 1):
+                    if not line.strip() or line.startswith('#'):
+                        continue
+                    # строка с неправильным числом полей пропускается, остальные прайсы загружаются
+                    fields = line.split()
+                    if len(fields) != 2:
+                        self.stderr.write(f'Строка {number} пропущена, нужно "<email> <url>": {line.strip()}')
+                        continue
+                    email, url = fields
+                    # задачу неизвестного поставщика не создать, она сразу считается неудачной
+                    user = Users.objects.filter(email=email, type='shop').first()
+                    if user is None:
+                        self.stderr.write(f'{url}: Ошибка: поставщик {email} не найден')
+                        continue
+                    sources.append((user.id, url))
+            return sources
+
+        shops = Shops.objects.exclude(url_shop='').exclude(user_id=None)
+        if options['shops']:
+            shops = shops.filter(id__in=options['shops'])
+        return list(shops.values_list('user_id', 'url_shop'))
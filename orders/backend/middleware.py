@@ -0,0 +1,91 @@
+"""
+Сжатие ответов по Accept-Encoding: brotli, если установлен пакет brotli и клиент его принимает, иначе gzip.
+Ответы короче COMPRESSION_MIN_SIZE байт не сжимаются: на них заголовки и время сжатия не окупаются.
+"""
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = 1024
+# качество brotli для ответов, сжимаемых на лету: выше 5 время растёт быстрее, чем выигрыш в размере
+BROTLI_QUALITY = 4
+
+ENCODING = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+
+def accepted_encodings(header):
+    """
+    Кодировки из Accept-Encoding, которые клиент принимает (q > 0)
+    """
+    encodings = set()
+    for item in header.split(','):
+        match = ENCODING.match(item)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2) or 1)
+        except ValueError:
+            continue
+        if quality > 0:
+            encodings.add(match.group(1).lower())
+    return encodings
+
+
+def brotli_string(content):
+    return brotli.compress(content, quality=BROTLI_QUALITY)
+
+
+def brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware с порогом COMPRESSION_MIN_SIZE и brotli
+    """
+
+    def process_response(self, request, response):
+        min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', COMPRESSION_MIN_SIZE)
+        if not response.streaming and len(response.content) < min_size:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and ('br' in encodings or '*' in encodings):
+            encoding, compress, compress_stream = 'br', brotli_string, brotli_sequence
+        elif 'gzip' in encodings or '*' in encodings:
+            encoding, compress, compress_stream = 'gzip', compress_string, compress_sequence
+        else:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            content = compress(response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+
+        # сжатое представление отличается от исходного, поэтому ETag становится слабым (как в GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
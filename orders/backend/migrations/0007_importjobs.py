@@ -0,0 +1,36 @@
+
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_alter_confirmemailtoken_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJobs',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, verbose_name='Ссылка на прайс')),
+                ('diff', models.BooleanField(default=False, verbose_name='Применить только изменения')),
+                ('phase', models.CharField(choices=[('queued', 'В очереди'), ('downloading', 'Загрузка прайса'), ('importing', 'Импорт товаров'), ('done', 'Завершен'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Этап')),
+                ('rows_processed', models.PositiveIntegerField(default=0, verbose_name='Обработано товаров')),
+                ('errors', models.TextField(blank=True, verbose_name='Ошибки')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Запущена')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('user_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задача импорта',
+                'verbose_name_plural': 'Задачи импорта',
+                'db_table': 'import_jobs',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
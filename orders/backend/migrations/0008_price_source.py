@@ -0,0 +1,43 @@
+
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_importjobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjobs',
+            name='skipped',
+            field=models.CharField(blank=True, choices=[('not_modified', 'Сервер ответил 304 Not Modified'), ('same_content', 'Файл не изменился'), ('same_goods', 'Изменилось только форматирование')], max_length=20, verbose_name='Причина пропуска импорта'),
+        ),
+        migrations.AddField(
+            model_name='shops',
+            name='goods_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш содержимого прайса'),
+        ),
+        migrations.AddField(
+            model_name='shops',
+            name='price_etag',
+            field=models.CharField(blank=True, max_length=200, verbose_name='ETag прайса'),
+        ),
+        migrations.AddField(
+            model_name='shops',
+            name='price_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш файла прайса'),
+        ),
+        migrations.AddField(
+            model_name='shops',
+            name='price_last_modified',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Last-Modified прайса'),
+        ),
+        migrations.AlterField(
+            model_name='shops',
+            name='url_shop',
+            field=models.URLField(blank=True, max_length=500, verbose_name='Ссылка'),
+        ),
+    ]
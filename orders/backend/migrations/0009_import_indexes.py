@@ -0,0 +1,21 @@
+
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_price_source'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['name', 'category_id'], name='products_name_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsinfo',
+            index=models.Index(fields=['shop_id', 'external_id'], name='products_info_shop_ext_idx'),
+        ),
+    ]
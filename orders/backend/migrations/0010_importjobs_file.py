@@ -0,0 +1,28 @@
+
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_import_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjobs',
+            name='content_encoding',
+            field=models.CharField(blank=True, max_length=20, verbose_name='Сжатие файла прайса'),
+        ),
+        migrations.AddField(
+            model_name='importjobs',
+            name='file',
+            field=models.FileField(blank=True, upload_to='imports/%Y/%m/%d', verbose_name='Файл прайса'),
+        ),
+        migrations.AlterField(
+            model_name='importjobs',
+            name='url',
+            field=models.URLField(blank=True, max_length=500, verbose_name='Ссылка на прайс'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_importjobs_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChanges',
+            fields=[
+                ('version', models.BigAutoField(primary_key=True, serialize=False, verbose_name='Версия')),
+                ('shop_id', models.PositiveIntegerField(verbose_name='Магазин')),
+                ('product_info_id', models.PositiveIntegerField(verbose_name='Информация о продукте')),
+                ('action', models.CharField(choices=[('upsert', 'Добавлено или изменено'), ('delete', 'Удалено')], max_length=10, verbose_name='Действие')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение каталога',
+                'verbose_name_plural': 'Журнал изменений каталога',
+                'db_table': 'catalog_changes',
+                'ordering': ('version',),
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_catalogchanges'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productsinfo',
+            index=models.Index(fields=['price', 'id'], name='products_info_price_idx'),
+        ),
+    ]
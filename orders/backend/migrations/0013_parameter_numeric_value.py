@@ -0,0 +1,51 @@
+
+
+from math import isfinite
+
+from django.db import migrations, models
+
+
+def parse_number(value):
+    try:
+        number = float(value.replace(',', '.'))
+    except ValueError:
+        return None
+    return number if isfinite(number) else None
+
+
+def fill_numeric_values(apps, schema_editor):
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    last_id = 0
+    while True:
+        batch = list(ProductParameter.objects.filter(id__gt=last_id).order_by('id').only('id', 'value')[:1000])
+        if not batch:
+            return
+        last_id = batch[-1].id
+        for parameter in batch:
+            parameter.numeric_value = parse_number(parameter.value)
+        ProductParameter.objects.bulk_update([parameter for parameter in batch if parameter.numeric_value is not None],
+                                             ['numeric_value'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_products_info_price_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productparameter',
+            name='numeric_value',
+            field=models.FloatField(blank=True, null=True, verbose_name='Числовое значение параметра'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter_id', 'value'], name='product_parameter_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter_id', 'numeric_value'], name='product_parameter_number_idx'),
+        ),
+        migrations.RunPython(fill_numeric_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+
+from django.db import migrations
+
+SQLITE_CREATE = [
+    # внешний контент: в FTS5 хранится только индекс, сами названия читаются из products
+    "CREATE VIRTUAL TABLE products_fts USING fts5(name, content='products', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+    "CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER products_fts_update AFTER UPDATE OF name ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name); END",
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS products_fts_update',
+    'DROP TRIGGER IF EXISTS products_fts_delete',
+    'DROP TRIGGER IF EXISTS products_fts_insert',
+    'DROP TABLE IF EXISTS products_fts',
+]
+
+# индексы по выражениям PostgreSQL обновляются сами, триггеры не нужны
+POSTGRES_CREATE = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    "CREATE INDEX products_name_tsv_idx ON products USING gin (to_tsvector('russian', name))",
+    'CREATE INDEX products_name_trgm_idx ON products USING gin (name gin_trgm_ops)',
+]
+
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS products_name_trgm_idx',
+    'DROP INDEX IF EXISTS products_name_tsv_idx',
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_parameter_numeric_value'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}),
+                             run_statements({'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP})),
+    ]
@@ -0,0 +1,21 @@
+
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_product_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productsinfo',
+            index=models.Index(fields=['shop_id', 'price', 'id'], name='products_info_shop_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsinfo',
+            index=models.Index(fields=['quantity', 'id'], name='products_info_quantity_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Count, F, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    Orders = apps.get_model('backend', 'Orders')
+    OrderItems = apps.get_model('backend', 'OrderItems')
+    ProductsInfo = apps.get_model('backend', 'ProductsInfo')
+    OrderItems.objects.update(
+        price=Coalesce(Subquery(ProductsInfo.objects.filter(id=OuterRef('product_info_id')).values('price')[:1]),
+                       Value(0)))
+    items = OrderItems.objects.filter(order_id=OuterRef('id')).order_by().values('order_id')
+    Orders.objects.update(
+        total_sum=Coalesce(Subquery(items.annotate(total=Sum(F('quantity') * F('price'))).values('total')),
+                           Value(0), output_field=models.PositiveBigIntegerField()),
+        items_count=Coalesce(Subquery(items.annotate(count=Count('id')).values('count')), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_products_info_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitems',
+            name='price',
+            field=models.PositiveIntegerField(default=0, verbose_name='Цена'),
+        ),
+        migrations.AddField(
+            model_name='orders',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Число позиций'),
+        ),
+        migrations.AddField(
+            model_name='orders',
+            name='total_sum',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Сумма заказа'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orders',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Резерв до'),
+        ),
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['status', 'reserved_until'], name='orders_reserved_until_idx'),
+        ),
+    ]
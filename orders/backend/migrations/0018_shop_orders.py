@@ -0,0 +1,52 @@
+
+
+from django.db import migrations, models
+from django.db.models import Sum, Count, F
+import django.db.models.deletion
+
+
+def fill_shop_orders(apps, schema_editor):
+    OrderItems = apps.get_model('backend', 'OrderItems')
+    ShopOrders = apps.get_model('backend', 'ShopOrders')
+    rows = OrderItems.objects.exclude(order_id__status='basket').order_by().values(
+        'order_id', 'product_info_id__shop_id', 'order_id__status', 'order_id__date').annotate(
+        total=Sum(F('quantity') * F('price')), count=Count('id'))
+    ShopOrders.objects.bulk_create([
+        ShopOrders(order_id_id=row['order_id'], shop_id_id=row['product_info_id__shop_id'],
+                   status=row['order_id__status'], date=row['order_id__date'], total_sum=row['total'],
+                   items_count=row['count']) for row in rows.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_order_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopOrders',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('basket', 'Статус корзины'), ('new', 'Новый'), ('confirmed', 'Подтвержден'), ('assembled', 'Собран'), ('sent', 'Отправлен'), ('delivered', 'Доставлен'), ('canceled', 'Отменен')], max_length=20, verbose_name='Статус')),
+                ('date', models.DateTimeField(verbose_name='Дата заказа')),
+                ('total_sum', models.PositiveBigIntegerField(default=0, verbose_name='Сумма по магазину')),
+                ('items_count', models.PositiveIntegerField(default=0, verbose_name='Число позиций магазина')),
+                ('order_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.orders', verbose_name='Заказ')),
+                ('shop_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.shops', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Заказ поставщику',
+                'verbose_name_plural': 'Заказы поставщикам',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='shoporders',
+            index=models.Index(fields=['shop_id', 'status', 'date'], name='shop_orders_status_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoporders',
+            constraint=models.UniqueConstraint(fields=('order_id', 'shop_id'), name='unique_shop_order'),
+        ),
+        migrations.RunPython(fill_shop_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_shop_orders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjobs',
+            name='created',
+            field=models.PositiveIntegerField(default=0, verbose_name='Создано предложений'),
+        ),
+        migrations.AddField(
+            model_name='importjobs',
+            name='retired',
+            field=models.PositiveIntegerField(default=0, verbose_name='Снято с продажи'),
+        ),
+        migrations.AddField(
+            model_name='importjobs',
+            name='updated',
+            field=models.PositiveIntegerField(default=0, verbose_name='Обновлено предложений'),
+        ),
+    ]
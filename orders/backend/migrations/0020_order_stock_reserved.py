@@ -0,0 +1,24 @@
+
+from django.db import migrations, models
+
+
+def fill_stock_reserved(apps, schema_editor):
+    # резерв держат заказы, оформленные после 0017: у них есть срок резерва
+    Orders = apps.get_model('backend', 'Orders')
+    Orders.objects.filter(status__in=('new', 'confirmed'), reserved_until__isnull=False).update(stock_reserved=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0019_import_job_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orders',
+            name='stock_reserved',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Товар зарезервирован'),
+        ),
+        migrations.RunPython(fill_stock_reserved, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0020_order_stock_reserved'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shoporders',
+            index=models.Index(fields=['shop_id', 'date'], name='shop_orders_date_idx'),
+        ),
+    ]
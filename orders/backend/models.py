@@ -23,6 +23,25 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+IMPORT_PHASE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('downloading', 'Загрузка прайса'),
+    ('importing', 'Импорт товаров'),
+    ('done', 'Завершен'),
+    ('failed', 'Ошибка'),
+)
+
+IMPORT_SKIP_CHOICES = (
+    ('not_modified', 'Сервер ответил 304 Not Modified'),
+    ('same_content', 'Файл не изменился'),
+    ('same_goods', 'Изменилось только форматирование'),
+)
+
+CHANGE_ACTION_CHOICES = (
+    ('upsert', 'Добавлено или изменено'),
+    ('delete', 'Удалено'),
+)
+
 
 class UsersManager(BaseUserManager):
     use_in_migrations = True
@@ -110,9 +129,15 @@ class Shops(models.Model):
                                    on_delete=models.CASCADE)
 
     name = models.CharField(max_length=50, verbose_name='Название магазина')
-    url_shop = models.URLField(verbose_name='Ссылка', max_length=50, blank=True)
+    url_shop = models.URLField(verbose_name='Ссылка', max_length=500, blank=True)
     status_work = models.BooleanField(default=True, verbose_name='Статус приёма заказов')
 
+    # сведения о последнем загруженном прайсе для пропуска неизменившихся файлов
+    price_etag = models.CharField(max_length=200, blank=True, verbose_name='ETag прайса')
+    price_last_modified = models.CharField(max_length=100, blank=True, verbose_name='Last-Modified прайса')
+    price_hash = models.CharField(max_length=64, blank=True, verbose_name='Хэш файла прайса')
+    goods_hash = models.CharField(max_length=64, blank=True, verbose_name='Хэш содержимого прайса')
+
     class Meta:
         db_table = 'shops'
         verbose_name = 'Магазин'
@@ -144,6 +169,10 @@ class Products(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = 'Список продуктов'
         ordering = ('-name',)
+        indexes = [
+            # поиск товаров по названию при импорте прайса
+            models.Index(fields=['name', 'category_id'], name='products_name_category_idx'),
+        ]
 
 
 class ProductsInfo(models.Model):
@@ -161,6 +190,15 @@ class ProductsInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_id', 'shop_id', 'external_id'], name='unique_product_info'),
         ]
+        indexes = [
+            # сопоставление строк прайса с предложениями магазина при импорте
+            models.Index(fields=['shop_id', 'external_id'], name='products_info_shop_ext_idx'),
+            # постраничная выдача каталога по ключу (price, id) и (quantity, id), в том числе внутри магазина;
+            # фильтры price_min/price_max и in_stock идут по тем же индексам
+            models.Index(fields=['price', 'id'], name='products_info_price_idx'),
+            models.Index(fields=['shop_id', 'price', 'id'], name='products_info_shop_price_idx'),
+            models.Index(fields=['quantity', 'id'], name='products_info_quantity_idx'),
+        ]
 
 
 class Parameters(models.Model):
@@ -181,6 +219,8 @@ class ProductParameter(models.Model):
                                      related_name='product_parameters', on_delete=models.CASCADE)
 
     value = models.CharField(max_length=100, verbose_name='Значение параметра')
+    # значение как число, если оно числовое - для фильтра по диапазону
+    numeric_value = models.FloatField(null=True, blank=True, verbose_name='Числовое значение параметра')
 
     class Meta:
         db_table = 'product_parameter'
@@ -189,6 +229,30 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_info_id', 'parameter_id'], name='unique_product_parameter'),
         ]
+        indexes = [
+            # фильтр товаров по значению параметра и по диапазону числового значения
+            models.Index(fields=['parameter_id', 'value'], name='product_parameter_value_idx'),
+            models.Index(fields=['parameter_id', 'numeric_value'], name='product_parameter_number_idx'),
+        ]
+
+
+class CatalogChanges(models.Model):
+    """
+    Журнал изменений предложений каталога для дельта-синхронизации клиентов.
+    Изменения параметров записываются как изменение их предложения.
+    Ссылки хранятся числами, а не внешними ключами, чтобы запись пережила удаление предложения
+    """
+    version = models.BigAutoField(primary_key=True, verbose_name='Версия')
+    shop_id = models.PositiveIntegerField(verbose_name='Магазин')
+    product_info_id = models.PositiveIntegerField(verbose_name='Информация о продукте')
+    action = models.CharField(choices=CHANGE_ACTION_CHOICES, max_length=10, verbose_name='Действие')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Время изменения')
+
+    class Meta:
+        db_table = 'catalog_changes'
+        verbose_name = 'Изменение каталога'
+        verbose_name_plural = 'Журнал изменений каталога'
+        ordering = ('version',)
 
 
 class Orders(models.Model):
@@ -200,11 +264,21 @@ class Orders(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(choices=STATE_CHOICES, max_length=20, verbose_name='Статус')
     contact = models.ForeignKey(Contacts, verbose_name='Контакт', null=True, on_delete=models.CASCADE)
+    # итоги по позициям, пересчитываются вместе с изменением корзины (basket.update_order_totals)
+    total_sum = models.PositiveBigIntegerField(default=0, verbose_name='Сумма заказа')
+    items_count = models.PositiveIntegerField(default=0, verbose_name='Число позиций')
+    # до этого времени новый заказ держит товар на складе, затем отменяется (reservations.release_expired)
+    reserved_until = models.DateTimeField(null=True, blank=True, verbose_name='Резерв до')
+    # товар заказа списан со склада (reservations.checkout) и ещё не возвращён отменой
+    stock_reserved = models.BooleanField(default=False, editable=False, verbose_name='Товар зарезервирован')
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = "Заказы"
         ordering = ('-date',)
+        indexes = [
+            models.Index(fields=['status', 'reserved_until'], name='orders_reserved_until_idx'),
+        ]
 
 
 class OrderItems(models.Model):
@@ -212,6 +286,8 @@ class OrderItems(models.Model):
     product_info_id = models.ForeignKey(ProductsInfo, verbose_name='Информация о продукте',
                                         related_name='ordered_items', on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
+    # цена предложения на момент изменения корзины, при оформлении заказа фиксируется
+    price = models.PositiveIntegerField(default=0, verbose_name='Цена')
 
     class Meta:
         verbose_name = 'Заказанный товар'
@@ -221,6 +297,60 @@ class OrderItems(models.Model):
         ]
 
 
+class ShopOrders(models.Model):
+    """
+    Часть заказа одного поставщика (отдельная поставка): создаётся при оформлении заказа по магазинам его позиций.
+    Статус и дата повторяют заказ, сумма и число позиций - только по товарам магазина
+    """
+    order_id = models.ForeignKey(Orders, verbose_name='Заказ', related_name='shop_orders', on_delete=models.CASCADE)
+    shop_id = models.ForeignKey(Shops, verbose_name='Магазин', related_name='shop_orders', on_delete=models.CASCADE)
+    status = models.CharField(choices=STATE_CHOICES, max_length=20, verbose_name='Статус')
+    date = models.DateTimeField(verbose_name='Дата заказа')
+    total_sum = models.PositiveBigIntegerField(default=0, verbose_name='Сумма по магазину')
+    items_count = models.PositiveIntegerField(default=0, verbose_name='Число позиций магазина')
+
+    class Meta:
+        verbose_name = 'Заказ поставщику'
+        verbose_name_plural = 'Заказы поставщикам'
+        constraints = [
+            models.UniqueConstraint(fields=['order_id', 'shop_id'], name='unique_shop_order'),
+        ]
+        indexes = [
+            # заказы магазина по статусу и дате (PartnerOrders)
+            models.Index(fields=['shop_id', 'status', 'date'], name='shop_orders_status_date_idx'),
+            # все заказы магазина по дате, без фильтра по статусу
+            models.Index(fields=['shop_id', 'date'], name='shop_orders_date_idx'),
+        ]
+
+
+class ImportJobs(models.Model):
+    user_id = models.ForeignKey(Users, verbose_name='Пользователь', related_name='import_jobs',
+                                on_delete=models.CASCADE)
+    url = models.URLField(max_length=500, blank=True, verbose_name='Ссылка на прайс')
+    # прайс, загруженный напрямую, хранится как получен (возможно сжатым) до окончания импорта
+    file = models.FileField(upload_to='imports/%Y/%m/%d', blank=True, verbose_name='Файл прайса')
+    content_encoding = models.CharField(max_length=20, blank=True, verbose_name='Сжатие файла прайса')
+    diff = models.BooleanField(default=False, verbose_name='Применить только изменения')
+    phase = models.CharField(choices=IMPORT_PHASE_CHOICES, max_length=20, default='queued', verbose_name='Этап')
+    rows_processed = models.PositiveIntegerField(default=0, verbose_name='Обработано товаров')
+    # итоги импорта: создано, обновлено и снято с продажи предложений (в полной перезагрузке - только created)
+    created = models.PositiveIntegerField(default=0, verbose_name='Создано предложений')
+    updated = models.PositiveIntegerField(default=0, verbose_name='Обновлено предложений')
+    retired = models.PositiveIntegerField(default=0, verbose_name='Снято с продажи')
+    skipped = models.CharField(choices=IMPORT_SKIP_CHOICES, max_length=20, blank=True,
+                               verbose_name='Причина пропуска импорта')
+    errors = models.TextField(blank=True, verbose_name='Ошибки')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Запущена')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершена')
+
+    class Meta:
+        db_table = 'import_jobs'
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = 'Задачи импорта'
+        ordering = ('-created_at',)
+
+
 class ConfirmEmailToken(models.Model):
     class Meta:
         verbose_name = 'Токен подтверждения Email'
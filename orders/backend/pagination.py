@@ -0,0 +1,169 @@
+"""
+Постраничная выдача каталога и заказов поставщика по ключу (keyset).
+
+Страница выбирается условием "после последней строки предыдущей страницы" по индексируемому упорядочиванию
+(id), (price, id) или (quantity, id), у заказов поставщика - (date, id), вместо OFFSET, поэтому дальние страницы
+стоят столько же, сколько первая. Позиция передаётся клиенту непрозрачным курсором в ссылке next.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+from functools import partial
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PaginationError(ValueError):
+    """
+    Неизвестное упорядочивание или неправильный курсор, представления отвечают на неё 400
+    """
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу: ?ordering=id|price|-price|quantity|-quantity, ?page_size=, ?cursor= из ссылки next
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    # последним полем всегда идёт id, он делает упорядочивание однозначным
+    orderings = {
+        'id': ('id',),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        'quantity': ('quantity', 'id'),
+        '-quantity': ('-quantity', '-id'),
+    }
+    default_ordering = 'id'
+    invalid_cursor_message = 'Неправильный курсор'
+
+    def __init__(self):
+        self.request = None
+        self.ordering = self.default_ordering
+        self.next_position = None
+
+    def prepare(self, request):
+        """
+        Разбирает параметры страницы, возвращает (поля упорядочивания, позиция курсора или None, размер страницы)
+        """
+        self.request = request
+        self.ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if self.ordering not in self.orderings:
+            raise PaginationError(f'Неизвестное упорядочивание: {self.ordering}')
+        return self.orderings[self.ordering], self.decode_cursor(request), self.get_page_size(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        fields, position, page_size = self.prepare(request)
+
+        queryset = queryset.order_by(*fields)
+        if position is not None:
+            queryset = queryset.filter(self.after(fields, position))
+
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            last = page[-1]
+            # страница - объекты моделей или строки values()
+            value = last.__getitem__ if isinstance(last, dict) else partial(getattr, last)
+            self.next_position = [self.cursor_value(value(field.lstrip('-'))) for field in fields]
+        return page
+
+    @staticmethod
+    def cursor_value(value):
+        """
+        Значение ключа в курсоре (JSON)
+        """
+        return value
+
+    def parse_position(self, position):
+        """
+        Позиция из курсора или ValueError
+        """
+        if not all(isinstance(value, int) for value in position):
+            raise ValueError(position)
+        return position
+
+    @staticmethod
+    def after(fields, position):
+        """
+        Условие "строка после position" для составного ключа: (a > x) OR (a = x AND b > y) ...
+        """
+        query = Q()
+        for index in range(len(fields) - 1, -1, -1):
+            name = fields[index].lstrip('-')
+            lookup = 'lt' if fields[index].startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': position[index]})
+            query = condition if index == len(fields) - 1 else condition | (Q(**{name: position[index]}) & query)
+        return query
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, settings.REST_FRAMEWORK['PAGE_SIZE']))
+        except ValueError:
+            page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            ordering, position = json.loads(urlsafe_b64decode(cursor.encode()))
+        except (BinasciiError, ValueError, TypeError):
+            raise PaginationError(self.invalid_cursor_message)
+        # курсор действителен только для того упорядочивания, в котором он выдан
+        if ordering != self.ordering or not isinstance(position, list) or \
+                len(position) != len(self.orderings[ordering]):
+            raise PaginationError(self.invalid_cursor_message)
+        try:
+            return self.parse_position(position)
+        except (ValueError, TypeError):
+            raise PaginationError(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        return urlsafe_b64encode(json.dumps([self.ordering, position]).encode()).decode()
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ShopOrdersPagination(KeysetPagination):
+    """
+    Заказы поставщика от новых к старым: ключ (date, id), дата в курсоре - строкой ISO 8601
+    """
+    orderings = {
+        '-date': ('-date', '-id'),
+    }
+    default_ordering = '-date'
+
+    @staticmethod
+    def cursor_value(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    def parse_position(self, position):
+        date, order_id = position
+        if not isinstance(date, str) or not isinstance(order_id, int):
+            raise ValueError(position)
+        return [datetime.fromisoformat(date), order_id]
@@ -0,0 +1,102 @@
+"""
+Потоковый разбор YAML-прайса поставщика.
+
+Файл читается из потока кусками и разбирается по событиям парсера (libyaml, если он доступен),
+поэтому в памяти одновременно находится только один товар, а не весь прайс.
+"""
+from yaml import ScalarNode, SequenceNode, MappingNode, ScalarEvent, SequenceStartEvent, SequenceEndEvent, \
+    MappingStartEvent, MappingEndEvent, StreamStartEvent, DocumentStartEvent
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+class PriceImportError(Exception):
+    """
+    Ошибка в содержимом прайса
+    """
+
+
+class PriceList:
+    """
+    Прайс из потока: shop и categories читаются сразу при создании,
+    товары отдаются по одному генератором goods()
+    """
+
+    def __init__(self, stream):
+        self.loader = SafeLoader(stream)
+        self.shop = None
+        self.categories = []
+        self._goods_started = False
+        self._read_header()
+
+    def _expect(self, *event_classes):
+        event = self.loader.get_event()
+        if not isinstance(event, event_classes):
+            raise PriceImportError(f'Неожиданная структура прайса: {event}')
+        return event
+
+    def _read_header(self):
+        self._expect(StreamStartEvent)
+        self._expect(DocumentStartEvent)
+        self._expect(MappingStartEvent)
+        while not self.loader.check_event(MappingEndEvent):
+            key = self._expect(ScalarEvent).value
+            if key == 'goods':
+                self._expect(SequenceStartEvent)
+                self._goods_started = True
+                break
+            value = self._read_value()
+            if key == 'shop':
+                self.shop = value
+            elif key == 'categories':
+                self.categories = value
+        if self.shop is None:
+            raise PriceImportError('В прайсе до списка goods должно быть указано поле shop')
+
+    def goods(self):
+        """
+        Генератор товаров прайса
+        """
+        if not self._goods_started:
+            return
+        while not self.loader.check_event(SequenceEndEvent):
+            yield self._read_value()
+        self.loader.get_event()
+        self._goods_started = False
+
+    def _read_value(self):
+        # construct_document сбрасывает кэш построенных объектов загрузчика, память не растёт от товара к товару
+        return self.loader.construct_document(self._compose_node())
+
+    def _compose_node(self):
+        event = self.loader.get_event()
+        if isinstance(event, ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(ScalarNode, event.value, event.implicit)
+            return ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+
+        if isinstance(event, SequenceStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(SequenceNode, None, event.implicit)
+            items = []
+            while not self.loader.check_event(SequenceEndEvent):
+                items.append(self._compose_node())
+            end_event = self.loader.get_event()
+            return SequenceNode(tag, items, event.start_mark, end_event.end_mark, flow_style=event.flow_style)
+
+        if isinstance(event, MappingStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(MappingNode, None, event.implicit)
+            pairs = []
+            while not self.loader.check_event(MappingEndEvent):
+                pairs.append((self._compose_node(), self._compose_node()))
+            end_event = self.loader.get_event()
+            return MappingNode(tag, pairs, event.start_mark, end_event.end_mark, flow_style=event.flow_style)
+
+        raise PriceImportError(f'Неподдерживаемый элемент прайса: {event}')
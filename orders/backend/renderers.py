@@ -0,0 +1,70 @@
+"""
+Быстрый JSON для ответов API.
+
+dumps кодирует через orjson, если он установлен, иначе через json из стандартной библиотеки, и в обоих случаях
+даёт те же байты, что JSONRenderer из DRF: компактный JSON в UTF-8 с экранированными U+2028 и U+2029.
+Типы, которых orjson не знает (Decimal, ленивые строки переводов, datetime вне сериализаторов), кодирует
+JSONEncoder из DRF. Им пользуются FastJSONRenderer для APIView, JsonResponse для ответов со статусом
+и каталог в памяти (catalog_index).
+"""
+import json
+
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+def _escape_separators(content):
+    # U+2028 и U+2029 допустимы в JSON, но не в строках JavaScript; DRF их экранирует
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+if orjson is not None:
+    _options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(data):
+        """
+        JSON в байтах в том же виде, что у JSONRenderer из DRF
+        """
+        return _escape_separators(orjson.dumps(data, default=_encoder.default, option=_options))
+else:
+    def dumps(data):
+        """
+        JSON в байтах в том же виде, что у JSONRenderer из DRF
+        """
+        return _escape_separators(json.dumps(data, cls=JSONEncoder, ensure_ascii=False,
+                                             separators=(',', ':')).encode())
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer через dumps; запросы с отступами (indent в Accept) обрабатывает JSONRenderer
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class JsonResponse(HttpResponse):
+    """
+    Замена django.http.JsonResponse с кодированием через dumps
+    """
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False.')
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,138 @@
+"""
+Резерв товара на складе при оформлении заказа.
+
+Оформление списывает остаток условным UPDATE ... SET quantity = quantity - n WHERE id = ... AND quantity >= n
+по каждой позиции: проверка и списание - один оператор, поэтому два покупателя не могут продать одну и ту же
+последнюю единицу, а обновление не теряется. Если хотя бы одной позиции не хватило, транзакция откатывается
+целиком. Строки предложений блокируются в порядке возрастания id, и любые два оформления (и отмены) берут общие
+блокировки в одном порядке, поэтому взаимных блокировок между ними нет.
+
+Первым оператором транзакции корзина переводится в статус new условным UPDATE: повторное оформление той же
+корзины ничего не найдёт, а в SQLite транзакция сразу получает блокировку на запись и ждёт её (timeout
+соединения), а не получает "database is locked" при попытке повысить блокировку чтения.
+
+Новый заказ держит товар до reserved_until (ORDER_RESERVATION_TIMEOUT). Отмена заказа покупателем или в админке
+и истечение резерва (release_expired, периодическая задача Celery) возвращают товар на склад. Отмена - тоже
+условный UPDATE статуса, поэтому товар возвращает только тот, кто заказ действительно отменил. Возвращается
+только товар, списанный при оформлении (флаг stock_reserved, сбрасывается тем же UPDATE): заказы, оформленные
+до появления резерва, ничего на склад не добавляют.
+
+Остаток - часть предложения в каталоге (в том числе фильтр in_stock), поэтому списание и возврат записываются
+в журнал изменений (log_changes) и увеличивают общую версию каталога и версии магазинов заказа - одним
+увеличением на заказ.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .basket import snapshot_prices, create_shop_orders
+from .cache import bump_catalog_version
+from .changes import log_changes
+from .models import Orders, OrderItems, ProductsInfo, ShopOrders
+
+# сколько новый заказ держит товар, пока магазин его не подтвердит
+ORDER_RESERVATION_TIMEOUT = 24 * 60 * 60
+# статусы, в которых заказ держит товар и может быть отменён
+RESERVED_STATES = ('new', 'confirmed')
+
+
+class InsufficientStock(Exception):
+    """
+    Не хватило остатка; items - id предложений, которых не хватило
+    """
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.items = items
+
+
+def reservation_timeout():
+    return timedelta(seconds=getattr(settings, 'ORDER_RESERVATION_TIMEOUT', ORDER_RESERVATION_TIMEOUT))
+
+
+def order_lines(order_id):
+    """
+    (id предложения, количество, id магазина) позиций заказа в порядке блокировки - по id предложения
+    """
+    return list(OrderItems.objects.filter(order_id=order_id).order_by('product_info_id').values_list(
+        'product_info_id', 'quantity', 'product_info_id__shop_id'))
+
+
+def log_stock_changes(lines):
+    shops = {}
+    for info_id, _, shop_id in lines:
+        shops.setdefault(shop_id, []).append(info_id)
+    for shop_id, info_ids in shops.items():
+        log_changes(shop_id, info_ids, bump=False)
+    bump_catalog_version(*shops)
+
+
+def reserve_stock(order_id):
+    """
+    Списывает со склада количество позиций заказа order_id; InsufficientStock, если чего-то не хватило.
+    Вызывается внутри транзакции, которую при ошибке нужно откатить
+    """
+    lines = order_lines(order_id)
+    missing = [info_id for info_id, quantity, _ in lines
+               if not ProductsInfo.objects.filter(id=info_id, quantity__gte=quantity).update(
+                   quantity=F('quantity') - quantity)]
+    if missing:
+        raise InsufficientStock(missing)
+    log_stock_changes(lines)
+
+
+def release_stock(order_id):
+    """
+    Возвращает на склад количество позиций заказа order_id
+    """
+    lines = order_lines(order_id)
+    for info_id, quantity, _ in lines:
+        ProductsInfo.objects.filter(id=info_id).update(quantity=F('quantity') + quantity)
+    log_stock_changes(lines)
+
+
+def checkout(user_id, order_id, contact_id):
+    """
+    Оформляет корзину order_id пользователя user_id: фиксирует цены, резервирует товар, делит заказ по магазинам.
+    Возвращает False, если такой корзины нет (или она пуста), InsufficientStock - если не хватило товара
+    """
+    with transaction.atomic():
+        is_updated = Orders.objects.filter(user_id_id=user_id, id=order_id, status='basket', items_count__gt=0).update(
+            status='new', contact_id=contact_id, date=timezone.now(),
+            reserved_until=timezone.now() + reservation_timeout(), stock_reserved=True)
+        if not is_updated:
+            return False
+        reserve_stock(order_id)
+        snapshot_prices(order_id)
+        create_shop_orders([order_id])
+    return True
+
+
+def cancel_order(order_id, states=RESERVED_STATES, **filters):
+    """
+    Отменяет заказ order_id, если он в одном из статусов states, и возвращает на склад зарезервированный товар.
+    filters ограничивают заказ (например, владельцем). Возвращает, был ли заказ отменён
+    """
+    with transaction.atomic():
+        orders = Orders.objects.filter(id=order_id, status__in=states, **filters)
+        is_released = orders.filter(stock_reserved=True).update(
+            status='canceled', reserved_until=None, stock_reserved=False)
+        is_updated = is_released or orders.update(status='canceled', reserved_until=None)
+        if is_updated:
+            ShopOrders.objects.filter(order_id=order_id).update(status='canceled')
+        if is_released:
+            release_stock(order_id)
+    return bool(is_updated)
+
+
+def release_expired(now=None):
+    """
+    Отменяет новые заказы с истёкшим резервом, каждый в своей транзакции. Возвращает число отменённых
+    """
+    now = now or timezone.now()
+    expired = Orders.objects.filter(status='new', reserved_until__lt=now).values_list('id', flat=True)
+    return sum(cancel_order(order_id, ('new',), reserved_until__lt=now) for order_id in list(expired))
+
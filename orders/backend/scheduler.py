@@ -0,0 +1,107 @@
+"""
+Параллельный импорт прайсов нескольких магазинов.
+
+Задачи раскладываются по очередям магазинов и выдаются воркерам по кругу, поэтому поставщик с большим
+числом или объёмом прайсов не занимает весь пул. Задачи одного магазина никогда не выполняются одновременно:
+в процессе их разводит очередь, а между процессами - блокировка строки магазина (importer.import_from_url).
+SQLite допускает только одного писателя, поэтому там запись в базу идёт под общей блокировкой пула,
+а скачивание прайсов - параллельно.
+"""
+from collections import OrderedDict, deque
+from threading import Condition, Lock, Thread
+
+from django.db import connection
+
+from .tasks import do_import
+
+
+class FairQueue:
+    """
+    Очередь с обходом магазинов по кругу и не более чем одной выданной задачей на магазин
+    """
+
+    def __init__(self):
+        self.queues = OrderedDict()
+        self.running = set()
+
+    def put(self, key, item):
+        self.queues.setdefault(key, deque()).append(item)
+
+    def get(self):
+        """
+        Следующая задача свободного магазина или None, если таких сейчас нет
+        """
+        for key, queue in self.queues.items():
+            if key not in self.running:
+                item = queue.popleft()
+                if queue:
+                    self.queues.move_to_end(key)
+                else:
+                    del self.queues[key]
+                self.running.add(key)
+                return key, item
+        return None
+
+    def done(self, key):
+        self.running.discard(key)
+
+    def finished(self):
+        return not self.queues and not self.running
+
+
+class ImportScheduler:
+    """
+    Пул воркеров, выполняющих задачи ImportJobs
+    """
+
+    def __init__(self, concurrency):
+        self.concurrency = max(1, concurrency)
+        self.queue = FairQueue()
+        self.condition = Condition()
+        self.results = {}
+        # SQLite допускает только одного писателя, там задачи пишут в базу по одной
+        self.write_lock = Lock() if connection.vendor == 'sqlite' else None
+
+    def submit(self, job):
+        with self.condition:
+            self.queue.put(job.user_id_id, job)
+            self.condition.notify()
+
+    def run(self):
+        """
+        Выполняет все поставленные задачи, возвращает {id задачи: результат do_import}
+        """
+        workers = [Thread(target=self.worker) for _ in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return self.results
+
+    def worker(self):
+        try:
+            while True:
+                with self.condition:
+                    item = self.queue.get()
+                    while item is None:
+                        if self.queue.finished():
+                            return
+                        self.condition.wait()
+                        item = self.queue.get()
+                key, job = item
+                try:
+                    self.results[job.id] = self.run_job(job)
+                finally:
+                    with self.condition:
+                        self.queue.done(key)
+                        self.condition.notify_all()
+        finally:
+            connection.close()
+
+    def run_job(self, job):
+        try:
+            # функция задачи вызывается без обёртки Celery: её стек запросов не рассчитан на потоки
+            return do_import.run(job.id, write_lock=self.write_lock)
+        except Exception as error:
+            # ошибка уже записана в задачу, остальные задачи пула продолжают работу
+            return repr(error)
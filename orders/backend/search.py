@@ -0,0 +1,160 @@
+"""
+Полнотекстовый поиск и подсказки по названиям товаров.
+
+Бэкенд выбирается по базе (настройка SEARCH_BACKEND переопределяет выбор):
+    SqliteSearch - FTS5-таблица products_fts с индексом префиксов, совпадения ранжируются по bm25;
+    PostgresSearch - tsvector с ts_rank для поиска и pg_trgm для подсказок;
+    BasicSearch - icontains без индекса, для остальных баз.
+Индексы создаёт миграция 0014_product_search, а в актуальном состоянии их держат триггеры на таблице products,
+поэтому импорт прайса (в том числе массовые вставки) ничего отдельно не обновляет.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .models import Products
+
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SUGGEST_LIMIT = 10
+# сколько лучших по bm25 совпадений FTS5 досортировывается для ответа
+SEARCH_WINDOW = 200
+
+WORD = re.compile(r'\w+')
+
+# предложение работающего магазина для товара с id из внешнего запроса
+ACTIVE_OFFER_SQL = ('EXISTS (SELECT 1 FROM products_info INNER JOIN shops ON shops.id = products_info.shop_id_id '
+                    'WHERE products_info.product_id_id = {product_id} AND shops.status_work)')
+
+
+def words(query):
+    return WORD.findall(query.lower())
+
+
+def rank(terms, name):
+    """
+    Ключ сортировки по релевантности: больше слов запроса совпали целиком, раньше в названии первое слово
+    запроса, короче название
+    """
+    name_words = words(name)
+    exact = sum(term in name_words for term in terms)
+    first = next((position for position, word in enumerate(name_words) if word.startswith(terms[0])),
+                 len(name_words))
+    return -exact, first, len(name)
+
+
+class BasicSearch:
+    """
+    Поиск по вхождению всех слов запроса, без ранжирования по релевантности
+    """
+
+    def search(self, query, limit):
+        """
+        id товаров, у которых есть предложения работающих магазинов, по убыванию релевантности
+        """
+        queryset = Products.objects.filter(productsinfo__shop_id__status_work=True)
+        for word in words(query):
+            queryset = queryset.filter(name__icontains=word)
+        return list(queryset.order_by('name', 'id').values_list('id', flat=True).distinct()[:limit])
+
+    def suggest(self, query, limit):
+        """
+        Названия товаров с предложениями работающих магазинов для подсказки по началу запроса
+        """
+        return unique(Products.objects.filter(productsinfo__shop_id__status_work=True, name__istartswith=query.strip())
+                      .order_by('name').values_list('name', flat=True).distinct()[:limit * 2], limit)
+
+
+class SqliteSearch(BasicSearch):
+    """
+    SQLite FTS5: каждое слово запроса ищется как префикс.
+    Совпадения упорядочивает сама FTS5 по bm25 (столбец rank) до LIMIT, поэтому в окно SEARCH_WINDOW попадают
+    самые релевантные товары, а не первые по id. Равные по bm25 досортировываются по названию (rank)
+    """
+
+    @staticmethod
+    def match(query):
+        return ' '.join(f'"{word}"*' for word in words(query))
+
+    def search(self, query, limit):
+        match = self.match(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT rowid, name, rank FROM products_fts WHERE products_fts MATCH %s AND '
+                           + ACTIVE_OFFER_SQL.format(product_id='products_fts.rowid') + ' ORDER BY rank LIMIT %s',
+                           [match, SEARCH_WINDOW])
+            rows = cursor.fetchall()
+        terms = words(query)
+        rows.sort(key=lambda row: (row[2],) + rank(terms, row[1]) + (row[0],))
+        return [product_id for product_id, _, _ in rows[:limit]]
+
+    def suggest(self, query, limit):
+        match = self.match(query)
+        if not match:
+            return []
+        # столбец name в FTS5 поставлен первым, поэтому "^" привязывает первое слово к началу названия
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT name, rank FROM products_fts WHERE products_fts MATCH %s AND '
+                           + ACTIVE_OFFER_SQL.format(product_id='products_fts.rowid') + ' ORDER BY rank LIMIT %s',
+                           ['^' + match, SEARCH_WINDOW])
+            rows = cursor.fetchall()
+        terms = words(query)
+        names = [name for name, _ in sorted(rows, key=lambda row: (row[1],) + rank(terms, row[0]) + (row[0],))]
+        return unique(names, limit)
+
+
+class PostgresSearch(BasicSearch):
+    """
+    PostgreSQL: to_tsvector('russian', name) с префиксным to_tsquery для поиска,
+    триграммное сходство (pg_trgm) для подсказок
+    """
+
+    @staticmethod
+    def tsquery(query):
+        return ' & '.join(f"'{word}':*" for word in words(query))
+
+    def search(self, query, limit):
+        tsquery = self.tsquery(query)
+        if not tsquery:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM products "
+                           "WHERE to_tsvector('russian', name) @@ to_tsquery('russian', %s) AND "
+                           + ACTIVE_OFFER_SQL.format(product_id='products.id')
+                           + " ORDER BY ts_rank(to_tsvector('russian', name), to_tsquery('russian', %s)) DESC, id "
+                           'LIMIT %s', [tsquery, tsquery, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def suggest(self, query, limit):
+        query = query.strip()
+        if not query:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT name FROM products WHERE (name ILIKE %s OR name %% %s) AND '
+                           + ACTIVE_OFFER_SQL.format(product_id='products.id')
+                           + ' ORDER BY similarity(name, %s) DESC LIMIT %s',
+                           [query.replace('%', r'\%').replace('_', r'\_') + '%', query, query, limit * 2])
+            return unique([row[0] for row in cursor.fetchall()], limit)
+
+
+def unique(names, limit):
+    """
+    Названия без повторов (одинаковые товары бывают в разных категориях), не больше limit
+    """
+    return list(dict.fromkeys(names))[:limit]
+
+
+BACKENDS = {
+    'sqlite': SqliteSearch,
+    'postgresql': PostgresSearch,
+}
+
+
+def get_search_backend():
+    backend = getattr(settings, 'SEARCH_BACKEND', None)
+    if backend:
+        return import_string(backend)()
+    return BACKENDS.get(connection.vendor, BasicSearch)()
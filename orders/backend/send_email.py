@@ -52,7 +52,7 @@ def new_user_registered(user_id):
     msg.send()
 
 
-# @receiver(new_order)
+@celery_tasks.task
 def new_order(user_id, **kwargs):
     """
     отправяем письмо при изменении статуса заказа
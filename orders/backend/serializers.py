@@ -1,6 +1,7 @@
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Users, Contacts, ConfirmEmailToken, Categories, Shops, OrderItems, Products, ProductsInfo, \
-    ProductParameter, Orders, Parameters
+    ProductParameter, Orders, Parameters, ImportJobs
 from django.utils.translation import gettext_lazy as _
 
 
@@ -104,11 +105,25 @@ class OrderItemCreateSerializer(OrderItemSerializer):
 class OrdersSerializer(serializers.ModelSerializer):
     order_id = OrderItemCreateSerializer(read_only=True, many=True)
 
-    total_sum = serializers.IntegerField()
     contact = ContactsSerializer(read_only=True)
 
     class Meta:
         model = Orders
-        fields = ('order_id', 'ordered_items', 'status', 'date', 'total_sum', 'contact',)
+        fields = ('order_id', 'ordered_items', 'status', 'date', 'total_sum', 'items_count', 'contact',)
         read_only_fields = ('id',)
 
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJobs
+        fields = ('id', 'url', 'diff', 'phase', 'rows_processed', 'rows_per_second', 'created', 'updated', 'retired',
+                  'skipped', 'errors', 'created_at', 'started_at', 'finished_at',)
+        read_only_fields = fields
+
+    def get_rows_per_second(self, job):
+        if not job.started_at:
+            return None
+        seconds = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+        return round(job.rows_processed / seconds, 1) if seconds > 0 else None
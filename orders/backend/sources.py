@@ -0,0 +1,116 @@
+"""
+Получение файла прайса от поставщика.
+
+Тело ответа или загрузки копируется кусками во временный файл (в памяти до SPOOL_MAX_MEMORY, дальше на диске)
+с одновременным подсчётом хэша содержимого, поэтому неизменившийся прайс можно распознать без разбора.
+Сжатые прайсы (gzip, zstd) хранятся как есть и распаковываются потоком при чтении парсером.
+"""
+import gzip
+from hashlib import sha256
+from tempfile import SpooledTemporaryFile
+
+from requests import get
+
+from .price_list import PriceImportError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+# сигнатуры сжатых файлов для загрузок без Content-Encoding
+MAGIC_NUMBERS = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+
+
+class PriceSource:
+    """
+    Загруженный прайс: временный файл и сведения для условного запроса в следующий раз
+    """
+
+    def __init__(self, file=None, content_hash='', etag='', last_modified='', not_modified=False):
+        self.file = file
+        self.content_hash = content_hash
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def spool(chunks):
+    """
+    Копирует поток кусков во временный файл, возвращает файл (с позицией в начале) и sha256 содержимого
+    """
+    file = SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    content_hash = sha256()
+    for chunk in chunks:
+        content_hash.update(chunk)
+        file.write(chunk)
+    file.seek(0)
+    return file, content_hash.hexdigest()
+
+
+def fetch_price(url, etag='', last_modified=''):
+    """
+    Условный GET прайса: при совпадении ETag/Last-Modified сервер отвечает 304 и файл не скачивается
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    response = get(url, stream=True, headers=headers)
+    with response:
+        if response.status_code == 304:
+            return PriceSource(etag=etag, last_modified=last_modified, not_modified=True)
+        response.raise_for_status()
+        file, content_hash = spool(response.iter_content(CHUNK_SIZE))
+        return PriceSource(file, content_hash, etag=response.headers.get('ETag', ''),
+                           last_modified=response.headers.get('Last-Modified', ''))
+
+
+def check_encoding(content_encoding):
+    """
+    Проверяет, что прайс в этой кодировке можно распаковать
+    """
+    if content_encoding in ('', 'identity', 'gzip', 'x-gzip'):
+        return
+    if content_encoding == 'zstd':
+        if zstandard is None:
+            raise PriceImportError('Сжатие zstd не поддерживается: не установлен пакет zstandard')
+        return
+    raise PriceImportError(f'Неподдерживаемое сжатие прайса: {content_encoding}')
+
+
+def detect_encoding(file):
+    """
+    Определяет сжатие файла по первым байтам, позиция в файле не меняется
+    """
+    position = file.tell()
+    head = file.read(4)
+    file.seek(position)
+    for magic, content_encoding in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return content_encoding
+    return ''
+
+
+def decompress(file, content_encoding):
+    """
+    Поток распакованного содержимого file без распаковки всего файла в память
+    """
+    check_encoding(content_encoding)
+    if content_encoding in ('gzip', 'x-gzip'):
+        return gzip.GzipFile(fileobj=file)
+    if content_encoding == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(file, closefd=False)
+    return file
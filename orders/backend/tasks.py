@@ -0,0 +1,86 @@
+from contextlib import nullcontext
+
+from django.core.cache import cache
+from django.utils import timezone
+from requests import RequestException
+from yaml import YAMLError
+
+from celery_sender import celery_tasks
+
+from .importer import import_from_url, import_from_file, PriceImportError
+from .models import ImportJobs
+from .reservations import release_expired
+
+# сколько хранить промежуточный прогресс задачи, если воркер упал, не дойдя до конца
+PROGRESS_TIMEOUT = 60 * 60
+
+
+def job_progress_key(job_id):
+    return f'import_job:{job_id}:progress'
+
+
+def apply_job_progress(job):
+    """
+    Подставляет в задачу текущий прогресс.
+    Пока импорт идёт, его транзакция не зафиксирована, поэтому прогресс хранится в кэше, а не в таблице
+    (кэш должен быть общим для веб-процессов и воркеров, см. checks.check_shared_cache)
+    """
+    if job.phase == 'downloading':
+        progress = cache.get(job_progress_key(job.id))
+        if progress:
+            job.phase = progress['phase']
+            job.rows_processed = progress['rows_processed']
+    return job
+
+
+@celery_tasks.task
+def do_import(job_id, write_lock=None):
+    """
+    Импорт прайса поставщика по задаче ImportJobs.
+    write_lock - блокировка на время записи в базу, ею ImportScheduler, вызывающий задачу напрямую,
+    разводит импорты на SQLite: под ней идут импорт и все обновления задачи, а скачивание - без неё
+    """
+    job = ImportJobs.objects.select_related('user_id').get(id=job_id)
+
+    def update_job(**fields):
+        with write_lock or nullcontext():
+            ImportJobs.objects.filter(id=job.id).update(**fields)
+
+    update_job(phase='downloading', started_at=timezone.now())
+
+    def progress(importer):
+        cache.set(job_progress_key(job.id), {'phase': 'importing', 'rows_processed': importer.rows_processed},
+                  PROGRESS_TIMEOUT)
+
+    try:
+        if job.file:
+            with job.file.open('rb') as file:
+                importer = import_from_file(job.user_id, file, job.content_encoding, diff=job.diff,
+                                            progress=progress, write_lock=write_lock)
+        else:
+            importer = import_from_url(job.user_id, job.url, diff=job.diff, progress=progress,
+                                       write_lock=write_lock)
+    except (RequestException, KeyError, PriceImportError, YAMLError) as error:
+        update_job(phase='failed', errors=str(error), finished_at=timezone.now())
+        return False
+    except Exception as error:
+        update_job(phase='failed', errors=repr(error), finished_at=timezone.now())
+        raise
+    finally:
+        cache.delete(job_progress_key(job.id))
+        if job.file:
+            job.file.storage.delete(job.file.name)
+            update_job(file='')
+
+    update_job(phase='done', rows_processed=importer.rows_processed, created=importer.created,
+               updated=importer.updated, retired=importer.retired, skipped=importer.skipped,
+               finished_at=timezone.now())
+    return True
+
+
+@celery_tasks.task
+def release_expired_reservations():
+    """
+    Отмена новых заказов с истёкшим резервом товара (CELERY_BEAT_SCHEDULE)
+    """
+    return release_expired()
@@ -1,3 +1,1468 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from hashlib import sha256
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import gzip
+from io import BytesIO, StringIO
+import json
+from multiprocessing import get_context
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest import skipIf
+from unittest.mock import patch
+from threading import Barrier, Thread
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.forms import model_to_dict
+from django.test import TestCase, TransactionTestCase, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from yaml import load as load_yaml, Loader
+
+from celery_sender import celery_tasks
+
+from .importer import PriceImporter, import_price, import_from_url
+from .price_list import PriceList, PriceImportError
+from .scheduler import FairQueue, ImportScheduler
+from .search import SEARCH_WINDOW
+from .sources import zstandard, fetch_price
+from .exporter import export_price
+from .checks import check_shared_cache
+from .cache import get_catalog_version
+from . import catalog_index
+from .benchmarks import generate_price_list, run_import_benchmark, create_orders, run_serialization_benchmark
+from .middleware import brotli
+from .renderers import dumps
+from .fast_serializers import serialize_offers, serialize_orders, serialize_shop_orders
+from .basket import update_order_totals
+from .reservations import checkout, cancel_order, release_expired, InsufficientStock
+from .admin import OrdersForm
+from .models import Users, Shops, Categories, Products, ProductsInfo, Parameters, ProductParameter, ImportJobs, \
+    Contacts, Orders, OrderItems, CatalogChanges, ShopOrders
+from .serializers import ProductInfoSerializer, OrdersSerializer, ContactsSerializer
+
+SHOP1_YAML = settings.BASE_DIR.parent / 'data' / 'shop1.yaml'
+# кэш в памяти процесса, а не общий файловый из настроек: тесты не видят ответов друг друга и прошлых запусков
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class PriceHandler(BaseHTTPRequestHandler):
+    """
+    Отдаёт файлы из PriceServer.files, поддерживает ETag и If-None-Match
+    """
+
+    def do_GET(self):
+        body = self.server.files.get(self.path.lstrip('/'))
+        if body is None:
+            self.send_error(404)
+            return
+        etag = f'"{sha256(body).hexdigest()}"' if self.server.etags else None
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-yaml')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PriceServer:
+    """
+    Локальный HTTP-сервер поставщика для тестов импорта
+    """
+    def __init__(self, etags=True):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PriceHandler)
+        self.server.files = {'shop1.yaml': SHOP1_YAML.read_bytes()}
+        self.server.etags = etags
+
+    @property
+    def files(self):
+        return self.server.files
+
+    def url(self, name):
+        return f'http://127.0.0.1:{self.server.server_port}/{name}'
+
+    def __enter__(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ShopOrderPartSerializer(serializers.ModelSerializer):
+    """
+    Эталон для fast_serializers: части заказа по магазинам в заказе покупателя
+    """
+    class Meta:
+        model = ShopOrders
+        fields = ('shop_id', 'status', 'total_sum', 'items_count',)
+
+
+class OrdersWithShopsSerializer(OrdersSerializer):
+    shops = ShopOrderPartSerializer(source='shop_orders', read_only=True, many=True)
+
+    class Meta(OrdersSerializer.Meta):
+        fields = OrdersSerializer.Meta.fields + ('shops',)
+
+
+class ShopOrdersSerializer(serializers.ModelSerializer):
+    """
+    Эталон для fast_serializers: заказ поставщику только с позициями его магазина
+    """
+    id = serializers.IntegerField(source='order_id_id', read_only=True)
+    ordered_items = serializers.SerializerMethodField()
+    contact = ContactsSerializer(source='order_id.contact', read_only=True)
+
+    class Meta:
+        model = ShopOrders
+        fields = ('id', 'ordered_items', 'status', 'date', 'total_sum', 'items_count', 'contact',)
+
+    def get_ordered_items(self, shop_order):
+        return [item.id for item in shop_order.order_id.ordered_items.all()
+                if item.product_info_id.shop_id_id == shop_order.shop_id_id]
+
+
+def make_goods(count, category=224):
+    return [{'id': index, 'category': category, 'name': f'Товар {index}', 'price': 100 + index,
+             'price_rrc': 200 + index, 'quantity': index % 7, 'parameters': {'Цвет': 'красный', 'Вес': index}}
+            for index in range(1, count + 1)]
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PriceImporterTests(TestCase):
+
+    def setUp(self):
+        self.user = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        with open(SHOP1_YAML, encoding='utf-8') as file:
+            self.data = load_yaml(file, Loader=Loader)
+
+    def run_import(self, data):
+        return PriceImporter(self.user).run(data['shop'], data['categories'], data['goods'])
+
+    def test_import_shop1(self):
+        shop = self.run_import(self.data)
+
+        self.assertEqual(shop.name, self.data['shop'])
+        self.assertEqual(Categories.objects.filter(shops=shop).count(), len(self.data['categories']))
+        self.assertEqual(ProductsInfo.objects.filter(shop_id=shop).count(), len(self.data['goods']))
+        item = self.data['goods'][0]
+        info = ProductsInfo.objects.get(shop_id=shop, external_id=item['id'])
+        self.assertEqual((info.price, info.price_rrc, info.quantity), (item['price'], item['price_rrc'],
+                                                                       item['quantity']))
+        self.assertEqual(info.product_id.name, item['name'])
+        self.assertEqual(dict(info.product_parameters.values_list('parameter_id__name', 'value')),
+                         {name: str(value) for name, value in item['parameters'].items()})
+
+    def test_reimport_replaces_offers(self):
+        self.run_import(self.data)
+        self.run_import(self.data)
+
+        self.assertEqual(Shops.objects.count(), 1)
+        self.assertEqual(ProductsInfo.objects.count(), len(self.data['goods']))
+        self.assertEqual(Products.objects.count(), len({item['name'] for item in self.data['goods']}))
+
+    def test_query_count_grows_with_batches(self):
+        data = {'shop': 'Связной', 'categories': [{'id': 224, 'name': 'Смартфоны'}]}
+        self.run_import(dict(data, goods=make_goods(10)))
+        counts = []
+        for size in (PriceImporter.batch_size, PriceImporter.batch_size * 4):
+            with CaptureQueriesContext(connection) as queries:
+                self.run_import(dict(data, goods=make_goods(size)))
+            counts.append(len(queries))
+
+        self.assertLess(counts[1], counts[0] * 5)
+        self.assertLess(counts[1], PriceImporter.batch_size * 4 // 20)
+        self.assertEqual(ProductParameter.objects.count(), PriceImporter.batch_size * 4 * 2)
+
+    def test_diff_applies_only_changes(self):
+        data = {'shop': 'Связной', 'categories': [{'id': 224, 'name': 'Смартфоны'}], 'goods': make_goods(20)}
+        self.run_import(data)
+        ids = dict(ProductsInfo.objects.values_list('external_id', 'id'))
+
+        goods = make_goods(21)[1:]
+        goods[0]['price'] = 1
+        goods[1]['parameters'] = {'Цвет': 'синий'}
+        importer = PriceImporter(self.user)
+        importer.run(data['shop'], data['categories'], goods, diff=True)
+
+        self.assertEqual((importer.created, importer.updated, importer.retired), (1, 2, 1))
+        self.assertEqual(ProductsInfo.objects.get(external_id=1).quantity, 0)
+        self.assertEqual(ProductsInfo.objects.get(external_id=2).price, 1)
+        self.assertEqual(dict(ProductsInfo.objects.get(external_id=3).product_parameters.values_list(
+            'parameter_id__name', 'value')), {'Цвет': 'синий'})
+        # строки существующих предложений не пересоздаются
+        self.assertEqual(ProductsInfo.objects.get(external_id=20).id, ids[20])
+
+    def test_diff_ignores_number_formatting(self):
+        data = {'shop': 'Связной', 'categories': [{'id': 224, 'name': 'Смартфоны'}], 'goods': make_goods(5)}
+        self.run_import(data)
+
+        goods = make_goods(5)
+        for item in goods:
+            item.update(price=str(item['price']), price_rrc=float(item['price_rrc']), quantity=str(item['quantity']))
+        importer = PriceImporter(self.user)
+        importer.run(data['shop'], data['categories'], goods, diff=True)
+
+        self.assertEqual((importer.created, importer.updated, importer.retired), (0, 0, 0))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PriceListTests(TestCase):
+
+    def test_matches_full_load(self):
+        with open(SHOP1_YAML, encoding='utf-8') as file:
+            data = load_yaml(file, Loader=Loader)
+        with open(SHOP1_YAML, 'rb') as file:
+            price_list = PriceList(file)
+            goods = list(price_list.goods())
+
+        self.assertEqual(price_list.shop, data['shop'])
+        self.assertEqual(price_list.categories, data['categories'])
+        self.assertEqual(goods, data['goods'])
+
+    def test_goods_before_shop(self):
+        with self.assertRaises(PriceImportError):
+            PriceList(BytesIO('goods: []\nshop: Связной\n'.encode()))
+
+    def test_import_from_stream(self):
+        user = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        with open(SHOP1_YAML, 'rb') as file:
+            importer = import_price(user, file)
+
+        self.assertEqual(ProductsInfo.objects.filter(shop_id=importer.shop).count(), 4)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ConditionalFetchTests(TestCase):
+
+    def setUp(self):
+        self.user = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+
+    def test_not_modified(self):
+        with PriceServer() as server:
+            first = import_from_url(self.user, server.url('shop1.yaml'))
+            ProductsInfo.objects.update(price=1)
+            second = import_from_url(self.user, server.url('shop1.yaml'))
+
+        self.assertEqual((first.skipped, first.rows_processed), ('', 4))
+        self.assertEqual(second.skipped, 'not_modified')
+        self.assertEqual(ProductsInfo.objects.exclude(price=1).count(), 0)
+
+    def test_same_content_without_etag(self):
+        with PriceServer(etags=False) as server:
+            import_from_url(self.user, server.url('shop1.yaml'))
+            importer = import_from_url(self.user, server.url('shop1.yaml'))
+
+        self.assertEqual(importer.skipped, 'same_content')
+
+    def test_only_formatting_changed(self):
+        with PriceServer() as server:
+            import_from_url(self.user, server.url('shop1.yaml'))
+            ids = set(ProductsInfo.objects.values_list('id', flat=True))
+            changes = CatalogChanges.objects.count()
+            server.files['shop1.yaml'] = b'# comment\n' + server.files['shop1.yaml']
+            with patch('backend.importer.PriceList', wraps=PriceList) as price_list:
+                importer = import_from_url(self.user, server.url('shop1.yaml'))
+            # прайс разобран один раз, а полная перезагрузка откачена
+            self.assertEqual((importer.skipped, importer.rows_processed, price_list.call_count), ('same_goods', 0, 1))
+            self.assertEqual(set(ProductsInfo.objects.values_list('id', flat=True)), ids)
+            self.assertEqual(CatalogChanges.objects.count(), changes)
+
+            server.files['shop1.yaml'] = server.files['shop1.yaml'].replace(b'price: 110000', b'price: 100000')
+            importer = import_from_url(self.user, server.url('shop1.yaml'))
+
+        self.assertEqual(importer.skipped, '')
+        self.assertTrue(ProductsInfo.objects.filter(price=100000).exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PartnerUpdateTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        celery_tasks.conf.task_always_eager = True
+
+    @classmethod
+    def tearDownClass(cls):
+        celery_tasks.conf.task_always_eager = False
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = Users.objects.create_user(email='shop@example.com', password='password', type='shop',
+                                              is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_update_runs_job(self):
+        with PriceServer() as server, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/partner/update', {'url': server.url('shop1.yaml')})
+        job_id = response.json()['job_id']
+
+        status = self.client.get(f'/api/v1/partner/update/{job_id}').json()
+        self.assertEqual(status['phase'], 'done')
+        self.assertEqual(status['rows_processed'], 4)
+        self.assertEqual((status['created'], status['updated'], status['retired']), (4, 0, 0))
+        self.assertEqual(ProductsInfo.objects.filter(shop_id__user_id=self.user).count(), 4)
+
+    def test_diff_job_reports_counters(self):
+        with PriceServer() as server, self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/partner/update', {'url': server.url('shop1.yaml')})
+        ProductsInfo.objects.filter(external_id=4216313).update(price=1)
+        Shops.objects.update(price_etag='', price_last_modified='', price_hash='', goods_hash='')
+
+        with PriceServer() as server, self.captureOnCommitCallbacks(execute=True):
+            server.files['shop1.yaml'] = server.files['shop1.yaml'].replace(b'- id: 4216292', b'- id: 9999999', 1)
+            response = self.client.post('/api/v1/partner/update', {'url': server.url('shop1.yaml'), 'mode': 'diff'})
+
+        status = self.client.get(f'/api/v1/partner/update/{response.json()["job_id"]}').json()
+        self.assertEqual((status['phase'], status['created'], status['updated'], status['retired']),
+                         ('done', 1, 1, 1))
+
+    def test_failed_job_reports_error(self):
+        with PriceServer() as server, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/partner/update', {'url': server.url('missing.yaml')})
+
+        job = ImportJobs.objects.get(id=response.json()['job_id'])
+        self.assertEqual(job.phase, 'failed')
+        self.assertIn('404', job.errors)
+
+    def test_upload_gzip_file(self):
+        with TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media), \
+                self.captureOnCommitCallbacks(execute=True):
+            upload = SimpleUploadedFile('shop1.yaml.gz', gzip.compress(SHOP1_YAML.read_bytes()))
+            response = self.client.post('/api/v1/partner/update', {'file': upload, 'mode': 'diff'})
+
+        job = ImportJobs.objects.get(id=response.json()['job_id'])
+        self.assertEqual((job.phase, job.content_encoding, job.diff, job.file.name), ('done', 'gzip', True, ''))
+        self.assertEqual(ProductsInfo.objects.count(), 4)
+
+    @skipIf(zstandard is None, 'не установлен zstandard')
+    def test_raw_zstd_body(self):
+        body = zstandard.ZstdCompressor().compress(SHOP1_YAML.read_bytes())
+        with TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.generic('POST', '/api/v1/partner/update', body, content_type='application/x-yaml',
+                                           HTTP_CONTENT_ENCODING='zstd')
+
+        self.assertEqual(ImportJobs.objects.get(id=response.json()['job_id']).phase, 'done')
+        self.assertEqual(ProductsInfo.objects.count(), 4)
+
+    def test_unsupported_encoding(self):
+        response = self.client.generic('POST', '/api/v1/partner/update', b'data', content_type='application/x-yaml',
+                                       HTTP_CONTENT_ENCODING='br')
+
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(ImportJobs.objects.exists())
+
+    def test_process_local_cache_is_reported(self):
+        # у тестов кэш в памяти процесса (TEST_CACHES), но задачи Celery выполняются в том же процессе
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['backend.W001'])
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/cache'}}):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CELERY_TASK_ALWAYS_EAGER=True):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_status_of_foreign_job(self):
+        other = Users.objects.create_user(email='other@example.com', password='password', type='shop')
+        job = ImportJobs.objects.create(user_id=other, url='http://example.com/price.yaml')
+
+        response = self.client.get(f'/api/v1/partner/update/{job.id}')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PriceExportTests(TestCase):
+
+    def setUp(self):
+        self.user = Users.objects.create_user(email='shop@example.com', password='password', type='shop',
+                                              is_active=True)
+        with open(SHOP1_YAML, 'rb') as file:
+            self.shop = import_price(self.user, file).shop
+        with open(SHOP1_YAML, encoding='utf-8') as file:
+            self.data = load_yaml(file, Loader=Loader)
+        for item in self.data['goods']:
+            # модель товара не хранится и не выгружается
+            del item['model']
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, export_format):
+        response = self.client.get('/api/v1/partner/export', {'format': export_format})
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_yaml_matches_price_list(self):
+        exported = load_yaml(self.export('yaml'), Loader=Loader)
+
+        self.assertEqual(exported['shop'], self.data['shop'])
+        self.assertCountEqual(exported['categories'], self.data['categories'])
+        self.assertEqual(exported['goods'], self.data['goods'])
+
+    def test_yaml_reimport_changes_nothing(self):
+        importer = import_price(self.user, BytesIO(b''.join(export_price(self.shop, 'yaml'))), diff=True)
+
+        self.assertEqual((importer.created, importer.updated, importer.retired), (0, 0, 0))
+
+    def test_json_and_ndjson(self):
+        exported = json.loads(self.export('json'))
+        self.assertEqual(exported['goods'], self.data['goods'])
+
+        lines = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        self.assertEqual(lines[0]['shop'], self.data['shop'])
+        self.assertEqual(lines[1:], self.data['goods'])
+
+    def test_string_values_stay_strings(self):
+        values = {'Артикул': '007', 'Тираж': '1_000', 'Размер': '1.50', 'Код': 'nan', 'Вес': '6.1', 'Год': '2019'}
+        goods = [{'id': 1, 'category': 224, 'name': 'Товар', 'price': 1, 'price_rrc': 1, 'quantity': 1,
+                  'parameters': values}]
+        PriceImporter(self.user).run('Связной', [{'id': 224, 'name': 'Смартфоны'}], goods)
+        exported = json.loads(self.export('json'))
+        self.assertEqual(exported['goods'][0]['parameters'], dict(values, Вес=6.1, Год=2019))
+
+    def test_batches_and_unknown_format(self):
+        with patch('backend.exporter.EXPORT_BATCH_SIZE', 1):
+            exported = json.loads(b''.join(export_price(self.shop, 'json')))
+        self.assertEqual(len(exported['goods']), len(self.data['goods']))
+
+        response = self.client.get('/api/v1/partner/export', {'format': 'xml'})
+        self.assertFalse(response.json()['Status'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogChangesTests(TestCase):
+
+    def setUp(self):
+        self.user = Users.objects.create_user(email='shop@example.com', password='password', type='shop',
+                                              is_active=True)
+        self.data = {'shop': 'Связной', 'categories': [{'id': 224, 'name': 'Смартфоны'}], 'goods': make_goods(5)}
+        self.client = APIClient()
+        self.run_import(self.data['goods'])
+
+    def run_import(self, goods, diff=False):
+        PriceImporter(self.user).run(self.data['shop'], self.data['categories'], goods, diff=diff)
+
+    def changes(self, since, **params):
+        return self.client.get('/api/v1/products/changes', dict(params, since=since)).json()
+
+    def test_initial_sync_and_diff(self):
+        first = self.changes(0)
+        self.assertFalse(first['has_more'])
+        self.assertEqual(len(first['upserts']), 5)
+        self.assertEqual(first['deletes'], [])
+
+        goods = make_goods(6)[1:]
+        goods[0]['price'] = 1
+        goods[1]['parameters'] = {'Цвет': 'синий'}
+        self.run_import(goods, diff=True)
+        second = self.changes(first['version'])
+
+        ids = dict(ProductsInfo.objects.values_list('external_id', 'id'))
+        # снятое с продажи, два изменённых и новое предложение
+        self.assertCountEqual([item['id'] for item in second['upserts']], [ids[1], ids[2], ids[3], ids[6]])
+        self.assertEqual(self.changes(second['version']), {'version': second['version'], 'has_more': False,
+                                                           'upserts': [], 'deletes': []})
+
+    def test_full_reload_and_paging(self):
+        old_ids = sorted(ProductsInfo.objects.values_list('id', flat=True))
+        version = self.changes(0)['version']
+        self.run_import(self.data['goods'])
+
+        page = self.changes(version, limit=5)
+        self.assertTrue(page['has_more'])
+        self.assertEqual(page['deletes'], old_ids)
+        page = self.changes(page['version'], limit=5)
+        self.assertFalse(page['has_more'])
+        self.assertCountEqual([item['id'] for item in page['upserts']],
+                              ProductsInfo.objects.values_list('id', flat=True))
+
+    def test_shop_state_change(self):
+        version = self.changes(0)['version']
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.post('/api/v1/partner/state', {'status_work': ''})
+
+        page = self.changes(version)
+        self.assertEqual(page['upserts'], [])
+        self.assertEqual(len(page['deletes']), 5)
+
+    def test_admin_edits(self):
+        admin = APIClient()
+        admin.force_login(Users.objects.create_superuser(email='admin@example.com', password='password',
+                                                         is_active=True))
+        offer = ProductsInfo.objects.select_related('product_id', 'shop_id').get(external_id=1)
+        version = self.changes(0)['version']
+        admin.post(f'/admin/backend/products/{offer.product_id_id}/change/',
+                   {'category_id': offer.product_id.category_id_id, 'name': 'Новое название'})
+        page = self.changes(version)
+        self.assertEqual([item['product_id']['name'] for item in page['upserts']], ['Новое название'])
+
+        # у параметра "Цвет" по записи на каждое предложение
+        admin.post(f'/admin/backend/parameters/{Parameters.objects.get(name="Цвет").id}/delete/', {'post': 'yes'})
+        page = self.changes(page['version'])
+        self.assertEqual(len(page['upserts']), 5)
+
+        admin.post(f'/admin/backend/shops/{offer.shop_id_id}/change/',
+                   {'user_id': self.user.id, 'name': offer.shop_id.name, 'url_shop': ''})
+        page = self.changes(page['version'])
+        self.assertEqual(len(page['deletes']), 5)
+
+        admin.post(f'/admin/backend/categories/{offer.product_id.category_id_id}/delete/', {'post': 'yes'})
+        self.assertFalse(ProductsInfo.objects.exists())
+        self.assertEqual(CatalogChanges.objects.filter(version__gt=page['version'], action='delete').count(), 5)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProductPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        goods = make_goods(7)
+        for item in goods:
+            # повторяющиеся цены проверяют однозначность ключа (price, id)
+            item['price'] = 100 + item['id'] % 3
+        PriceImporter(user).run('Связной', [{'id': 224, 'name': 'Смартфоны'}], goods)
+        self.client = APIClient()
+
+    def walk(self, **params):
+        pages, response = [], self.client.get('/api/v1/products', dict(params, page_size=3)).json()
+        pages.append(response['results'])
+        while response['next']:
+            response = self.client.get(response['next']).json()
+            pages.append(response['results'])
+        return pages
+
+    def test_pages_cover_catalog_once(self):
+        pages = self.walk()
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([item['id'] for page in pages for item in page],
+                         sorted(ProductsInfo.objects.values_list('id', flat=True)))
+
+        for ordering, reverse in (('price', False), ('-price', True)):
+            items = [item for page in self.walk(ordering=ordering) for item in page]
+            self.assertEqual([(item['price'], item['id']) for item in items],
+                             sorted(ProductsInfo.objects.values_list('price', 'id'), reverse=reverse))
+
+    def test_filters_and_invalid_cursor(self):
+        self.assertEqual(self.walk(shop_id=Shops.objects.get().id + 1), [[]])
+        self.assertEqual(len(self.walk(category_id=224)), 3)
+
+        response = self.client.get('/api/v1/products', {'cursor': 'not-a-cursor'})
+        self.assertEqual((response.status_code, response.json()),
+                         (400, {'Status': False, 'Errors': 'Неправильный курсор'}))
+        cursor = self.client.get('/api/v1/products', {'page_size': 3}).json()['next'].split('cursor=')[1]
+        response = self.client.get('/api/v1/products', {'cursor': cursor, 'ordering': 'price'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/v1/products', {'ordering': 'name'})
+        self.assertEqual((response.status_code, response.json()['Status']), (400, False))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='shop@example.com', password='password', type='shop',
+                                              is_active=True)
+        self.other = Users.objects.create_user(email='other@example.com', password='password', type='shop')
+        self.categories = [{'id': 224, 'name': 'Смартфоны'}]
+        self.run_import(self.user, 'Связной', make_goods(3))
+        self.run_import(self.other, 'Евросеть', make_goods(2))
+        self.shop = Shops.objects.get(user_id=self.user)
+        self.client = APIClient()
+
+    def run_import(self, user, shop, goods):
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceImporter(user).run(shop, self.categories, goods)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_repeated_reads_skip_database(self):
+        for url in ('/api/v1/products', '/api/v1/categories', '/api/v1/shops'):
+            first = self.get(url)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get(url), first)
+
+    def test_import_invalidates_catalog(self):
+        self.assertEqual(len(self.get('/api/v1/products')['results']), 5)
+        shop_page = self.get('/api/v1/products', shop_id=self.shop.id)
+
+        self.run_import(self.other, 'Евросеть', make_goods(4))
+        self.assertEqual(len(self.get('/api/v1/products')['results']), 7)
+        # версия другого магазина не менялась
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get('/api/v1/products', shop_id=self.shop.id), shop_page)
+
+    def test_state_change_invalidates_shops(self):
+        self.assertEqual(len(self.get('/api/v1/shops')['results']), 2)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post('/api/v1/partner/state', {'status_work': ''})
+
+        self.assertEqual(len(self.get('/api/v1/shops')['results']), 1)
+        self.assertEqual(self.get('/api/v1/products', shop_id=self.shop.id)['results'], [])
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/v1/products', {'shop_id': self.shop.id})
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        # повторный запрос из кэша отдаёт те же заголовки
+        self.assertEqual(self.client.get('/api/v1/products', {'shop_id': self.shop.id})['ETag'], etag)
+        self.assertNotEqual(self.client.get('/api/v1/products')['ETag'], etag)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/products', {'shop_id': self.shop.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get('/api/v1/products', {'shop_id': self.shop.id}, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # импорт другого магазина не меняет ETag выдачи этого магазина, но меняет общий каталог
+        categories_etag = self.client.get('/api/v1/categories')['ETag']
+        self.run_import(self.other, 'Евросеть', make_goods(4))
+        response = self.client.get('/api/v1/products', {'shop_id': self.shop.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/v1/categories', HTTP_IF_NONE_MATCH=categories_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], categories_etag)
+
+    def test_last_modified_moves_on_every_change(self):
+        last_modified = self.client.get('/api/v1/products', {'shop_id': self.shop.id})['Last-Modified']
+        # второе изменение в ту же секунду
+        with patch('backend.cache.time_ns', return_value=get_catalog_version(self.shop.id)):
+            self.run_import(self.user, 'Связной', make_goods(4))
+        response = self.client.get('/api/v1/products', {'shop_id': self.shop.id}, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['results']), 4)
+
+    def test_admin_edits_invalidate_shop_pages(self):
+        admin = APIClient()
+        admin.force_login(Users.objects.create_superuser(email='admin@example.com', password='password',
+                                                         is_active=True))
+        shop_page = self.get('/api/v1/products', shop_id=self.shop.id)
+        product = ProductsInfo.objects.get(id=shop_page['results'][0]['id']).product_id
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.post(f'/admin/backend/products/{product.id}/change/',
+                       {'category_id': product.category_id_id, 'name': 'Новое название'})
+        self.assertEqual(self.get('/api/v1/products', shop_id=self.shop.id)['results'][0]['product_id']['name'],
+                         'Новое название')
+
+        etag = self.client.get('/api/v1/products', {'shop_id': self.shop.id})['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.post(f'/admin/backend/shops/{self.shop.id}/change/',
+                       {'user_id': self.user.id, 'name': self.shop.name, 'url_shop': ''})
+        self.assertFalse(Shops.objects.get(id=self.shop.id).status_work)
+        response = self.client.get('/api/v1/products', {'shop_id': self.shop.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['results'], [])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QueryPlanTests(TestCase):
+
+    def setUp(self):
+        user = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        PriceImporter(user).run('Связной', [{'id': 224, 'name': 'Смартфоны'}], make_goods(20))
+        self.shop_id = Shops.objects.get().id
+        self.client = APIClient()
+
+    def plan(self, params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/v1/products', params).status_code, 200)
+        sql = next(query['sql'] for query in queries if 'FROM "products_info"' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    @skipIf(connection.vendor != 'sqlite', 'план запроса SQLite')
+    def test_catalog_queries_use_indexes(self):
+        cases = [
+            ({'ordering': 'price'}, 'products_info_price_idx'),
+            ({'ordering': '-price', 'price_min': 10, 'price_max': 1000}, 'products_info_price_idx'),
+            ({'ordering': 'price', 'shop_id': 1}, 'products_info_shop_price_idx'),
+            ({'ordering': '-quantity'}, 'products_info_quantity_idx'),
+            ({'ordering': 'quantity', 'in_stock': 1}, 'products_info_quantity_idx'),
+        ]
+        for params, index in cases:
+            with self.subTest(params=params):
+                if 'shop_id' in params:
+                    params = dict(params, shop_id=self.shop_id)
+                plan = self.plan(params)
+                self.assertIn(f'USING INDEX {index}', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ParameterFacetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        with open(SHOP1_YAML, 'rb') as file:
+            import_price(user, file)
+        self.client = APIClient()
+
+    def external_ids(self, **params):
+        response = self.client.get('/api/v1/products', params).json()
+        ids = [item['id'] for item in response['results']]
+        return sorted(ProductsInfo.objects.filter(id__in=ids).values_list('external_id', flat=True)), response
+
+    def test_numeric_values_parsed(self):
+        values = dict(ProductParameter.objects.filter(product_info_id__external_id=4216292).values_list(
+            'parameter_id__name', 'numeric_value'))
+        self.assertEqual(values, {'Диагональ (дюйм)': 6.5, 'Разрешение (пикс)': None,
+                                  'Встроенная память (Гб)': 512, 'Цвет': None})
+
+    def test_filters(self):
+        self.assertEqual(self.external_ids(parameter='Диагональ (дюйм):6..6.2')[0], [4216226, 4216313, 4672670])
+        self.assertEqual(self.external_ids(parameter='Диагональ (дюйм):6.3..')[0], [4216292])
+        self.assertEqual(self.external_ids(parameter=['Диагональ (дюйм):..6.1', 'Цвет:красный'])[0], [4216313])
+        self.assertEqual(self.external_ids(parameter='Цвет:зелёный')[0], [])
+        self.assertEqual(self.external_ids(parameter='Вес:1..2')[0], [])
+        self.assertFalse(self.client.get('/api/v1/products', {'parameter': 'Цвет'}).json()['Status'])
+
+    def test_facets_in_one_query(self):
+        params = {'category_id': 224, 'parameter': 'Диагональ (дюйм):..6.1'}
+        with CaptureQueriesContext(connection) as plain:
+            self.client.get('/api/v1/products', params)
+        cache.clear()
+        with CaptureQueriesContext(connection) as faceted:
+            response = self.client.get('/api/v1/products', dict(params, facets=1)).json()
+
+        self.assertEqual(len(faceted), len(plain) + 1)
+        self.assertEqual(response['facets']['Диагональ (дюйм)'], {'6.1': 3})
+        self.assertEqual(response['facets']['Цвет'], {'красный': 1, 'синий': 1, 'черный': 1})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProductSearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        with open(SHOP1_YAML, 'rb') as file:
+            import_price(self.user, file)
+        self.client = APIClient()
+
+    def search(self, query, **params):
+        return [item['product_id']['name'] for item in
+                self.client.get('/api/v1/products/search', dict(params, q=query)).json()['results']]
+
+    def test_search_ranks_and_prefixes(self):
+        self.assertEqual(self.search('смартф черн'), ['Смартфон Apple iPhone XR 256GB (черный)'])
+        self.assertEqual(len(self.search('IPHONE')), 4)
+        self.assertEqual(self.search('iphone 128gb')[0], 'Смартфон Apple iPhone XR 128GB (синий)')
+        self.assertEqual(self.search('iphone', limit=2), self.search('iphone')[:2])
+        self.assertEqual(self.search('samsung'), [])
+        self.assertEqual(self.search(''), [])
+        self.assertEqual(self.search('"*)'), [])
+
+    def test_best_match_outside_first_window(self):
+        goods = [{'id': index, 'category': 224, 'name': f'Чехол для смартфона модель {index} силиконовый с подставкой',
+                  'price': 100, 'price_rrc': 100, 'quantity': 1, 'parameters': {}}
+                 for index in range(1, SEARCH_WINDOW + 51)]
+        goods.append({'id': 10000, 'category': 224, 'name': 'Чехол', 'price': 100, 'price_rrc': 100, 'quantity': 1,
+                      'parameters': {}})
+        PriceImporter(self.user).run('Связной', [{'id': 224, 'name': 'Смартфоны'}], goods, diff=True)
+        # лучший по bm25 товар создан последним, с наибольшим id
+        self.assertEqual(self.search('чехол', limit=1), ['Чехол'])
+        response = self.client.get('/api/v1/products/autocomplete', {'q': 'чехол'}).json()
+        self.assertEqual(response['suggestions'][0], 'Чехол')
+
+    def test_index_follows_import_and_shop_state(self):
+        goods = [{'id': 1, 'category': 224, 'name': 'Смартфон Samsung Galaxy S10', 'price': 50000,
+                  'price_rrc': 60000, 'quantity': 3, 'parameters': {}}]
+        PriceImporter(self.user).run('Связной', [{'id': 224, 'name': 'Смартфоны'}], goods, diff=True)
+        self.assertEqual(self.search('galaxy'), ['Смартфон Samsung Galaxy S10'])
+
+        Products.objects.filter(name='Смартфон Samsung Galaxy S10').update(name='Смартфон Samsung Galaxy S20')
+        cache.clear()
+        self.assertEqual(self.search('s20'), ['Смартфон Samsung Galaxy S20'])
+
+        Shops.objects.update(status_work=False)
+        cache.clear()
+        self.assertEqual(self.search('galaxy'), [])
+
+    def test_autocomplete(self):
+        response = self.client.get('/api/v1/products/autocomplete', {'q': 'Смартфон Apple iPhone XR 2'}).json()
+        self.assertCountEqual(response['suggestions'], ['Смартфон Apple iPhone XR 256GB (красный)',
+                                                        'Смартфон Apple iPhone XR 256GB (черный)'])
+        response = self.client.get('/api/v1/products/autocomplete', {'q': 'iphone'}).json()
+        self.assertEqual(response['suggestions'], [])
+
+        # товары без предложений работающих магазинов не подсказываются
+        Shops.objects.update(status_work=False)
+        for backend in ('backend.search.SqliteSearch', 'backend.search.BasicSearch'):
+            cache.clear()
+            with self.settings(SEARCH_BACKEND=backend):
+                response = self.client.get('/api/v1/products/autocomplete', {'q': 'Смартфон'}).json()
+            self.assertEqual(response['suggestions'], [])
+
+    @override_settings(SEARCH_BACKEND='backend.search.BasicSearch')
+    def test_basic_backend(self):
+        # LIKE в SQLite не различает регистр только у латиницы
+        self.assertEqual(len(self.search('IPHONE 256')), 2)
+        self.assertEqual(len(self.search('iphone')), 4)
+
+
+@patch('backend.catalog_index.BACKGROUND_BUILD', False)
+@override_settings(CACHES=TEST_CACHES)
+class CatalogIndexTests(TestCase):
+    queries = [
+        {}, {'page_size': 2}, {'shop_id': 1}, {'category_id': 15, 'ordering': 'price'},
+        {'price_min': 103, 'price_max': 110, 'ordering': '-price', 'page_size': 3}, {'in_stock': 1},
+        {'parameter': 'Цвет:красный'}, {'parameter': ['Цвет:синий', 'Вес:4'], 'ordering': 'price'},
+        {'shop_id': 2, 'parameter': 'Цвет:синий', 'ordering': '-price', 'page_size': 1},
+        {'parameter': 'Вес:3..6'}, {'parameter': ['Вес:..4', 'Цвет:синий'], 'ordering': 'price', 'page_size': 2},
+        {'parameter': 'Вес:7..'}, {'ordering': '-quantity', 'page_size': 4},
+        {'shop_id': 2, 'ordering': 'quantity', 'in_stock': 1, 'page_size': 3},
+    ]
+
+    def setUp(self):
+        cache.clear()
+        catalog_index._index = None
+        for index, (email, name) in enumerate((('shop@example.com', 'Связной'), ('other@example.com', 'Евросеть'))):
+            goods = make_goods(9, category=(224, 15)[index])
+            for item in goods:
+                item['price'] = 100 + item['id'] % 4 * 3 + index
+                if item['id'] % 2:
+                    item['parameters']['Цвет'] = 'синий'
+            user = Users.objects.create_user(email=email, password='password', type='shop')
+            PriceImporter(user).run(name, [{'id': 224, 'name': 'Смартфоны'}, {'id': 15, 'name': 'Аксессуары'}], goods)
+        self.shop_ids = list(Shops.objects.order_by('id').values_list('id', flat=True))
+        self.client = APIClient()
+
+    def walk(self, params):
+        # shop_id в запросах - номер магазина по порядку
+        if 'shop_id' in params:
+            params = dict(params, shop_id=self.shop_ids[params['shop_id'] - 1])
+        pages, url, data = [], '/api/v1/products', params
+        while url:
+            response = self.client.get(url, data)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.content)
+            url, data = json.loads(response.content)['next'], None
+        return pages
+
+    def test_index_matches_database(self):
+        for params in self.queries:
+            with self.subTest(params=params):
+                cache.clear()
+                expected = self.walk(params)
+                cache.clear()
+                with override_settings(CATALOG_INDEX=True):
+                    self.assertEqual(self.walk(params), expected)
+
+    @override_settings(CATALOG_INDEX=True)
+    def test_served_from_memory_and_refreshed(self):
+        self.walk({})
+        with self.assertNumQueries(0):
+            self.walk({'shop_id': 1, 'ordering': 'price'})
+
+        user = Users.objects.get(email='shop@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceImporter(user).run('Связной', [{'id': 224, 'name': 'Смартфоны'}], make_goods(2))
+        self.assertEqual(len(json.loads(self.walk({'shop_id': 1})[0])['results']), 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BasketTests(TestCase):
+
+    def setUp(self):
+        shop = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        PriceImporter(shop).run('Связной', [{'id': 224, 'name': 'Смартфоны'}], make_goods(14))
+        self.offers = list(ProductsInfo.objects.order_by('external_id').values_list('id', flat=True))
+        self.buyer = Users.objects.create_user(email='buyer@example.com', password='password', type='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def basket(self):
+        return dict(OrderItems.objects.filter(order_id__user_id=self.buyer, order_id__status='basket').values_list(
+            'product_info_id', 'quantity'))
+
+    def test_bulk_add_upserts_and_reports(self):
+        # остаток у товара с external_id n - n % 7
+        first, second, third = self.offers[2], self.offers[5], self.offers[6]
+        response = self.client.post('/api/v1/basket', {'items': [
+            {'product_info_id': first, 'quantity': 1}, {'product_info_id': second, 'quantity': 2}]}, format='json')
+        self.assertEqual(response.json()['Создано объектов'], 2)
+
+        items = [{'product_info_id': first, 'quantity': 1}, {'product_info_id': first, 'quantity': 1},
+                 {'product_info_id': second, 'quantity': 5}, {'product_info_id': third, 'quantity': 1},
+                 {'product_info_id': 10 ** 6, 'quantity': 1}, {'quantity': 1}]
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/v1/basket', {'items': items}, format='json').json()
+        self.assertEqual((response['Создано объектов'], response['Обновлено объектов']), (0, 1))
+        self.assertEqual([item['Status'] for item in response['items']], [True, True, False, False, False, False])
+        self.assertEqual(response['items'][2]['Errors'], 'Недостаточно товара, можно добавить 4')
+        self.assertEqual(self.basket(), {first: 3, second: 2})
+
+        Shops.objects.update(status_work=False)
+        response = self.client.post('/api/v1/basket', {'items': [{'product_info_id': second, 'quantity': 1}]},
+                                    format='json').json()
+        self.assertEqual(response['items'][0]['Errors'], 'Магазин не принимает заказы')
+
+    def test_bulk_edit_and_delete(self):
+        ProductsInfo.objects.update(quantity=1000)
+        self.client.post('/api/v1/basket', {'items': [{'product_info_id': info_id, 'quantity': 1}
+                                                      for info_id in self.offers]}, format='json')
+        item_ids = list(OrderItems.objects.order_by('id').values_list('id', flat=True))
+        other = Users.objects.create_user(email='other@example.com', password='password', type='buyer')
+        foreign = OrderItems.objects.create(order_id=Orders.objects.create(user_id=other, status='basket'),
+                                            product_info_id_id=self.offers[0], quantity=1)
+
+        items = [{'id': item_id, 'quantity': index + 2} for index, item_id in enumerate(item_ids)]
+        items += [{'id': foreign.id, 'quantity': 50}, {'id': item_ids[0]}]
+        # SAVEPOINT, UPDATE позиций, UPDATE итогов заказа, RELEASE SAVEPOINT
+        with patch('backend.bulk.BULK_UPDATE_BATCH_SIZE', 100), self.assertNumQueries(4):
+            response = self.client.put('/api/v1/basket', {'items': items}, format='json').json()
+        self.assertEqual(response['Обновлено объектов'], 14)
+        self.assertEqual(sorted(self.basket().values()), list(range(2, 16)))
+        self.assertEqual(OrderItems.objects.get(id=foreign.id).quantity, 1)
+
+        with self.assertNumQueries(4):
+            response = self.client.delete('/api/v1/basket', {'items_id': item_ids[:10] + [foreign.id]},
+                                          format='json').json()
+        self.assertEqual(response['Удалено объектов'], 10)
+        self.assertEqual(len(self.basket()), 4)
+        self.assertTrue(OrderItems.objects.filter(id=foreign.id).exists())
+
+        contacts = [Contacts.objects.create(user_id=user, city='Москва', street='Тверская', build='1', phone='1')
+                    for user in (self.buyer, self.buyer, other)]
+        contact_ids = ','.join(str(contact.id) for contact in contacts)
+        response = self.client.delete('/api/v1/user/contacts', {'id': contact_ids}, format='json').json()
+        self.assertEqual(response['Удалено объектов'], 2)
+        self.assertEqual(list(Contacts.objects.all()), contacts[2:])
+
+    def test_large_basket(self):
+        ProductsInfo.objects.update(quantity=1000)
+        items = [{'product_info_id': info_id, 'quantity': 2} for info_id in self.offers] * 40
+        with patch('backend.basket.UPSERT_BATCH_SIZE', 5):
+            response = self.client.post('/api/v1/basket', {'items': items}, format='json').json()
+        self.assertEqual(response['Создано объектов'], 14)
+        self.assertEqual(set(self.basket().values()), {80})
+
+    def test_totals_and_checkout_prices(self):
+        ProductsInfo.objects.update(quantity=1000)
+        prices = dict(ProductsInfo.objects.values_list('id', 'price'))
+        first, second = self.offers[:2]
+        self.client.post('/api/v1/basket', {'items': [{'product_info_id': first, 'quantity': 2},
+                                                      {'product_info_id': second, 'quantity': 1}]}, format='json')
+        basket = Orders.objects.get(user_id=self.buyer, status='basket')
+        self.assertEqual((basket.total_sum, basket.items_count), (2 * prices[first] + prices[second], 2))
+
+        items = dict(OrderItems.objects.values_list('product_info_id', 'id'))
+        self.client.put('/api/v1/basket', {'items': [{'id': items[first], 'quantity': 5}]}, format='json')
+        self.client.delete('/api/v1/basket', {'items_id': [items[second]]}, format='json')
+        basket.refresh_from_db()
+        self.assertEqual((basket.total_sum, basket.items_count), (5 * prices[first], 1))
+
+        # при оформлении цена берётся из текущего прайса и дальше не меняется
+        ProductsInfo.objects.filter(id=first).update(price=prices[first] + 100)
+        contact = Contacts.objects.create(user_id=self.buyer, city='Москва', street='Тверская', build='1', phone='1')
+        with patch('backend.views.new_order.delay') as notify:
+            response = self.client.post('/api/v1/order', {'id': basket.id, 'contact': contact.id}, format='json')
+        self.assertEqual(response.json(), {'Status': True})
+        notify.assert_called_once_with(user_id=self.buyer.id)
+        ProductsInfo.objects.filter(id=first).update(price=1)
+        with self.assertNumQueries(1):
+            orders = self.client.get('/api/v1/order', {'include': ''}).json()
+        self.assertEqual(orders, [{'status': 'new', 'date': orders[0]['date'],
+                                   'total_sum': 5 * (prices[first] + 100), 'items_count': 1}])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReservationTests(TestCase):
+
+    def setUp(self):
+        shop = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        PriceImporter(shop).run('Связной', [{'id': 224, 'name': 'Смартфоны'}], make_goods(2))
+        self.first, self.second = ProductsInfo.objects.order_by('external_id').values_list('id', flat=True)
+        ProductsInfo.objects.update(quantity=5)
+        self.buyer = Users.objects.create_user(email='buyer@example.com', password='password', type='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def fill_basket(self, quantities):
+        self.client.post('/api/v1/basket', {'items': [
+            {'product_info_id': info_id, 'quantity': quantity} for info_id, quantity in quantities.items()]},
+            format='json')
+        return Orders.objects.get(user_id=self.buyer, status='basket').id
+
+    def place_order(self, order_id):
+        with patch('backend.views.new_order.delay'):
+            return self.client.post('/api/v1/order', {'id': order_id, 'contact': None}, format='json').json()
+
+    def stock(self):
+        return list(ProductsInfo.objects.filter(id__in=(self.first, self.second)).order_by('external_id').values_list(
+            'quantity', flat=True))
+
+    def test_checkout_reserves_and_cancel_releases(self):
+        changes = CatalogChanges.objects.count()
+        order_id = self.fill_basket({self.second: 1, self.first: 4})
+        self.assertEqual(self.place_order(order_id), {'Status': True})
+        self.assertEqual(self.stock(), [1, 4])
+        self.assertEqual(CatalogChanges.objects.count(), changes + 2)
+        self.assertIsNotNone(Orders.objects.get(id=order_id).reserved_until)
+
+        # не хватило одной позиции - не списывается ничего, корзина остаётся корзиной
+        basket_id = self.fill_basket({self.first: 1, self.second: 1})
+        ProductsInfo.objects.filter(id=self.first).update(quantity=0)
+        self.assertEqual(self.place_order(basket_id),
+                         {'Status': False, 'Errors': 'Недостаточно товара', 'items': [self.first]})
+        self.assertEqual(self.stock(), [0, 4])
+        self.assertEqual(Orders.objects.get(id=basket_id).status, 'basket')
+
+        response = self.client.delete('/api/v1/order', {'id': order_id}, format='json').json()
+        self.assertEqual(response, {'Status': True})
+        self.assertEqual(self.stock(), [4, 5])
+        response = self.client.delete('/api/v1/order', {'id': order_id}, format='json').json()
+        self.assertFalse(response['Status'])
+        self.assertEqual(self.stock(), [4, 5])
+
+    def test_cancel_releases_only_reserved_stock(self):
+        # заказ, оформленный до появления резерва, отменяется без возврата товара
+        order_id = self.fill_basket({self.first: 2})
+        Orders.objects.filter(id=order_id).update(status='new')
+        self.assertTrue(cancel_order(order_id))
+        self.assertEqual(self.stock(), [5, 5])
+
+        order_id = self.fill_basket({self.first: 2})
+        self.place_order(order_id)
+        self.assertTrue(Orders.objects.get(id=order_id).stock_reserved)
+        self.assertTrue(cancel_order(order_id))
+        self.assertFalse(Orders.objects.get(id=order_id).stock_reserved)
+        self.assertEqual(self.stock(), [5, 5])
+
+        # в админке отменённый заказ не возвращается в работу и не отменяется второй раз
+        order = Orders.objects.get(id=order_id)
+        form = OrdersForm(dict(model_to_dict(order), status='new'), instance=order)
+        self.assertIn('status', form.errors)
+        cancel_order(order_id, states=('canceled',))
+        self.assertEqual(self.stock(), [5, 5])
+
+    @override_settings(CATALOG_INDEX=True)
+    @patch('backend.catalog_index.BACKGROUND_BUILD', False)
+    def test_stock_moves_refresh_catalog(self):
+        anonymous = APIClient()
+        response = anonymous.get('/api/v1/products', {'in_stock': 1})
+        etag = response['ETag']
+        self.assertIn(self.first, [offer['id'] for offer in response.json()['results']])
+
+        order_id = self.fill_basket({self.first: 5})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place_order(order_id)
+        # проданный остаток виден в общем каталоге сразу, а не после таймаута кэша
+        response = anonymous.get('/api/v1/products', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({offer['id']: offer['quantity'] for offer in response.json()['results']}[self.first], 0)
+        response = anonymous.get('/api/v1/products', {'in_stock': 1})
+        self.assertNotIn(self.first, [offer['id'] for offer in response.json()['results']])
+        self.assertEqual(CatalogChanges.objects.order_by('-version').first().product_info_id, self.first)
+
+    def test_expired_reservations_are_released(self):
+        order_id = self.fill_basket({self.first: 2})
+        self.place_order(order_id)
+        confirmed_id = self.fill_basket({self.first: 1})
+        self.place_order(confirmed_id)
+        Orders.objects.filter(id=confirmed_id).update(status='confirmed')
+        self.assertEqual(self.stock(), [2, 5])
+
+        self.assertEqual(release_expired(), 0)
+        self.assertEqual(release_expired(datetime.now(timezone.utc) + timedelta(days=2)), 1)
+        self.assertEqual(Orders.objects.get(id=order_id).status, 'canceled')
+        self.assertEqual(self.stock(), [4, 5])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ShopOrdersTests(TestCase):
+
+    def setUp(self):
+        self.shops = []
+        for index, name in enumerate(('Связной', 'Евросеть')):
+            user = Users.objects.create_user(email=f'shop{index}@example.com', password='password', type='shop')
+            PriceImporter(user).run(name, [{'id': 224, 'name': 'Смартфоны'}], make_goods(3))
+            self.shops.append(user)
+        ProductsInfo.objects.update(quantity=10)
+        self.buyer = Users.objects.create_user(email='buyer@example.com', password='password', type='buyer')
+        self.client = APIClient()
+
+    def place_order(self, offers):
+        self.client.force_authenticate(self.buyer)
+        self.client.post('/api/v1/basket', {'items': [{'product_info_id': offer.id, 'quantity': 2}
+                                                      for offer in offers]}, format='json')
+        order_id = Orders.objects.get(user_id=self.buyer, status='basket').id
+        with patch('backend.views.new_order.delay'):
+            self.client.post('/api/v1/order', {'id': order_id, 'contact': None}, format='json')
+        return order_id
+
+    def test_order_is_split_by_shop(self):
+        first, second = (list(ProductsInfo.objects.filter(shop_id__user_id=user).order_by('id'))
+                         for user in self.shops)
+        order_id = self.place_order(first[:2] + second[:1])
+        single_id = self.place_order(first[2:])
+
+        # у покупателя заказ из двух магазинов - две поставки
+        orders = {order['total_sum']: order for order in self.client.get('/api/v1/order').json()}
+        shops = orders[2 * (first[0].price + first[1].price + second[0].price)]['shops']
+        self.assertEqual([(shop['shop_id'], shop['items_count'], shop['total_sum']) for shop in shops],
+                         [(first[0].shop_id_id, 2, 2 * (first[0].price + first[1].price)),
+                          (second[0].shop_id_id, 1, 2 * second[0].price)])
+
+        self.client.force_authenticate(self.shops[1])
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/partner/orders').json()['results']
+        item_id = OrderItems.objects.get(order_id=order_id, product_info_id=second[0]).id
+        self.assertEqual([(order['id'], order['ordered_items'], order['total_sum']) for order in response],
+                         [(order_id, [item_id], 2 * second[0].price)])
+
+        self.client.force_authenticate(self.shops[0])
+        response = self.client.get('/api/v1/partner/orders', {'fields': 'id,status'}).json()
+        self.assertEqual(response, {'next': None, 'results': [{'id': single_id, 'status': 'new'},
+                                                              {'id': order_id, 'status': 'new'}]})
+        # постранично по (date, id), курсор с датой
+        page = self.client.get('/api/v1/partner/orders', {'fields': 'id', 'page_size': 1}).json()
+        self.assertEqual(page['results'], [{'id': single_id}])
+        page = self.client.get(page['next']).json()
+        self.assertEqual(page, {'next': None, 'results': [{'id': order_id}]})
+        response = self.client.get('/api/v1/partner/orders', {'cursor': 'not-a-cursor'})
+        self.assertEqual((response.status_code, response.json()['Status']), (400, False))
+        queryset = ShopOrders.objects.order_by('id')
+        self.assertEqual(serialize_shop_orders(queryset), ShopOrdersSerializer(queryset, many=True).data)
+
+        # отмена заказа отменяет и его части
+        self.client.force_authenticate(self.buyer)
+        self.client.delete('/api/v1/order', {'id': order_id}, format='json')
+        self.client.force_authenticate(self.shops[0])
+        response = self.client.get('/api/v1/partner/orders', {'status': 'new', 'fields': 'id'}).json()
+        self.assertEqual(response['results'], [{'id': single_id}])
+
+    def test_admin_item_edits_update_shop_orders(self):
+        first, second = (list(ProductsInfo.objects.filter(shop_id__user_id=user).order_by('id'))
+                         for user in self.shops)
+        order_id = self.place_order(first[:2])
+        ShopOrders.objects.filter(order_id=order_id).update(status='confirmed')
+        admin = APIClient()
+        admin.force_login(Users.objects.create_superuser(email='admin@example.com', password='password',
+                                                         is_active=True))
+
+        item = OrderItems.objects.get(order_id=order_id, product_info_id=first[1])
+        admin.post(f'/admin/backend/orderitems/{item.id}/change/',
+                   {'order_id': order_id, 'product_info_id': second[0].id, 'quantity': 3, 'price': 10})
+        item = OrderItems.objects.get(order_id=order_id, product_info_id=first[0])
+        admin.post(f'/admin/backend/orderitems/{item.id}/change/',
+                   {'order_id': order_id, 'product_info_id': first[0].id, 'quantity': 1, 'price': 20})
+        # статус части, которую подтвердил магазин, сохраняется, часть нового магазина получает статус заказа
+        self.assertEqual(list(ShopOrders.objects.filter(order_id=order_id).order_by('shop_id').values_list(
+            'shop_id', 'status', 'items_count', 'total_sum')),
+            [(first[0].shop_id_id, 'confirmed', 1, 20), (second[0].shop_id_id, 'new', 1, 30)])
+
+        admin.post(f'/admin/backend/orderitems/{item.id}/delete/', {'post': 'yes'})
+        self.assertEqual(list(ShopOrders.objects.filter(order_id=order_id).values_list('shop_id', flat=True)),
+                         [second[0].shop_id_id])
+
+    @skipIf(connection.vendor != 'sqlite', 'план запроса SQLite')
+    def test_partner_orders_use_index(self):
+        self.place_order(ProductsInfo.objects.all())
+        self.client.force_authenticate(self.shops[0])
+        for params, index in (({'status': 'new'}, 'shop_orders_status_date_idx'), ({}, 'shop_orders_date_idx')):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get('/api/v1/partner/orders', dict(params, include=''))
+            sql = next(query['sql'] for query in queries if 'FROM "backend_shoporders"' in query['sql'])
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = ' | '.join(row[-1] for row in cursor.fetchall())
+            self.assertIn(f'USING INDEX {index}', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+def place_baskets(baskets):
+    """
+    Оформляет корзины baskets ([(id пользователя, id корзины)]) по очереди из потока или отдельного процесса.
+    Возвращает [(id корзины, оформлена ли)]
+    """
+    results = []
+    try:
+        for user_id, basket_id in baskets:
+            try:
+                results.append((basket_id, checkout(user_id, basket_id, None)))
+            except InsufficientStock:
+                results.append((basket_id, False))
+    finally:
+        connection.close()
+    return results
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReservationConcurrencyTests(TransactionTestCase):
+    """
+    Одна позиция, которой хватает не всем, оформляется из потоков и процессов одновременно.
+    В SQLite пишущие транзакции идут по одной, и тест проверяет, что ожидание блокировки не превращается в ошибки;
+    на PostgreSQL он проверяет и блокировки строк предложений
+    """
+    STOCK = 40
+    THREADS = 8
+    PROCESSES = 4
+    BASKETS = 6
+
+    def setUp(self):
+        shop = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        PriceImporter(shop).run('Связной', [{'id': 224, 'name': 'Смартфоны'}], make_goods(2))
+        self.hot, self.other = ProductsInfo.objects.order_by('external_id').values_list('id', flat=True)
+        ProductsInfo.objects.filter(id=self.hot).update(quantity=self.STOCK)
+        ProductsInfo.objects.filter(id=self.other).update(quantity=1000)
+        buyer = Users.objects.create_user(email='buyer@example.com', password='password', type='buyer')
+
+        # в каждой корзине 1-3 единицы ходового товара и ещё один товар, добавленные в разном порядке
+        self.wanted = {}
+        for index in range((self.THREADS + self.PROCESSES) * self.BASKETS):
+            basket = Orders.objects.create(user_id=buyer, status='basket')
+            lines = [(self.hot, index % 3 + 1), (self.other, 1)]
+            for info_id, quantity in lines[::1 if index % 2 else -1]:
+                OrderItems.objects.create(order_id=basket, product_info_id_id=info_id, quantity=quantity)
+            self.wanted[basket.id] = index % 3 + 1
+        update_order_totals(list(self.wanted))
+        self.baskets = [(buyer.id, basket_id) for basket_id in self.wanted]
+
+    def test_no_oversell_under_contention(self):
+        baskets = self.baskets
+        chunks = [baskets[start::self.THREADS + self.PROCESSES] for start in range(self.THREADS + self.PROCESSES)]
+        results, errors = [], []
+
+        def worker(chunk):
+            try:
+                results.extend(place_baskets(chunk))
+            except Exception as error:
+                errors.append(error)
+
+        # процессы создаются до потоков: fork при работающих потоках небезопасен
+        with get_context('fork').Pool(self.PROCESSES, initializer=connections.close_all) as pool:
+            processes = pool.map_async(place_baskets, chunks[self.THREADS:])
+            threads = [Thread(target=worker, args=(chunk,)) for chunk in chunks[:self.THREADS]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for chunk in processes.get(timeout=120):
+                results.extend(chunk)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), len(baskets))
+        placed = [basket_id for basket_id, is_placed in results if is_placed]
+        self.assertTrue(placed)
+        self.assertEqual(set(Orders.objects.filter(status='new').values_list('id', flat=True)), set(placed))
+
+        # списано ровно столько, сколько в оформленных заказах, и не больше остатка
+        hot, other = (ProductsInfo.objects.get(id=info_id).quantity for info_id in (self.hot, self.other))
+        self.assertEqual(hot, self.STOCK - sum(self.wanted[basket_id] for basket_id in placed))
+        self.assertEqual(other, 1000 - len(placed))
+        # корзины отклонялись, только когда остатка не хватало и на самую маленькую
+        self.assertLess(hot, 3)
+        self.assertEqual(CatalogChanges.objects.filter(product_info_id=self.hot).count(),
+                         len(placed) + 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FastSerializerTests(TestCase):
+
+    def setUp(self):
+        shop = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        with open(SHOP1_YAML, 'rb') as file:
+            import_price(shop, file)
+        # параметр без имени сериализуется как null
+        ProductParameter.objects.filter(id=ProductParameter.objects.order_by('id')[0].id).update(parameter_id=None)
+        self.buyer = Users.objects.create_user(email='buyer@example.com', password='password', type='buyer')
+
+    def test_offers_match_drf(self):
+        queryset = ProductsInfo.objects.order_by('id')
+        self.assertEqual(serialize_offers(queryset), ProductInfoSerializer(queryset, many=True).data)
+        with self.assertNumQueries(2):
+            serialize_offers(queryset)
+
+    def test_orders_match_drf(self):
+        create_orders(self.buyer, 3)
+        Orders.objects.create(user_id=self.buyer, status='basket')
+        Orders.objects.filter(id=Orders.objects.order_by('id')[0].id).update(contact=None)
+        self.assertEqual(Contacts.objects.count(), 1)
+
+        queryset = Orders.objects.filter(user_id=self.buyer)
+        self.assertEqual(serialize_orders(queryset), OrdersWithShopsSerializer(queryset, many=True).data)
+
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        response = client.get('/api/v1/order').json()
+        self.assertEqual(len(response), 3)
+        self.assertEqual(len(response[0]['ordered_items']), 3)
+
+    def test_sparse_fields(self):
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/v1/products', {'fields': 'id,product_id,price', 'include': 'product'}).json()
+        self.assertEqual(set(response['results'][0]), {'id', 'product_id', 'price'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('product_parameter', queries[0]['sql'])
+
+        response = client.get('/api/v1/products', {'include': 'parameters', 'ordering': 'price', 'page_size': 2}).json()
+        self.assertNotIn('product_id', response['results'][0])
+        self.assertIn('product_parameters', response['results'][0])
+        next_page = client.get(response['next']).json()
+        self.assertGreaterEqual(next_page['results'][0]['price'], response['results'][1]['price'])
+
+        response = client.get('/api/v1/products', {'fields': 'id,name'}).json()
+        self.assertEqual(response, {'Status': False, 'Errors': 'Неизвестные поля: name'})
+
+        create_orders(self.buyer, 2)
+        client.force_authenticate(self.buyer)
+        with self.assertNumQueries(1):
+            response = client.get('/api/v1/order', {'fields': 'status,contact', 'include': ''}).json()
+        self.assertEqual(response, [{'status': 'new'}] * 2)
+        response = client.get('/api/v1/order', {'include': 'contact'}).json()
+        self.assertEqual(set(response[0]), {'status', 'date', 'total_sum', 'items_count', 'contact'})
+
+    def test_benchmark(self):
+        create_orders(self.buyer, 5)
+        results = run_serialization_benchmark(repeat=1)
+        self.assertEqual([(case['case'], case['rows'], case['identical']) for case in results],
+                         [('offers', 4, True), ('orders', 5, True)])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RenderingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = Users.objects.create_user(email='shop@example.com', password='password', type='shop')
+        PriceImporter(user).run('Связной', [{'id': 224, 'name': 'Смартфоны'}], make_goods(30))
+        self.client = APIClient()
+
+    def test_dumps_matches_drf(self):
+        data = {'name': 'Смартфон \u2028 "XR"', 'price': Decimal('1.50'), 'items': [1, None, True, 2.5],
+                'date': datetime(2022, 4, 26, 0, 52, 30, 123456, tzinfo=timezone.utc), 'facets': {'Цвет': {}}}
+        self.assertEqual(dumps(data), JSONRenderer().render(data))
+
+    def test_gzip_above_threshold(self):
+        plain = self.client.get('/api/v1/products')
+        response = self.client.get('/api/v1/products', HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response = self.client.get('/api/v1/products', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        # короткие ответы не сжимаются
+        response = self.client.get('/api/v1/shops', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get('/api/v1/products', HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @skipIf(brotli is None, 'brotli не установлен')
+    def test_brotli(self):
+        plain = self.client.get('/api/v1/products')
+        response = self.client.get('/api/v1/products', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+
+class FairQueueTests(SimpleTestCase):
+
+    def test_round_robin_one_job_per_shop(self):
+        queue = FairQueue()
+        for index in range(3):
+            queue.put('big', f'big-{index}')
+        queue.put('small', 'small-0')
+
+        self.assertEqual(queue.get(), ('big', 'big-0'))
+        self.assertEqual(queue.get(), ('small', 'small-0'))
+        # следующая задача большого магазина ждёт завершения текущей
+        self.assertIsNone(queue.get())
+        queue.done('big')
+        self.assertEqual(queue.get(), ('big', 'big-1'))
+        self.assertFalse(queue.finished())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ImportPricesCommandTests(TransactionTestCase):
+
+    def test_batch_import(self):
+        emails = ['shop1@example.com', 'shop2@example.com']
+        for email in emails:
+            Users.objects.create_user(email=email, password='password', type='shop')
+
+        with PriceServer() as server:
+            server.files['shop2.yaml'] = server.files['shop1.yaml'].replace('Связной'.encode(), 'Евросеть'.encode())
+            with NamedTemporaryFile('w', suffix='.txt') as batch:
+                batch.write(f'{emails[0]} {server.url("shop1.yaml")}\n  \n{emails[0]}\n'
+                            f'{emails[1]} {server.url("shop2.yaml")} diff\n{emails[1]} {server.url("shop2.yaml")}\n'
+                            f'unknown@example.com {server.url("shop3.yaml")}\n')
+                batch.flush()
+                stderr = StringIO()
+                call_command('import_prices', file=batch.name, concurrency=2, stdout=StringIO(), stderr=stderr)
+
+        self.assertEqual([line.split(',')[0] for line in stderr.getvalue().splitlines()],
+                         ['Строка 3 пропущена', 'Строка 4 пропущена',
+                          f'{server.url("shop3.yaml")}: Ошибка: поставщик unknown@example.com не найден'])
+        self.assertEqual(list(ImportJobs.objects.values_list('phase', flat=True)), ['done', 'done'])
+        self.assertEqual(Shops.objects.count(), 2)
+        self.assertEqual(ProductsInfo.objects.count(), 8)
+
+    def test_downloads_run_in_parallel(self):
+        # оба скачивания должны идти одновременно, иначе первое не дождётся второго у барьера
+        barrier = Barrier(2, timeout=5)
+
+        def fetch(*args, **kwargs):
+            barrier.wait()
+            return fetch_price(*args, **kwargs)
+
+        with PriceServer() as server, patch('backend.importer.fetch_price', side_effect=fetch):
+            server.files['shop2.yaml'] = server.files['shop1.yaml'].replace('Связной'.encode(), 'Евросеть'.encode())
+            scheduler = ImportScheduler(2)
+            for index in (1, 2):
+                user = Users.objects.create_user(email=f'shop{index}@example.com', password='password', type='shop')
+                scheduler.submit(ImportJobs.objects.create(user_id=user, url=server.url(f'shop{index}.yaml')))
+            scheduler.run()
+
+        self.assertEqual(list(ImportJobs.objects.values_list('phase', flat=True)), ['done', 'done'])
+        self.assertEqual(ProductsInfo.objects.count(), 8)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ImportBenchmarkTests(TestCase):
+
+    def test_generated_price_list_imports(self):
+        user = Users.objects.create_user(email='bench@example.com', password='password', type='shop')
+        with NamedTemporaryFile(suffix='.yaml') as file:
+            generate_price_list(file, 300, categories=3, parameters=5)
+            file.flush()
+            file.seek(0)
+            price_list = PriceList(file)
+            goods = list(price_list.goods())
+            result = run_import_benchmark(user, file.name, 300)
+
+        self.assertEqual(len(price_list.categories), 3)
+        self.assertEqual(len(goods), 300)
+        self.assertEqual(len(goods[0]['parameters']), 5)
+        self.assertEqual(result['goods'], 300)
+        self.assertGreater(result['queries'], 0)
+        self.assertEqual(ProductParameter.objects.count(), 300 * 5)
@@ -3,7 +3,8 @@ from django.urls import path
 from . import views
 
 from .views import RegisterUsers, ConfirmAccount, LoginAccount, AccountDetails, CategoriesView, ShopsView, \
-    PartnerUpdate, PartnerState, PartnerOrders, ContactsView, ProductInfoView, BasketView, OrderView
+    PartnerUpdate, PartnerUpdateStatus, PartnerExport, PartnerState, PartnerOrders, ContactsView, ProductInfoView, \
+    ProductSearchView, ProductAutocompleteView, ProductChangesView, BasketView, OrderView
 from django_rest_passwordreset.views import reset_password_request_token, reset_password_confirm
 
 
@@ -26,11 +27,19 @@ urlpatterns = [
 
     # Загрузка прайса
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/update/<int:job_id>', PartnerUpdateStatus.as_view(), name='partner-update-status'),
+    # выгрузка прайса, ?format=yaml|json|ndjson
+    path('partner/export', PartnerExport.as_view(), name='partner-export'),
 
     path('partner/state', PartnerState.as_view(), name='partner-state'),
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
 
     path('products', ProductInfoView.as_view(), name='shops'),
+    # полнотекстовый поиск ?q=&limit= и подсказки ?q=
+    path('products/search', ProductSearchView.as_view(), name='product-search'),
+    path('products/autocomplete', ProductAutocompleteView.as_view(), name='product-autocomplete'),
+    # изменения каталога после версии, ?since=<version>&limit=
+    path('products/changes', ProductChangesView.as_view(), name='product-changes'),
     path('basket', BasketView.as_view(), name='basket'),
     path('order', OrderView.as_view(), name='order'),
 ]
@@ -1,11 +1,12 @@
+from functools import partial
+
 from django.contrib.auth import authenticate
+from django.core.files import File
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
-from django.http import JsonResponse
+from django.http import HttpResponse
 from django.shortcuts import render
-from django.db.models import Q, Sum, F
-from django.db import IntegrityError
-from requests import get
+from django.db import transaction
 
 from rest_framework.views import APIView
 from rest_framework.generics import GenericAPIView, ListAPIView
@@ -13,23 +14,43 @@ from rest_framework.generics import GenericAPIView, ListAPIView
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.response import Response
 
-from yaml import load as load_yaml, Loader
-
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.password_validation import validate_password
 
-from .models import ConfirmEmailToken, Categories, Shops, ProductsInfo, Products, Parameters, ProductParameter, \
-    Users, Orders, Contacts, OrderItems
+from .models import ConfirmEmailToken, Categories, Shops, ProductsInfo, Orders, Contacts, OrderItems, ShopOrders, \
+    ImportJobs
 
 from .send_email import new_user_registered, new_order
 
+from .tasks import do_import, apply_job_progress
+from .price_list import PriceImportError
+from .sources import spool, check_encoding, detect_encoding, CHUNK_SIZE
+from .exporter import export_response, EXPORT_FORMATS
+from .pagination import KeysetPagination, ShopOrdersPagination, PaginationError
+from .cache import cache_catalog_response
+from .filters import parse_filters, filter_offers, count_facets, CatalogFilterError
+from .catalog_index import get_catalog_index
+from .search import get_search_backend, SEARCH_LIMIT, SEARCH_MAX_LIMIT, SUGGEST_LIMIT
+from .changes import get_changes, log_shop_changes, CHANGES_PAGE_SIZE, CHANGES_MAX_PAGE_SIZE
+from .renderers import JsonResponse
+from .basket import add_items, update_order_totals
+from .reservations import checkout, cancel_order, InsufficientStock
+from .bulk import parse_ids, update_values, delete_ids
+from .fast_serializers import serialize_offers, serialize_orders, serialize_shop_orders, offer_columns, \
+    shop_order_columns, requested_fields, FieldsError, OFFER, OFFER_INCLUDES, ORDER, ORDER_INCLUDES, SHOP_ORDER, \
+    SHOP_ORDER_INCLUDES
+
 from .serializers import UsersSerializer, LoginSerializer, LoginTokenResponseSerializer, CategoriesSerializer, \
-    ShopsSerializer, OrdersSerializer, ContactsSerializer, ProductInfoSerializer, OrderItemSerializer
+    ShopsSerializer, ContactsSerializer, ImportJobSerializer
 
-import sys
 # sys.path.insert(1, 'E:\\YakoBro\\Proekt_Python\\Django_full_project(final-diplom)\\orders')
 # from celery_sender import new_user_registered
 
+# типы тела запроса, в которых прайс передаётся как есть, без multipart
+RAW_PRICE_CONTENT_TYPES = ('application/x-yaml', 'application/yaml', 'text/yaml', 'text/x-yaml',
+                           'application/octet-stream', 'application/gzip', 'application/zstd')
+PRICE_FILE_SUFFIXES = {'gzip': '.gz', 'x-gzip': '.gz', 'zstd': '.zst'}
+
 
 def home(request):
     return render(request, 'backend/home.html')
@@ -177,6 +198,10 @@ class CategoriesView(ListAPIView):
     queryset = Categories.objects.all()
     serializer_class = CategoriesSerializer
 
+    @cache_catalog_response()
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class ShopsView(ListAPIView):
     """
@@ -185,10 +210,16 @@ class ShopsView(ListAPIView):
     queryset = Shops.objects.filter(status_work=True)
     serializer_class = ShopsSerializer
 
+    @cache_catalog_response()
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class PartnerUpdate(APIView):
     """
-    Класс для обновления прайса от поставщика
+    Класс для обновления прайса от поставщика.
+    Прайс передаётся ссылкой (url), файлом в multipart (file) или телом запроса с типом из
+    RAW_PRICE_CONTENT_TYPES; сжатие gzip/zstd указывается в Content-Encoding или определяется по файлу
     """
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -197,6 +228,21 @@ class PartnerUpdate(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
+        if request.content_type.split(';')[0].strip() in RAW_PRICE_CONTENT_TYPES:
+            # прайс в теле запроса: request.data не трогаем, тело копируется во временный файл кусками
+            if request.stream is None:
+                return JsonResponse({'Status': False, 'Errors': 'Пустое тело запроса'})
+            file, _ = spool(iter(partial(request.stream.read, CHUNK_SIZE), b''))
+            content_encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+            return self.enqueue_file(request, file, content_encoding or detect_encoding(file),
+                                     request.query_params.get('mode') == 'diff')
+
+        # mode=diff - применить только изменения прайса вместо полной перезагрузки
+        diff = request.data.get('mode') == 'diff'
+        upload = request.FILES.get('file')
+        if upload:
+            return self.enqueue_file(request, upload, detect_encoding(upload), diff)
+
         url = request.data.get('url')
         if url:
             validate_url = URLValidator()
@@ -205,37 +251,71 @@ class PartnerUpdate(APIView):
             except ValidationError as e:
                 return JsonResponse({'Status': False, 'Error': str(e)})
             else:
-                stream = get(url).content
-
-                data = load_yaml(stream, Loader=Loader)
-
-                shop, _ = Shops.objects.get_or_create(name=data['shop'], user_id=Users.objects.get(id=request.user.id))
-                for category in data['categories']:
-                    category_object, _ = Categories.objects.get_or_create(id=category['id'], name=category['name'])
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductsInfo.objects.filter(shop_id=shop.id).delete()
-                for item in data['goods']:
-                    product, _ = Products.objects.get_or_create(name=item['name'],
-                                                                category_id=Categories.objects.get(id=item['category']))
-
-                    product_info = ProductsInfo.objects.create(product_id=Products.objects.get(id=product.id),
-                                                               external_id=item['id'],
-                                                               # model=item['model'],
-                                                               price=item['price'],
-                                                               price_rrc=item['price_rrc'],
-                                                               quantity=item['quantity'],
-                                                               shop_id=Shops.objects.get(id=shop.id))
-                    for name, value in item['parameters'].items():
-                        parameter_object, _ = Parameters.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(product_info_id=ProductsInfo.objects.get(id=product_info.id),
-                                                        parameter_id=Parameters.objects.get(id=parameter_object.id),
-                                                        value=value)
-
-                return JsonResponse({'Status': True})
+                return self.enqueue(ImportJobs.objects.create(user_id=request.user, url=url, diff=diff))
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
+    def enqueue_file(self, request, file, content_encoding, diff):
+        try:
+            check_encoding(content_encoding)
+        except PriceImportError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=415)
+
+        job = ImportJobs(user_id=request.user, diff=diff, content_encoding=content_encoding)
+        job.file.save(f'price.yaml{PRICE_FILE_SUFFIXES.get(content_encoding, "")}', File(file))
+        return self.enqueue(job)
+
+    @staticmethod
+    def enqueue(job):
+        # импорт выполняется в Celery, ход задачи можно получить по partner/update/<job_id>
+        transaction.on_commit(lambda: do_import.delay(job.id))
+        return JsonResponse({'Status': True, 'job_id': job.id})
+
+
+class PartnerUpdateStatus(APIView):
+    """
+    Класс для получения хода импорта прайса
+    """
+    def get(self, request, job_id, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Авторизуйтесь'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        job = ImportJobs.objects.filter(id=job_id, user_id=request.user.id).first()
+        if not job:
+            return JsonResponse({'Status': False, 'Errors': 'Задача импорта не найдена'}, status=404)
+
+        serializer = ImportJobSerializer(apply_job_progress(job))
+        return Response(serializer.data)
+
+
+class PartnerExport(APIView):
+    """
+    Класс для выгрузки прайса поставщика в формате yaml (как data/shop1.yaml), json или ndjson
+    """
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= здесь задаёт формат выгрузки, а не рендерер DRF
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Авторизуйтесь'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        export_format = request.query_params.get('format', 'yaml')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'Status': False, 'Errors': f'Неизвестный формат выгрузки: {export_format}'})
+
+        shop = Shops.objects.filter(user_id=request.user.id).first()
+        if not shop:
+            return JsonResponse({'Status': False, 'Errors': 'Магазин не найден'}, status=404)
+
+        return export_response(shop, export_format)
+
 
 class PartnerState(APIView):
     """
@@ -263,7 +343,13 @@ class PartnerState(APIView):
         status_work = request.data.get('status_work')
         if status_work is not None:
             try:
-                Shops.objects.filter(user_id=request.user.id).update(status_work=bool(status_work))
+                with transaction.atomic():
+                    for shop in Shops.objects.select_for_update().filter(user_id=request.user.id).exclude(
+                            status_work=bool(status_work)):
+                        shop.status_work = bool(status_work)
+                        shop.save(update_fields=['status_work'])
+                        # предложения магазина появляются в каталоге или пропадают из него
+                        log_shop_changes(shop.id)
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)})
@@ -282,14 +368,23 @@ class PartnerOrders(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
-        order = Orders.objects.filter(user_id=request.user.id).exclude(status='basket').prefetch_related(
-            'ordered_items__product_info_id_id__product_id_id__category_id_id',
-            'ordered_items__product_info_id_id__product_parameters__parameter_id_id').select_related(
-            'contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info_id_id__price'))).distinct()
-
-        serializer = OrdersSerializer(order, many=True)
-        return Response(serializer.data)
+        try:
+            names = requested_fields(request.query_params, SHOP_ORDER, SHOP_ORDER_INCLUDES)
+        except FieldsError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+
+        # части заказов с товарами магазина, ?status= - только в этом статусе; постранично от новых к старым
+        shop_orders = ShopOrders.objects.filter(shop_id__user_id=request.user.id)
+        if request.query_params.get('status'):
+            shop_orders = shop_orders.filter(status=request.query_params['status'])
+        paginator = ShopOrdersPagination()
+        # столбцы упорядочивания нужны для курсора, даже если их нет в ответе
+        try:
+            page = paginator.paginate_queryset(shop_orders.values(*shop_order_columns(names, 'date')), request,
+                                               view=self)
+        except PaginationError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        return paginator.get_paginated_response(serialize_shop_orders(page, names))
 
 
 class ContactsView(APIView):
@@ -330,15 +425,12 @@ class ContactsView(APIView):
 
         items_sting = request.data.get('id')
         if items_sting:
-            query = Q()
-            objects_deleted = False
-            for contact_id in items_sting:
-                query = query | Q(user_id=request.user.id, id=contact_id)
-                objects_deleted = True
-
-            if objects_deleted:
-                deleted_count = Contacts.objects.filter(query).delete()[0]
-                return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
+            try:
+                contact_ids = parse_ids(items_sting)
+            except ValueError:
+                return JsonResponse({'Status': False, 'Errors': 'Неправильный формат запроса'})
+            deleted_count = delete_ids(Contacts.objects.filter(user_id=request.user.id), contact_ids)
+            return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
     # редактировать контакт
@@ -361,28 +453,95 @@ class ContactsView(APIView):
 
 class ProductInfoView(APIView):
     """
-    Класс для поиска товаров
+    Класс для поиска товаров, выдача постранично по ключу (KeysetPagination).
+    Фильтры описаны в filters.py, facets=1 добавляет в ответ счётчики по значениям параметров,
+    fields= и include= сокращают ответ (fast_serializers.requested_fields)
     """
+    @cache_catalog_response(shop_param='shop_id')
     def get(self, request, *args, **kwargs):
-        query = Q(shop_id__status_work=True)
-        shop_id = request.query_params.get('shop_id')
-        category_id = request.query_params.get('category_id')
-
-        if shop_id:
-            query = query & Q(shop_id=shop_id)
-
-        if category_id:
-            query = query & Q(product_id__category_id=category_id)
+        try:
+            filters = parse_filters(request.query_params)
+            names = requested_fields(request.query_params, OFFER, OFFER_INCLUDES)
+        except (CatalogFilterError, FieldsError) as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+
+        paginator = KeysetPagination()
+        try:
+            fields, position, page_size = paginator.prepare(request)
+        except PaginationError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        # facets=1 - добавить в ответ число предложений по значениям параметров
+        facets = request.query_params.get('facets') in ('1', 'true', 'True')
+
+        # каталог в памяти (настройка CATALOG_INDEX) отдаёт готовый JSON полных предложений без запросов к базе
+        index = None if facets or names is not None else get_catalog_index()
+        if index is not None and request.accepted_renderer.format == 'json':
+            page, paginator.next_position = index.select(filters, fields, position, page_size)
+            return HttpResponse(index.render_page(page, paginator.get_next_link()),
+                                content_type=request.accepted_media_type)
+
+        # фильтры идут только по прямым связям и дубликатов не дают, поэтому без distinct()
+        queryset = filter_offers(ProductsInfo.objects.all(), filters)
+
+        # столбцы упорядочивания нужны для курсора, даже если их нет в ответе
+        page = paginator.paginate_queryset(queryset.values(*offer_columns(names, 'price', 'quantity')), request,
+                                           view=self)
+        response = paginator.get_paginated_response(serialize_offers(page, names))
+        if facets:
+            response.data['facets'] = count_facets(queryset)
+        return response
+
+
+class ProductSearchView(APIView):
+    """
+    Класс для полнотекстового поиска товаров: q - строка запроса, limit - число предложений.
+    Предложения идут по релевантности товара, внутри товара - по цене; fields= и include= - как у products
+    """
+    @cache_catalog_response()
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', SEARCH_LIMIT)), SEARCH_MAX_LIMIT))
+        except ValueError:
+            return JsonResponse({'Status': False, 'Errors': 'Неправильный формат запроса'})
+        try:
+            names = requested_fields(request.query_params, OFFER, OFFER_INCLUDES)
+        except FieldsError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+
+        product_ids = get_search_backend().search(request.query_params.get('q', ''), limit)
+        rank = {product_id: position for position, product_id in enumerate(product_ids)}
+        offers = sorted(ProductsInfo.objects.filter(
+            product_id__in=product_ids, shop_id__status_work=True).values(*offer_columns(names, 'product_id', 'price')),
+            key=lambda row: (rank[row['product_id']], row['price'], row['id']))
+        return Response({'results': serialize_offers(offers[:limit], names)})
+
+
+class ProductAutocompleteView(APIView):
+    """
+    Класс для подсказок названий товаров по началу запроса q
+    """
+    @cache_catalog_response()
+    def get(self, request, *args, **kwargs):
+        suggestions = get_search_backend().suggest(request.query_params.get('q', ''), SUGGEST_LIMIT)
+        return Response({'suggestions': suggestions})
 
-        # фильтруем и отбрасываем дубликаты
-        queryset = ProductsInfo.objects.filter(
-            query).select_related(
-            'shop_id', 'product_id__category_id').prefetch_related(
-            'product_parameters__parameter_id').distinct()
 
-        serializer = ProductInfoSerializer(queryset, many=True)
+class ProductChangesView(APIView):
+    """
+    Класс для дельта-синхронизации каталога: предложения, изменившиеся после версии since.
+    Клиент передаёт в since значение version из предыдущего ответа, пока has_more истинно
+    """
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit', CHANGES_PAGE_SIZE))
+        except ValueError:
+            return JsonResponse({'Status': False, 'Errors': 'Неправильный формат запроса'})
+        limit = max(1, min(limit, CHANGES_MAX_PAGE_SIZE))
 
-        return Response(serializer.data)
+        version, has_more, offers, deleted_ids = get_changes(since, limit)
+        return Response({'version': version, 'has_more': has_more,
+                         'upserts': offers, 'deletes': deleted_ids})
 
 
 class BasketView(APIView):
@@ -393,41 +552,26 @@ class BasketView(APIView):
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        basket = Orders.objects.filter(
-            user_id_id=request.user.id, status='basket').prefetch_related(
-            'ordered_items__product_info_id_id__product_id_id__category_id_id',
-            'ordered_items__product_info_id_id__product_parameters__parameter_id_id').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info_id_id__price'))).distinct()
+        try:
+            names = requested_fields(request.query_params, ORDER, ORDER_INCLUDES)
+        except FieldsError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
 
-        serializer = OrdersSerializer(basket, many=True)
-        return Response(serializer.data)
+        basket = Orders.objects.filter(user_id_id=request.user.id, status='basket')
+        return Response(serialize_orders(basket, names))
 
-    # редактировать корзину
+    # добавить товары в корзину: items - [{"product_info_id": ..., "quantity": ...}], ответ - результат по строкам
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
 
-        items_sting = request.data.get('items')
-        if items_sting:
-            basket, _ = Orders.objects.get_or_create(user_id_id=request.user.id, status='basket')
-            objects_created = 0
-
-            for order_item in items_sting:
-                order_item.update({'order_id': basket.id})
-                serializer = OrderItemSerializer(data=order_item)
-                if serializer.is_valid():
-                    try:
-                        serializer.save()
-                    except IntegrityError as error:
-                        return JsonResponse({'Status': False, 'Errors': str(error)})
-                    else:
-                        objects_created += 1
-
-                else:
-
-                    JsonResponse({'Status': False, 'Errors': serializer.errors})
-
-            return JsonResponse({'Status': True, 'Создано объектов': objects_created})
+        items = request.data.get('items')
+        if items and isinstance(items, list):
+            with transaction.atomic():
+                basket, _ = Orders.objects.get_or_create(user_id_id=request.user.id, status='basket')
+                created, updated, results = add_items(basket, items)
+            return JsonResponse({'Status': True, 'Создано объектов': created, 'Обновлено объектов': updated,
+                                 'items': results})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
     # удалить товары из корзины
@@ -437,32 +581,37 @@ class BasketView(APIView):
 
         items_id = request.data.get('items_id')
         if items_id:
-            basket, _ = Orders.objects.get_or_create(user_id_id=request.user.id, status='basket')
-            query = Q()
-            objects_deleted = False
-            for order_item_id in items_id:
-                query = query | Q(order_id=basket.id, id=order_item_id)
-                objects_deleted = True
-
-            if objects_deleted:
-                deleted_count = OrderItems.objects.filter(query).delete()[0]
-                return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
+            try:
+                item_ids = parse_ids(items_id)
+            except ValueError:
+                return JsonResponse({'Status': False, 'Errors': 'Неправильный формат запроса'})
+            with transaction.atomic():
+                deleted_count = delete_ids(OrderItems.objects.filter(
+                    order_id__user_id=request.user.id, order_id__status='basket'), item_ids)
+                update_order_totals(Orders.objects.filter(user_id_id=request.user.id, status='basket').values('id'))
+            return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
-    # добавить позиции в корзину
+    # изменить количество позиций корзины: items - [{"id": ..., "quantity": ...}]
     def put(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
 
         items_sting = request.data.get('items')
-        if items_sting:
-            basket, _ = Orders.objects.get_or_create(user_id_id=request.user.id, status='basket')
-            objects_updated = 0
+        if items_sting and isinstance(items_sting, list):
+            quantities = {}
             for order_item in items_sting:
-                if order_item.get('id') and order_item.get('quantity'):
-                    objects_updated += OrderItems.objects.filter(order_id=basket.id, id=order_item['id']).update(
-                        quantity=order_item['quantity'])
-
+                try:
+                    item_id, quantity = int(order_item['id']), int(order_item['quantity'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if quantity > 0:
+                    quantities[item_id] = quantity
+
+            with transaction.atomic():
+                objects_updated = update_values(OrderItems.objects.filter(
+                    order_id__user_id=request.user.id, order_id__status='basket'), 'quantity', quantities)
+                update_order_totals(Orders.objects.filter(user_id_id=request.user.id, status='basket').values('id'))
             return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
@@ -475,25 +624,38 @@ class OrderView(APIView):
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        order = Orders.objects.filter(
-            user_id_id=request.user.id).exclude(status='basket').prefetch_related(
-            'ordered_items__product_info_id_id__product_id_id__category_id_id',
-            'ordered_items__product_info_id_id__product_parameters__parameter_id_id').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info_id_id__price'))).distinct()
+        try:
+            names = requested_fields(request.query_params, ORDER, ORDER_INCLUDES)
+        except FieldsError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
 
-        serializer = OrdersSerializer(order, many=True)
-        return Response(serializer.data)
+        order = Orders.objects.filter(user_id_id=request.user.id).exclude(status='basket')
+        return Response(serialize_orders(order, names))
 
-    # разместить заказ из корзины
+    # разместить заказ из корзины: цены позиций и сумма заказа фиксируются по текущему прайсу, товар резервируется
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
 
         if {'id', 'contact'}.issubset(request.data):
-            is_updated = Orders.objects.filter(user_id_id=request.user.id, id=request.data['id']).update(
-                contact_id=request.data['contact'], status='new')
-            if is_updated:
-                new_order.send(sender=self.__class__, user_id=request.user.id)
+            try:
+                is_placed = checkout(request.user.id, request.data['id'], request.data['contact'])
+            except InsufficientStock as error:
+                return JsonResponse({'Status': False, 'Errors': 'Недостаточно товара', 'items': error.items})
+            if is_placed:
+                new_order.delay(user_id=request.user.id)
+                return JsonResponse({'Status': True})
+
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+    # отменить заказ: товар возвращается на склад
+    def delete(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if 'id' in request.data:
+            if cancel_order(request.data['id'], user_id_id=request.user.id):
                 return JsonResponse({'Status': True})
+            return JsonResponse({'Status': False, 'Errors': 'Заказ не найден или уже не может быть отменён'})
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
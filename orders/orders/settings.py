@@ -41,6 +41,29 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Europe/Moscow'
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-reservations': {
+        'task': 'backend.tasks.release_expired_reservations',
+        'schedule': 5 * 60,
+    },
+}
+
+# сколько секунд новый заказ держит товар на складе, пока магазин его не подтвердит
+ORDER_RESERVATION_TIMEOUT = 24 * 60 * 60
+
+# число одновременных импортов прайсов в команде import_prices
+IMPORT_CONCURRENCY = 4
+
+# кэш общий для веб-процессов и воркеров Celery (прогресс импорта, ответы каталога)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    }
+}
+
+# выдача products из каталога в памяти процесса (backend/catalog_index.py), занимает память в каждом воркере
+CATALOG_INDEX = False
 
 # Application definition
 
@@ -61,6 +84,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'backend.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -97,6 +121,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # тестовая база в файле, а не в памяти: тесты оформления заказов обращаются к ней из нескольких процессов
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -139,6 +165,9 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# прайсы, загруженные поставщиками напрямую, лежат здесь до окончания импорта
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -150,11 +179,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 40,
 
+    # Browsable API - только для отладки
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-
-    ),
+        'backend.renderers.FastJSONRenderer',
+    ) + (('rest_framework.renderers.BrowsableAPIRenderer',) if DEBUG else ()),
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
         # 'rest_framework.authentication.SessionAuthentication',